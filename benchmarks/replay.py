@@ -0,0 +1,48 @@
+"""
+Replay a traffic capture of crossengage.capture.TrafficRecorder against the local stub server.
+
+Usage:
+
+ python -m benchmarks.replay capture.jsonl --speed 4 --latency 0.005
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import sys
+
+import requests
+
+from benchmarks.stub_server import StubServer
+from crossengage.capture import Replayer
+from crossengage.client import CrossengageClient
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='JSON lines capture, gzip compressed when it ends with .gz')
+    parser.add_argument('--speed', type=float, default=1.0, help='pace factor, 0 sends as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    with StubServer(latency=options.latency, error_rate=options.error_rate, throttle_rate=options.throttle_rate,
+                    capacity=options.capacity) as server:
+        client = CrossengageClient(client_token='REPLAY_TOKEN', session=requests.Session())
+        client.API_URL = server.url
+        result = Replayer(client, speed=options.speed or None, concurrency=options.concurrency).replay(
+            options.capture)
+    print('sent {0} in {1:.3f}s, {2:.1f} req/s, p50 {3:.3f} ms, p99 {4:.3f} ms, max lag {5:.3f} ms'.format(
+        result.sent, result.seconds, result.sent / result.seconds if result.seconds else 0.0,
+        result.percentile(50) * 1000, result.percentile(99) * 1000, result.max_lag * 1000))
+    print('status codes: {0}'.format(dict(result.status_codes)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+"""
+Benchmarks of the Crossengage client against the local stub server.
+
+Usage:
+
+ python -m benchmarks.run                               # run and compare against benchmarks/baseline.json
+ python -m benchmarks.run --save-baseline               # store the numbers of the run scenarios as baseline
+ python -m benchmarks.run --latency 0.005 --error-rate 0.01 --scenario bulk_sync
+ python -m benchmarks.run --slow-rate 0.05 --scenario get_user --scenario get_user_hedged
+ python -m benchmarks.run --latency 0.01 --capacity 8 --session --scenario get_users_adaptive
+ python -m benchmarks.run --processing-time 0.02 --scenario bulk_sync_async --scenario bulk_sync_pipelined
+ python -m benchmarks.run --tls --scenario first_requests_cold --scenario first_requests_warm
+ python -m benchmarks.run --latency 0.01 --threads 16 --http2 --scenario get_users_fan_out   # vs --tls --session
+
+Exits with status 1 when a scenario throughput drops more than --tolerance below its baseline.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from benchmarks.stub_server import StubServer, make_certificate
+from crossengage.bulk import wait_for_tracking
+from crossengage.client import CrossengageClient, logger
+from crossengage.hedging import HedgingMiddleware
+from crossengage.http2 import Http2Session, httpx
+from crossengage.ingest import EventIngestor
+from crossengage.mirror import ProfileMirror
+from crossengage.multiprocess import MultiprocessSync
+from crossengage.pipeline import PipelinedSync
+from crossengage.templates import Field, Template, events_body
+from crossengage.throttle import AdaptiveLimiter
+from crossengage.transport import InMemoryTransport
+from crossengage.warmup import warm_session
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+SCENARIOS = OrderedDict()
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def make_users(count, offset=0):
+    return [{
+        'id': str(offset + i),
+        'email': 'user{0}@example.com'.format(offset + i),
+        'businessUnit': 'de',
+        'firstName': 'First name',
+        'lastName': 'Last name',
+        'createdAt': '2015-10-02T08:23:53Z',
+    } for i in range(count)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@scenario
+def get_user(client, options):
+    """ One v2 GET per operation """
+    return options.iterations, [lambda i=i: client.get_user({'id': str(i)}) for i in range(options.iterations)]
+
+
+@scenario
+def get_user_hedged(client, options):
+    """ get_user with a HedgingMiddleware, compare its p99 with get_user under --slow-rate """
+    client = clone(client)
+    client.middleware = [HedgingMiddleware(percentile=90, budget=0.1, min_samples=10)]
+    return get_user(client, options)
+
+
+@scenario
+def xng_id_lookup_mirrored(client, options):
+    """ xngId of 20 users looked up through a ProfileMirror, get_user only on the first lookup of each """
+    client = clone(client)
+    mirror = ProfileMirror(max_staleness=60)
+    client.middleware = [mirror]
+    return options.iterations, [lambda i=i: mirror.xng_id_of(str(i % 20), client=client)
+                                for i in range(options.iterations)]
+
+
+@scenario
+def update_user(client, options):
+    """ One v1 PUT per operation """
+    users = make_users(options.iterations)
+    return len(users), [lambda user=user: client.update_user(user) for user in users]
+
+
+@scenario
+def send_events(client, options):
+    """ One POST of 50 events per operation, ops counted as events """
+    events = [{'event': 'Order', 'properties': {'sku': i}} for i in range(50)]
+    calls = [lambda i=i: client.send_events(events, user_id=str(i), business_unit='de')
+             for i in range(options.iterations)]
+    return options.iterations * len(events), calls
+
+
+@scenario
+def bulk_sync(client, options):
+    """ batch_process of 1000-user chunks, ops counted as users """
+    chunks = [make_users(1000, offset=i * 1000) for i in range(options.chunks)]
+    return 1000 * options.chunks, [lambda chunk=chunk: client.batch_process(update_list=chunk) for chunk in chunks]
+
+
+@scenario
+def bulk_sync_async(client, options):
+    """ batch_process_async + track_user_task of 1000-user chunks, ops counted as users """
+    chunks = [make_users(1000, offset=i * 1000) for i in range(options.chunks)]
+
+    def submit(chunk):
+        status_code, body = client.batch_process_async(update_list=chunk)
+        wait_for_tracking(client, body['trackingId'], poll_interval=0.01)
+    return 1000 * options.chunks, [lambda chunk=chunk: submit(chunk) for chunk in chunks]
+
+
+@scenario
+def bulk_sync_pipelined(client, options):
+    """ The chunks of bulk_sync_async through a PipelinedSync, compare both under --processing-time """
+    sync = PipelinedSync(client, window=options.threads, poll_interval=0.01)
+
+    def submit():
+        result = sync.run(make_users(1000 * options.chunks))
+        print('{0:<24} {1:>12}'.format('pipeline window', result.window))
+    return 1000 * options.chunks, [submit]
+
+
+@scenario
+def bulk_sync_threaded(client, options):
+    """ batch_process of 1000-user chunks from --threads threads, one call per thread batch """
+    chunks = [make_users(1000, offset=i * 1000) for i in range(options.chunks * options.threads)]
+    clients = [clone(client) for _ in range(options.threads)]
+
+    def submit(group):
+        threads = [threading.Thread(target=c.batch_process, kwargs={'update_list': chunk})
+                   for c, chunk in zip(clients, group)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    groups = [chunks[i:i + options.threads] for i in range(0, len(chunks), options.threads)]
+    return len(chunks) * 1000, [lambda group=group: submit(group) for group in groups]
+
+
+@scenario
+def bulk_sync_multiprocess(client, options):
+    """ MultiprocessSync of a JSON lines file with --threads processes, ops counted as users """
+    users_file = tempfile.NamedTemporaryFile(mode='w', suffix='.jsonl', delete=False)
+    with users_file:
+        for user in make_users(1000 * options.chunks * options.threads):
+            users_file.write(json.dumps(user) + '\n')
+    sync = MultiprocessSync(client.client_token, processes=options.threads, api_url=client.API_URL)
+
+    def submit():
+        try:
+            sync.sync_file(users_file.name)
+        finally:
+            os.remove(users_file.name)
+    return 1000 * options.chunks * options.threads, [submit]
+
+
+@scenario
+def get_users_fan_out(client, options):
+    """ get_users with --threads requests in flight, ops counted as users """
+    ids = [str(i) for i in range(options.iterations)]
+    return len(ids), [lambda: list(client.get_users(ids, concurrency=options.threads))]
+
+
+@scenario
+def get_users_adaptive(client, options):
+    """ get_users with an AdaptiveLimiter of up to 64 requests in flight, ops counted as users """
+    ids = [str(i) for i in range(options.iterations)]
+    limiter = AdaptiveLimiter(initial_limit=options.threads, max_limit=64)
+
+    def submit():
+        list(client.get_users(ids, concurrency=64, limiter=limiter))
+        print('{0:<24} {1:>12}'.format('adaptive limit', limiter.limit))
+    return len(ids), [submit]
+
+
+@scenario
+def ingest_events(client, options):
+    """ EventIngestor replay of --threads partitions of --iterations events of 20 users, ops counted as events """
+    source = tempfile.mkdtemp()
+    for partition in range(options.threads):
+        with open(os.path.join(source, 'p{0}'.format(partition)), 'w') as partition_file:
+            for i in range(options.iterations):
+                partition_file.write(json.dumps({'id': str(i % 20), 'event': {'event': 'Order', 'properties': {
+                    'sku': i}}}) + '\n')
+
+    def submit():
+        # fresh offsets, every call replays everything
+        EventIngestor(client, tempfile.mkdtemp(), concurrency=options.threads).run(source)
+    return options.iterations * options.threads, [submit]
+
+
+@scenario
+def encode_events_json(client, options):
+    """ send_events bodies of 50 events built as dicts and encoded with json.dumps, ops counted as events """
+    def encode(i):
+        events = [{'event': 'Order', 'properties': {'sku': 'SKU-{0}'.format(n), 'price': n, 'currency': 'EUR',
+                                                    'channel': 'web'}} for n in range(50)]
+        return json.dumps({'events': events, 'id': str(i), 'businessUnit': 'de'})
+    return options.iterations * 50, [lambda i=i: encode(i) for i in range(options.iterations)]
+
+
+@scenario
+def encode_events_template(client, options):
+    """ The bodies of encode_events_json rendered from a Template, ops counted as events """
+    order = Template({'event': 'Order', 'properties': {
+        'sku': Field('sku'), 'price': Field('price'), 'currency': 'EUR', 'channel': 'web'}})
+
+    def encode(i):
+        events = [order.render(sku='SKU-{0}'.format(n), price=n) for n in range(50)]
+        return events_body(events, user_id=str(i), business_unit='de')
+    return options.iterations * 50, [lambda i=i: encode(i) for i in range(options.iterations)]
+
+
+@scenario
+def client_overhead(client, options):
+    """ update_user against canned responses with debug logging disabled, measures the client itself """
+    client = clone(client)
+    client.transport = InMemoryTransport(handler=lambda request: (200, {'success': True}), record=False)
+    users = make_users(options.iterations * 10)
+    return len(users), [lambda user=user: client.update_user(user) for user in users]
+
+
+def fresh_client(client, options, n_connections=0):
+    """ Client of a newly started job, with its own session and optionally warmed up connections """
+    session = warm_session(pool_maxsize=options.threads)
+    session.trust_env = False
+    session.verify = options.certfile or True
+    other = CrossengageClient(client_token=client.client_token, session=session)
+    other.API_URL = client.API_URL
+    if n_connections:
+        other.warmup(n_connections)
+    return other
+
+
+def first_requests(client, threads):
+    users = [{'id': str(i)} for i in range(threads)]
+    workers = [threading.Thread(target=client.get_user, args=(user,)) for user in users]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    client.requests.close()
+
+
+@scenario
+def first_requests_cold(client, options):
+    """ --threads concurrent GETs of a fresh client, connections opened on demand, ops counted as requests """
+    return options.chunks * options.threads, [
+        lambda: first_requests(fresh_client(client, options), options.threads) for _ in range(options.chunks)]
+
+
+@scenario
+def first_requests_warm(client, options):
+    """ --threads concurrent GETs of a fresh client warmed up before the clock starts, ops counted as requests """
+    clients = iter([fresh_client(client, options, options.threads)
+                    for _ in range(options.chunks + options.warmup)])
+    return options.chunks * options.threads, [
+        lambda: first_requests(next(clients), options.threads) for _ in range(options.chunks)]
+
+
+def clone(client):
+    other = CrossengageClient(client_token=client.client_token, tracer=client.tracer)
+    other.API_URL = client.API_URL
+    other.requests = client.requests
+    return other
+
+
+def run_scenario(name, client, options):
+    ops, calls = SCENARIOS[name](client, options)
+    # single call scenarios are not warmed up, the call itself may not be repeatable
+    for call in calls[:options.warmup] if len(calls) > 1 else []:
+        call()
+    latencies = []
+    started = time.time()
+    for call in calls:
+        call_started = time.time()
+        call()
+        latencies.append(time.time() - call_started)
+    elapsed = time.time() - started
+    return OrderedDict([
+        ('ops', ops),
+        ('seconds', round(elapsed, 4)),
+        ('ops_per_sec', round(ops / elapsed, 1) if elapsed else 0.0),
+        ('p50_ms', round(percentile(latencies, 50) * 1000, 3)),
+        ('p99_ms', round(percentile(latencies, 99) * 1000, 3)),
+    ])
+
+
+def compare(results, baseline, tolerance):
+    """ Names of scenarios whose throughput dropped more than tolerance below the baseline """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected and result['ops_per_sec'] < expected['ops_per_sec'] * (1 - tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return OrderedDict()
+    with open(path) as baseline_file:
+        return json.load(baseline_file, object_pairs_hook=OrderedDict)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='default: all')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--chunks', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, help='max requests the stub serves at once, 429 above')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of requests answered after --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=0.1)
+    parser.add_argument('--processing-time', type=float, default=0.0,
+                        help='seconds the stub takes to process each batch_process_async batch, one at a time')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--session', action='store_true', help='reuse connections through a requests.Session')
+    parser.add_argument('--http2', action='store_true', help='send through crossengage.http2.Http2Session to the stub '
+                        'serving HTTP/2 over https, compare connections and p99 with --tls --session')
+    parser.add_argument('--tls', action='store_true', help='serve the stub over https with a self-signed certificate')
+    parser.add_argument('--url', help='benchmark against this API url instead of the local stub')
+    parser.add_argument('--report', help='write the JSON report to this path')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.3)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logger.setLevel(logging.INFO)
+
+    results = OrderedDict()
+    # HTTP/2 is negotiated through TLS
+    options.certfile = make_certificate(tempfile.mkdtemp()) if options.tls or options.http2 else None
+    with StubServer(latency=options.latency, error_rate=options.error_rate,
+                    throttle_rate=options.throttle_rate, seed=options.seed, certfile=options.certfile,
+                    slow_rate=options.slow_rate, slow_latency=options.slow_latency,
+                    capacity=options.capacity, processing_time=options.processing_time,
+                    http2=options.http2) as server:
+        client = CrossengageClient(client_token='BENCHMARK_TOKEN')
+        client.API_URL = options.url or server.url
+        if options.http2:
+            verify = True if options.url else options.certfile
+            client.requests = Http2Session(client=httpx.Client(
+                http2=True, verify=verify, trust_env=False, limits=httpx.Limits(max_connections=options.threads)))
+        elif options.session:
+            client.requests = requests.Session()
+        if options.certfile and not options.http2:
+            client.requests = requests.Session() if client.requests is requests else client.requests
+            client.requests.trust_env = False
+            client.requests.verify = options.certfile
+        for name in options.scenario or SCENARIOS:
+            results[name] = run_scenario(name, client, options)
+            print('{0:<24} {1[ops_per_sec]:>12} ops/s  p50 {1[p50_ms]:>9} ms  p99 {1[p99_ms]:>9} ms'.format(
+                name, results[name]))
+        served = dict(server.requests, connections=server.connections)
+    print('{0:<24} {1:>12}'.format('stub connections', served['connections']))
+
+    report = OrderedDict([
+        ('python', platform.python_version()),
+        ('options', vars(options)),
+        ('results', results),
+        ('served', served),
+    ])
+    if options.report:
+        with open(options.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if options.save_baseline:
+        baseline = load_baseline(options.baseline)
+        baseline.update(results)
+        with open(options.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+        return 0
+
+    regressions = compare(results, load_baseline(options.baseline), options.tolerance)
+    for name in regressions:
+        print('REGRESSION: {0} below baseline by more than {1:.0%}'.format(name, options.tolerance))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
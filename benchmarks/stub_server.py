@@ -0,0 +1,429 @@
+"""
+Local stand-in for the Crossengage API used by the benchmarks.
+
+Usage:
+
+ with StubServer(latency=0.005, error_rate=0.01, throttle_rate=0.01, seed=1) as server:
+     client = CrossengageClient(client_token='stub')
+     client.API_URL = server.url
+     client.update_user({'id': '1', 'email': 'john.doe@example.com'})
+
+With certfile and http2=True the stub answers HTTP/2 clients (ALPN h2) on one multiplexed connection each.
+"""
+from __future__ import absolute_import
+
+import copy
+import json
+import os
+import random
+import re
+import select
+import socket
+import ssl
+import subprocess
+import threading
+import time
+import uuid
+
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:  # optional dependency
+    h2 = None
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+def _xng_id(user_id):
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, str(user_id)))
+
+
+def _user_results(users):
+    return [{'id': user.get('id'), 'xngId': _xng_id(user.get('id')), 'success': True} for user in users]
+
+
+def _encode(payload):
+    return json.dumps(payload).encode('utf-8') if payload is not None else b''
+
+
+def _send_http2_data(connection, unsent):
+    """ Send the response bodies of unsent as far as the flow control windows allow, ending their streams """
+    for stream_id, data in list(unsent.items()):
+        while True:
+            size = min(len(data), connection.local_flow_control_window(stream_id), connection.max_outbound_frame_size)
+            if size == len(data):
+                connection.send_data(stream_id, data, end_stream=True)
+                del unsent[stream_id]
+                break
+            if size <= 0:
+                unsent[stream_id] = data
+                break
+            connection.send_data(stream_id, data[:size])
+            data = data[size:]
+
+
+def make_certificate(directory):
+    """ Self-signed certificate + key for 127.0.0.1, made with the openssl command line tool """
+    path = os.path.join(directory, 'stub.pem')
+    subprocess.check_call([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+        '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', path, '-out', path,
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return path
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # (method, path regex, handler name)
+    ROUTES = [
+        ('GET', r'^/users/track/(?P<tracking_id>[^/?]+)$', 'track'),
+        ('POST', r'^/users/batch$', 'batch'),
+        ('POST', r'^/users/attributes$', 'add_attribute'),
+        ('GET', r'^/users/attributes$', 'list_attributes'),
+        ('DELETE', r'^/users/attributes/(?P<attribute_id>[^/?]+)$', 'no_content'),
+        ('DELETE', r'^/users/xngId/(?P<xng_id>[^/?]+)$', 'no_content'),
+        ('GET', r'^/users/(?P<user_id>[^/?]+)/optout-status$', 'get_opt_out'),
+        ('PUT', r'^/users/(?P<user_id>[^/?]+)/optout-status$', 'put_opt_out'),
+        ('PUT', r'^/users$', 'accepted'),
+        ('GET', r'^/users/(?P<user_id>[^/?]+)$', 'get_user'),
+        ('PUT', r'^/users/(?P<user_id>[^/?]+)$', 'put_user'),
+        ('DELETE', r'^/users/(?P<user_id>[^/?]+)$', 'delete_user'),
+        ('POST', r'^/events$', 'events'),
+    ]
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        # TLS handshakes run in the handler thread, not in the accepting one
+        if hasattr(self.request, 'do_handshake'):
+            self.request.do_handshake()
+        BaseHTTPRequestHandler.setup(self)
+
+    def handle(self):
+        if hasattr(self.request, 'selected_alpn_protocol') and self.request.selected_alpn_protocol() == 'h2':
+            self._serve_http2()
+        else:
+            BaseHTTPRequestHandler.handle(self)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        self._reply(*self._respond(method, self.path, raw))
+
+    def _respond(self, method, path, raw):
+        """ (status, payload, headers) answering a request, the same over HTTP/1.1 and HTTP/2 """
+        server = self.server
+        path = path.split('?', 1)[0]
+
+        if not server.enter():
+            server.count('over_capacity')
+            return 429, {'errors': 'over capacity'}, {'Retry-After': '1'}
+        try:
+            delay = server.delay()
+            if delay:
+                time.sleep(delay)
+        finally:
+            server.leave()
+
+        route = self._route(method, path)
+        server.count(route[0] if route else 'not_found')
+
+        fault = server.fault()
+        if fault == 429:
+            return 429, {'errors': 'rate limited'}, {'Retry-After': '1'}
+        if fault == 500:
+            return 500, None, None
+
+        if route is None:
+            return 404, None, None
+        name, params = route
+        body = json.loads(raw.decode('utf-8')) if raw else None
+        status, payload = getattr(self, 'handle_' + name)(body, **params)
+        return status, payload, None
+
+    def _route(self, method, path):
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                return name, match.groupdict()
+        return None
+
+    def _reply(self, status, payload, headers=None):
+        data = _encode(payload)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _serve_http2(self):
+        """
+        Serve the streams of an HTTP/2 connection. Every stream is answered in its own thread, like a connection
+        of HTTP/1.1 clients, while this one does all the socket and h2 state work.
+        """
+        sock = self.request
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        connection.initiate_connection()
+        streams = {}  # stream id -> (headers, body chunks) of requests being received
+        unsent = {}  # stream id -> response body waiting for flow control window
+        answered = []  # (stream id, status, payload, headers) from the stream threads
+        lock = threading.Lock()
+        wakeup_read, wakeup_write = socket.socketpair()
+
+        def answer(stream_id, headers, raw):
+            # own copy, the handlers read the headers of their request from self
+            stream = copy.copy(self)
+            stream.headers = headers
+            reply = stream._respond(headers[':method'], headers[':path'], raw)
+            with lock:
+                answered.append((stream_id,) + reply)
+            wakeup_write.send(b'\0')
+
+        try:
+            while True:
+                with lock:
+                    replies, answered[:] = answered[:], []
+                for stream_id, status, payload, headers in replies:
+                    data = _encode(payload)
+                    connection.send_headers(stream_id, [
+                        (':status', str(status)), ('content-type', 'application/json'),
+                        ('content-length', str(len(data))),
+                    ] + [(key.lower(), value) for key, value in (headers or {}).items()])
+                    unsent[stream_id] = data
+                _send_http2_data(connection, unsent)
+                sock.sendall(connection.data_to_send())
+
+                # TLS may hold decrypted bytes select() does not see
+                if not sock.pending():
+                    readable = select.select([sock, wakeup_read], [], [])[0]
+                    if wakeup_read in readable:
+                        wakeup_read.recv(4096)
+                    if sock not in readable:
+                        continue
+                data = sock.recv(65535)
+                if not data:
+                    return
+                for event in connection.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        streams[event.stream_id] = (CaseInsensitiveDict(event.headers), [])
+                    elif isinstance(event, h2.events.DataReceived):
+                        streams[event.stream_id][1].append(event.data)
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, chunks = streams.pop(event.stream_id)
+                        worker = threading.Thread(target=answer, args=(event.stream_id, headers, b''.join(chunks)))
+                        worker.daemon = True
+                        worker.start()
+                    elif isinstance(event, h2.events.StreamReset):
+                        streams.pop(event.stream_id, None)
+                        unsent.pop(event.stream_id, None)
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        sock.sendall(connection.data_to_send())
+                        return
+        except (socket.error, ssl.SSLError):
+            # client went away
+            pass
+        finally:
+            wakeup_read.close()
+            wakeup_write.close()
+
+    @property
+    def _version(self):
+        return self.headers.get('X-XNG-ApiVersion', '1')
+
+    def handle_track(self, body, tracking_id):
+        tracked = self.server.tracked.get(tracking_id)
+        if tracked is None:
+            return 404, None
+        total, started, processed = tracked
+        now = time.time()
+        if now < started:
+            return 200, {'stage': 'QUEUED', 'total': total, 'success': 0, 'error': 0}
+        if now < processed:
+            return 200, {'stage': 'PROCESSING', 'total': total, 'success': 0, 'error': 0}
+        return 200, {'stage': 'PROCESSED', 'total': total, 'success': total, 'error': 0}
+
+    def handle_batch(self, body, **kwargs):
+        if self._version == '2':
+            return 202, {'trackingId': self.server.track(len(body['updated']) + len(body['deleted']))}
+        return 200, {'updated': _user_results(body['updated']), 'deleted': _user_results(body['deleted'])}
+
+    def handle_add_attribute(self, body):
+        return 200, {'id': 1, 'name': body['name'], 'attributeType': body['attributeType'], 'success': True}
+
+    def handle_list_attributes(self, body):
+        return 200, {'attributes': [], 'total': 0}
+
+    def handle_no_content(self, body, **kwargs):
+        return 204, None
+
+    def handle_get_opt_out(self, body, user_id):
+        return 200, {'optOut': False}
+
+    def handle_put_opt_out(self, body, user_id):
+        return 200, {'optOut': body['optOut']}
+
+    def handle_accepted(self, body):
+        return 202, {'trackingId': self.server.track(1)}
+
+    def handle_get_user(self, body, user_id):
+        return 200, {'id': user_id, 'xngId': _xng_id(user_id), 'email': '{0}@example.com'.format(user_id)}
+
+    def handle_put_user(self, body, user_id):
+        return 200, {'id': user_id, 'xngGlobalUserId': _xng_id(user_id), 'success': True}
+
+    def handle_delete_user(self, body, user_id):
+        if self._version == '2':
+            return 202, {'trackingId': self.server.track(1)}
+        return 204, None
+
+    def handle_events(self, body):
+        return 200, {'success': True}
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server answering the Crossengage endpoints with canned responses.
+    :param latency: seconds slept before answering each request
+    :param error_rate: share of requests answered with 500
+    :param throttle_rate: share of requests answered with 429
+    :param slow_rate: share of requests answered after slow_latency instead of latency, a latency tail
+    :param slow_latency: seconds slept before answering a slow request
+    :param processing_time: seconds a tracked batch takes to reach PROCESSED once the ones before it are done,
+                            batches are processed one after the other like by a queue
+    :param capacity: max requests served at once, the ones above are answered with 429, None for unlimited
+    :param seed: seed of the fault injection, same seed gives the same fault sequence
+    :param certfile: PEM file with certificate and key, serves https when given, see make_certificate()
+    :param http2: with certfile, answer clients offering h2 through ALPN over HTTP/2, requires the h2 package
+    """
+    daemon_threads = True
+    # the default backlog of 5 drops connections of concurrent clients, which then retry a second later
+    request_queue_size = 128
+
+    def __init__(self, latency=0.0, error_rate=0.0, throttle_rate=0.0, seed=None, port=0,
+                 handler=StubHandler, certfile=None, slow_rate=0.0, slow_latency=0.1, capacity=None,
+                 processing_time=0.0, http2=False):
+        if http2 and not certfile:
+            raise ValueError('http2 requires a certfile, HTTP/2 is negotiated through TLS ALPN')
+        if http2 and h2 is None:
+            raise ImportError('http2 requires the h2 package: pip install crossengage-client[http2]')
+        HTTPServer.__init__(self, ('127.0.0.1', port), handler)
+        self.ssl_context = None
+        if certfile:
+            self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.ssl_context.load_cert_chain(certfile)
+            if http2:
+                self.ssl_context.set_alpn_protocols(['h2', 'http/1.1'])
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.slow_rate = slow_rate
+        self.capacity = capacity
+        self.processing_time = processing_time
+        self._queue_free = 0.0
+        self.in_flight = 0
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        # own sequence, a latency tail does not change the fault sequence of a seed, seeded apart from it so slow
+        # requests are not the faulted ones
+        self.slow_random = random.Random(None if seed is None else seed + 1)
+        self.requests = {}
+        self.connections = 0
+        self.tracked = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        scheme = 'https' if self.ssl_context else 'http'
+        return '{0}://{1}:{2}'.format(scheme, *self.server_address)
+
+    def get_request(self):
+        sock, address = HTTPServer.get_request(self)
+        with self._lock:
+            self.connections += 1
+        if self.ssl_context is not None:
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+    def count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def enter(self):
+        with self._lock:
+            if self.capacity is not None and self.in_flight >= self.capacity:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def delay(self):
+        if self.slow_rate:
+            with self._lock:
+                if self.slow_random.random() < self.slow_rate:
+                    return self.slow_latency
+        return self.latency
+
+    def fault(self):
+        with self._lock:
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def track(self, total):
+        tracking_id = str(uuid.uuid4())
+        with self._lock:
+            started = max(time.time(), self._queue_free)
+            self._queue_free = started + self.processing_time
+            self.tracked[tracking_id] = (total, started, self._queue_free)
+        return tracking_id
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
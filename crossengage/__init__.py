@@ -0,0 +1,25 @@
+"""
+Crossengage API client.
+
+`import crossengage` does not import any submodule, the names below load their module on first access (python 3.7+),
+and requests is only imported when the client first sends through it.
+"""
+from __future__ import absolute_import
+
+import importlib
+
+_LAZY = {
+    'CrossengageClient': 'crossengage.client',
+    'InMemoryTransport': 'crossengage.transport',
+    'RetryPolicy': 'crossengage.retry',
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
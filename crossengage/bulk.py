@@ -0,0 +1,33 @@
+from __future__ import absolute_import
+
+import time
+
+from crossengage.throttle import monotonic
+
+BATCH_SIZE = 1000
+STAGE_PROCESSED = 'PROCESSED'
+
+
+def chunked(iterable, size):
+    """ Lists of up to size items of iterable, read lazily """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def wait_for_tracking(client, tracking_id, poll_interval=1.0, timeout=300.0):
+    """
+    Poll track_user_task until the batch reached the PROCESSED stage or timeout seconds passed.
+    :return: integer status_code, json dict response of the last poll
+    """
+    deadline = monotonic() + timeout
+    while True:
+        status_code, body = client.track_user_task(tracking_id)
+        if (body or {}).get('stage') == STAGE_PROCESSED or monotonic() >= deadline:
+            return status_code, body
+        time.sleep(poll_interval)
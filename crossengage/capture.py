@@ -0,0 +1,186 @@
+"""
+Capture of the client traffic and its replay, to load test client changes offline with production shapes.
+
+TrafficRecorder is a client middleware writing one JSON line per request: start offset, method, endpoint, headers
+with the token redacted, body size, body, status code and latency. Replayer sends a capture again, through the
+transport of another client, at its original pace or `speed` times faster.
+
+Usage:
+
+ with open('capture.jsonl', 'w') as capture:
+     client = CrossengageClient(client_token='YOUR_TOKEN', middleware=[TrafficRecorder(capture)])
+     ...
+
+ stub_client = CrossengageClient(client_token='REPLAY_TOKEN', session=requests.Session())
+ stub_client.API_URL = 'http://127.0.0.1:8080'
+ result = Replayer(stub_client, speed=4).replay('capture.jsonl')
+ print(result.sent, result.status_codes, result.percentile(99))
+
+or python -m benchmarks.replay capture.jsonl --speed 4 against the local stub server.
+"""
+from __future__ import absolute_import
+
+import gzip
+import io
+import json
+import threading
+import time
+from collections import Counter
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:  # python 2
+    from urlparse import urlsplit
+
+from crossengage.fanout import fan_out
+from crossengage.throttle import monotonic
+from crossengage.transport import Request, RequestsTransport
+from crossengage.utils import redact_headers
+
+AUTH_HEADER = 'X-XNG-AuthToken'
+
+
+def endpoint_of(url):
+    """ Path and query of an url, what a capture keeps of it """
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+class TrafficRecorder(object):
+    """
+    Client middleware writing every request to a JSON lines capture, see crossengage.transport.
+    :param capture: text file like object, e.g. open('capture.jsonl', 'w') or gzip.open('capture.jsonl.gz', 'wt')
+    :param record_bodies: write the request bodies, only their size without
+    :param redact: header names whose values are not written
+    """
+
+    def __init__(self, capture, record_bodies=True, redact=(AUTH_HEADER,)):
+        self.capture = capture
+        self.record_bodies = record_bodies
+        self.redact = redact
+        self.recorded = 0
+        self._started = None
+        self._lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        started = monotonic()
+        status_code = 0
+        try:
+            response = call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            self._write(request, started, monotonic() - started, status_code)
+
+    def _write(self, request, started, latency, status_code):
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        with self._lock:
+            if self._started is None:
+                self._started = started
+            record = json.dumps({
+                't': round(started - self._started, 6),
+                'method': request.method,
+                'endpoint': endpoint_of(request.url),
+                'headers': redact_headers(request.headers, self.redact),
+                'size': len(body) if body is not None else 0,
+                'status': status_code,
+                'latency': round(latency, 6),
+            }, sort_keys=True)
+            if self.record_bodies and body is not None:
+                # the body is json already, spliced in instead of decoded and encoded again
+                record = record[:-1] + ', "body": ' + body + '}'
+            self.capture.write(record + '\n')
+            self.recorded += 1
+
+
+def read_capture(path):
+    """ Records of a capture file, gzip compressed when its name ends with .gz """
+    opener = gzip.open if path.endswith('.gz') else io.open
+    with opener(path, 'rt') as capture:
+        for line in capture:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ReplayResult(object):
+
+    def __init__(self):
+        self.sent = 0
+        self.status_codes = Counter()
+        self.latencies = []
+        # how late requests went out compared to the scaled capture offsets
+        self.max_lag = 0.0
+        self.seconds = 0.0
+
+    def percentile(self, pct):
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+    def __repr__(self):
+        return '<ReplayResult sent={0} seconds={1:.3f} status_codes={2}>'.format(
+            self.sent, self.seconds, dict(self.status_codes))
+
+
+class Replayer(object):
+    """
+    Sends captured requests again through the transport of a client, with its API_URL and token.
+    :param client: CrossengageClient, e.g. pointed at benchmarks.stub_server.StubServer
+    :param speed: pace factor, 1 keeps the captured offsets, 4 is four times faster, None sends without waiting
+    :param concurrency: max requests in flight
+    """
+
+    def __init__(self, client, speed=1.0, concurrency=32):
+        self.client = client
+        self.speed = speed
+        self.concurrency = concurrency
+
+    def _request(self, record):
+        headers = dict(record['headers'])
+        headers[self.client.AUTH_HEADER] = self.client.client_token
+        request = Request(record['method'], self.client.API_URL + record['endpoint'], headers,
+                          payload=record.get('body'))
+        if 'body' in record:
+            request.body = json.dumps(record['body'])
+        elif record.get('size'):
+            # body was not recorded, same size keeps the load shape
+            request.body = ' ' * record['size']
+        return request
+
+    def _scheduled(self, records, started, result):
+        for record in records:
+            if self.speed:
+                wait = started + record['t'] / float(self.speed) - monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                else:
+                    result.max_lag = max(result.max_lag, -wait)
+            yield record
+
+    def replay(self, path_or_records):
+        # type: (object) -> ReplayResult
+        """ Replay a capture file or an iterable of capture records """
+        records = read_capture(path_or_records) if isinstance(path_or_records, str) else path_or_records
+        transport = self.client.transport or RequestsTransport(self.client.requests)
+        result = ReplayResult()
+
+        def send(record):
+            request = self._request(record)
+            sent = monotonic()
+            try:
+                status_code = transport.send(request).status_code
+            except Exception:
+                status_code = 0
+            return status_code, monotonic() - sent
+
+        started = monotonic()
+        for _, (status_code, latency) in fan_out(send, self._scheduled(records, started, result),
+                                                 concurrency=self.concurrency):
+            result.sent += 1
+            result.status_codes[status_code] += 1
+            result.latencies.append(latency)
+        result.seconds = monotonic() - started
+        return result
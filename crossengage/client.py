@@ -2,11 +2,26 @@ from __future__ import absolute_import
 
 import json
 import logging
+import sys
+import threading
 
-import requests
-from requests.exceptions import RequestException
+from crossengage.deadline import DeadlineExceeded, ShedCounter, check_deadline, current_deadline
+from crossengage.fanout import fan_out
+from crossengage.response import LazyBatchResponse, LazyResponse
+from crossengage.retry import RetryPolicy
+from crossengage.scheduling import HIGH, LOW
+from crossengage.templates import events_body
+from crossengage.tracing import NoopTracer, traced
+from crossengage.transport import Request, RequestsTransport
+from crossengage.utils import redact_headers, truncate, update_dict
 
-from crossengage.utils import update_dict
+logger = logging.getLogger(__name__)
+
+
+def _is_request_exception(error):
+    # requests is imported on first use, its exceptions can not be raised before
+    exceptions = sys.modules.get('requests.exceptions')
+    return exceptions is not None and isinstance(error, exceptions.RequestException)
 
 
 class CrossengageClient(object):
@@ -70,16 +85,92 @@ class CrossengageClient(object):
     ATTRIBUTE_ARRAY = 'ARRAY'
     ATTRIBUTE_OBJECT = 'OBJECT'
 
-    def __init__(self, client_token):
+    CHANNEL_MAIL = 'MAIL'
+    CHANNEL_BROWSER_NOTIFICATION = 'BROWSER_NOTIFICATION'
+    CHANNEL_ONSITE_DISPLAY = 'ONSITE_DISPLAY'
+    CHANNEL_EXIT_INTENT = 'EXIT_INTENT'
+    CHANNEL_PUSH_NOTIFICATION = 'PUSH_NOTIFICATION'
+    CHANNEL_DIRECT_MAIL = 'DIRECT_MAIL'
+    CHANNEL_SMS = 'SMS'
+    CHANNELS = (
+        CHANNEL_MAIL, CHANNEL_BROWSER_NOTIFICATION, CHANNEL_ONSITE_DISPLAY, CHANNEL_EXIT_INTENT,
+        CHANNEL_PUSH_NOTIFICATION, CHANNEL_DIRECT_MAIL, CHANNEL_SMS,
+    )
+
+    # max number of body characters written to the debug log
+    LOG_BODY_LIMIT = 1024
+
+    def __init__(self, client_token, tracer=None, scheduler=None, session=None, lazy_responses=False, transport=None,
+                 middleware=None):
         self.client_token = client_token
-        self.requests = requests
-        self.request_url = ''
+        # None sends through self.requests, see crossengage.transport
+        self.transport = transport
+        self.middleware = list(middleware or [])
+        self.lazy_responses = lazy_responses
+        self.tracer = tracer or NoopTracer()
+        self.scheduler = scheduler
+        # calls dropped for their deadline, see crossengage.deadline
+        self.shed = ShedCounter()
+        self._requests = session
+        self._local = threading.local()
         self.default_headers = {
             self.AUTH_HEADER: self.client_token,
             self.API_VERSION_HEADER: self.API_VERSIONS["v1"],
             'Content-Type': 'application/json',
         }
 
+    @property
+    def requests(self):
+        """ requests-like object sending the calls, the requests module unless a session was given """
+        if self._requests is None:
+            # imported on first use, `import crossengage.client` stays fast for short-lived jobs
+            import requests
+            self._requests = requests
+        return self._requests
+
+    @requests.setter
+    def requests(self, value):
+        self._requests = value
+
+    @property
+    def request_url(self):
+        """ Url of the last request made by the current thread, so one client can be shared by threads """
+        return getattr(self._local, 'request_url', '')
+
+    @request_url.setter
+    def request_url(self, value):
+        self._local.request_url = value
+
+    def warmup(self, n_connections=4):
+        # type: (int) -> int
+        """
+        Open and TLS-handshake n_connections pooled connections to API_URL concurrently. Without a requests.Session
+        the client switches to a crossengage.warmup.warm_session(), with cached DNS and TLS session resumption.
+        :param n_connections: connections to open, keep it at most the pool size of the session
+        :return: number of connections opened
+        """
+        import requests
+
+        from crossengage.warmup import warm_session, warm_up
+
+        if self.requests is requests:
+            self.requests = warm_session(pool_maxsize=max(10, n_connections))
+        session = getattr(self.requests, 'session', self.requests)
+        if not isinstance(session, requests.Session):
+            # not pooled through requests, e.g. an Http2Session
+            return 0
+        return warm_up(session, self.API_URL + '/', n_connections)
+
+    def __pool_connections(self, concurrency):
+        """ Switch a client without session to a pooled one before a fan-out, instead of a connection per call """
+        import requests
+
+        from crossengage.warmup import warm_session
+
+        if self.transport is None and self.requests is requests:
+            self.requests = warm_session(pool_maxsize=max(10, concurrency))
+
+    @traced
     def get_user(self, user):
         # type: (dict) -> dict
         """
@@ -101,6 +192,29 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}/{2}".format(self.API_URL, self.USER_ENDPOINT, user['id'])
         return self.__create_request(payload={}, request_type=self.REQUEST_GET, version="v2")
 
+    def get_users(self, ids, concurrency=10, ordered=False, retry=None, rate=None, limiter=None):
+        """
+        Fetch many Users by id concurrently, a client without session switches to a pooled warm_session().
+        :param ids: iterable of user ids, read lazily
+        :param concurrency: max number of requests in flight
+        :param ordered: yield in the order of ids instead of completion order
+        :param retry: RetryPolicy for 429 / 5xx / connection errors, defaults to RetryPolicy()
+        :param rate: max requests per second, None for unlimited
+        :param limiter: crossengage.throttle.AdaptiveLimiter adjusting the requests in flight, up to concurrency
+        :return: generator of (id, json dict response) as in get_user
+        """
+        retry = retry or RetryPolicy()
+        self.__pool_connections(concurrency)
+
+        def fetch(user_id):
+            if limiter is None:
+                return retry.call(self.get_user, {'id': user_id})
+            # every attempt is a sample of the limiter, backoff sleeps are not
+            return retry.call(limiter.call, self.get_user, {'id': user_id})
+
+        return fan_out(fetch, ids, concurrency=concurrency, ordered=ordered, rate=rate)
+
+    @traced
     def update_user(self, user):
         # type: (dict) -> dict
         """
@@ -112,6 +226,7 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}/{2}".format(self.API_URL, self.USER_ENDPOINT, user['id'])
         return self.__create_request(payload=user, request_type=self.REQUEST_PUT, version="v1")
 
+    @traced
     def update_user_async(self, user):
         # type: (dict) -> dict
         """
@@ -123,6 +238,7 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}".format(self.API_URL, self.USER_ENDPOINT)
         return self.__create_request(payload=user, request_type=self.REQUEST_PUT, version="v2")
 
+    @traced
     def update_users_bulk(self, users):
         # type: (list) -> dict
         """
@@ -133,8 +249,9 @@ class CrossengageClient(object):
         """
         payload = {'updated': users}
         self.request_url = "{0}/{1}".format(self.API_URL, self.USER_BULK_ENDPOINT)
-        return self.__create_request(payload=payload, request_type=self.REQUEST_POST, version="v1")
+        return self.__create_request(payload=payload, request_type=self.REQUEST_POST, version="v1", lane=LOW)
 
+    @traced
     def delete_user(self, user):
         # type: (dict) -> dict
         """
@@ -145,6 +262,7 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}/{2}".format(self.API_URL, self.USER_ENDPOINT, user['id'])
         return self.__create_request(payload=user, request_type=self.REQUEST_DELETE, version="v1")
 
+    @traced
     def delete_user_async(self, user):
         # type: (dict) -> dict
         """
@@ -156,6 +274,7 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}/{2}".format(self.API_URL, self.USER_ENDPOINT, user['id'])
         return self.__create_request(payload=user, request_type=self.REQUEST_DELETE, version="v2")
 
+    @traced
     def delete_user_by_xng_id(self, user):
         # type: (dict) -> dict
         """
@@ -166,6 +285,7 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}/xngId/{2}".format(self.API_URL, self.USER_ENDPOINT, user['xngId'])
         return self.__create_request(payload=user, request_type=self.REQUEST_DELETE, version="v1")
 
+    @traced
     def add_user_attribute(self, attribute_name, attribute_type, nested_type):
         """
         Add new user attribute.
@@ -183,6 +303,7 @@ class CrossengageClient(object):
         }
         return self.__create_request(payload, self.REQUEST_POST, version="v1")
 
+    @traced
     def add_nested_user_attribute(self, parent_name, attribute_name, attribute_type):
         """
         Add new nested user attribute.
@@ -200,6 +321,7 @@ class CrossengageClient(object):
         }
         return self.__create_request(payload, self.REQUEST_POST, version="v1")
 
+    @traced
     def list_user_attributes(self, offset, limit):
         """
             List of user attributes.
@@ -214,6 +336,7 @@ class CrossengageClient(object):
             self.API_URL, self.USER_ENDPOINT, offset, limit)
         return self.__create_request(None, self.REQUEST_GET, version="v1")
 
+    @traced
     def delete_user_attribute(self, attribute_id):
         """
             Delete user attribute.
@@ -224,6 +347,7 @@ class CrossengageClient(object):
         payload = {}
         return self.__create_request(payload, self.REQUEST_DELETE, version="v1")
 
+    @traced
     def send_events(self, events, email=None, user_id=None, business_unit=None):
         """
         Send up to 50 events for a given user.
@@ -253,12 +377,29 @@ class CrossengageClient(object):
 
         return self.__create_request(payload, self.REQUEST_POST, version="v1")
 
+    @traced
+    def send_encoded_events(self, events, email=None, user_id=None, business_unit=None):
+        """
+        send_events with json encoded events, e.g. rendered by a crossengage.templates.Template. The request body is
+        joined from the encoded events, so middleware see a Request with body set and payload None.
+        :param events: list of up to 50 json encoded event strings
+        :return: json dict response, for example: {"status_code": 200}
+        """
+        self.request_url = "{0}/{1}".format(self.API_URL, self.EVENTS_ENDPOINT)
+
+        if email is None and user_id is None:
+            raise ValueError('email or external_id required for sending events')
+
+        body = events_body(events, email=email, user_id=user_id, business_unit=business_unit)
+        return self.__create_request(None, self.REQUEST_POST, version="v1", body=body)
+
+    @traced
     def batch_process(self, delete_list=[], update_list=[]):
         """
         Delete or Update up to 1000 users in batch.
         :param delete_list: user that should get deleted
         :param update_list: user that should get updated
-        :return: integer status_code, json dict response
+        :return: integer status_code, json dict response (LazyBatchResponse with lazy_responses, see its summary())
         {
           "updated": [
             {
@@ -302,21 +443,19 @@ class CrossengageClient(object):
             'deleted': delete_list,
         }
 
-        r = self.requests.post(
-            self.request_url,
-            data=json.dumps(payload),
-            headers=self.default_headers,
-            timeout=30
-        )
+        r = self.__send(payload, self.REQUEST_POST, self.default_headers, lane=LOW)
 
-        return r.status_code, r.json()
+        if self.lazy_responses:
+            return r.status_code, LazyBatchResponse(r)
+        return r.status_code, self.__decode(r)
 
+    @traced
     def batch_process_async(self, delete_list=[], update_list=[]):
         """
         Create, Update or Delete up to 1000 users in batch.
         :param delete_list: users that should be deleted
         :param update_list: users that should be created or updated
-        :return integer status_code, json dict response
+        :return integer status_code, json dict response, None when the body is not json (e.g. an empty 5xx)
             202, {"trackingId": "2e312089-a987-45c6-adbd-b904bc4dfc97"}
         """
         headers = update_dict(self.default_headers, {self.API_VERSION_HEADER: self.API_VERSIONS["v2"]})
@@ -327,10 +466,16 @@ class CrossengageClient(object):
             'deleted': delete_list,
         }
 
-        r = self.requests.post(self.request_url, data=json.dumps(payload), headers=headers, timeout=30)
+        r = self.__send(payload, self.REQUEST_POST, headers, lane=LOW)
 
-        return r.status_code, r.json()
+        try:
+            body = self.__decode(r)
+        except ValueError:
+            body = None
 
+        return r.status_code, body
+
+    @traced
     def track_user_task(self, tracking_id):
         # type: (dict) -> dict
         """
@@ -342,15 +487,16 @@ class CrossengageClient(object):
         headers = update_dict(self.default_headers, {self.API_VERSION_HEADER: self.API_VERSIONS["v2"]})
         self.request_url = "{0}/{1}/{2}".format(self.API_URL, self.TRACK_USER_TASK_ENDPOINT, tracking_id)
 
-        r = self.requests.get(self.request_url, headers=headers, timeout=30)
+        r = self.__send(None, self.REQUEST_GET, headers, lane=LOW)
 
         try:
-            body = r.json()
+            body = self.__decode(r)
         except ValueError:
             body = None
 
         return r.status_code, body
 
+    @traced
     def get_user_opt_out_status(self, user_id):
         # type: (str) -> dict
         """
@@ -364,6 +510,7 @@ class CrossengageClient(object):
         self.request_url = "{0}/{1}/{2}/{3}".format(self.API_URL, self.USER_ENDPOINT, user_id, self.OPTOUT_ENDPOINT)
         return self.__create_request(payload={}, request_type=self.REQUEST_GET, version="v1")
 
+    @traced
     def update_user_opt_out_status(self, user_id, channel_name):
         # type: (str, str) -> dict
         """
@@ -381,6 +528,7 @@ class CrossengageClient(object):
         )
         return self.__create_request(payload={"optOut": True}, request_type=self.REQUEST_PUT, version="v1")
 
+    @traced
     def update_user_opt_in_status(self, user_id, channel_name):
         # type: (str, str) -> dict
         """
@@ -398,39 +546,77 @@ class CrossengageClient(object):
         )
         return self.__create_request(payload={"optOut": False}, request_type=self.REQUEST_PUT, version="v1")
 
-    def __create_request(self, payload, request_type, version):
+    def get_opt_out_statuses(self, user_ids, concurrency=10, rate=None, ordered=False, limiter=None):
+        """
+        Fetch Opt-Out status of many users concurrently, a client without session switches to a pooled
+        warm_session().
+        :param user_ids: iterable of User external IDs
+        :param concurrency: max number of requests in flight
+        :param rate: max requests per second, None for unlimited
+        :param ordered: yield in the order of user_ids instead of completion order
+        :param limiter: crossengage.throttle.AdaptiveLimiter adjusting the requests in flight, up to concurrency
+        :return: generator of (user_id, json dict response) as in get_user_opt_out_status
+        """
+        self.__pool_connections(concurrency)
+        return fan_out(self.get_user_opt_out_status, user_ids, concurrency=concurrency, ordered=ordered, rate=rate,
+                       limiter=limiter)
+
+    def set_opt_status_bulk(self, statuses, concurrency=10, rate=None, ordered=False, limiter=None):
+        """
+        Opt out / opt in many users and channels concurrently, a client without session switches to a pooled
+        warm_session(). Unknown channels are answered locally without a request.
+        :param statuses: iterable of (user_id, channel_name, opt_out) tuples, channel_name one of CHANNELS
+        :param concurrency: max number of requests in flight
+        :param rate: max requests per second, None for unlimited
+        :param ordered: yield in the order of statuses instead of completion order
+        :param limiter: crossengage.throttle.AdaptiveLimiter adjusting the requests in flight, up to concurrency
+        :return: generator of ((user_id, channel_name, opt_out), json dict response), for example:
+            (('123', 'MAIL', True), {"optOut": true, "status_code": 200})
+        """
+        self.__pool_connections(concurrency)
+        return fan_out(lambda status: self.__set_opt_status(status, limiter), statuses, concurrency=concurrency,
+                       ordered=ordered, rate=rate)
+
+    def __set_opt_status(self, status, limiter=None):
+        user_id, channel_name, opt_out = status
+        if channel_name not in self.CHANNELS:
+            return {
+                'success': False,
+                'errors': {'client_error': 'unknown channel {0}'.format(channel_name)},
+                'status_code': 0,
+            }
+        send = self.update_user_opt_out_status if opt_out else self.update_user_opt_in_status
+        if limiter is None:
+            return send(user_id, channel_name)
+        # local answers above are no sample of the API latency
+        return limiter.call(send, user_id, channel_name)
+
+    def __create_request(self, payload, request_type, version, lane=HIGH, body=None):
         headers = update_dict(self.default_headers, {self.API_VERSION_HEADER: self.API_VERSIONS[version]})
         try:
-            if request_type == self.REQUEST_PUT:
-                r = self.requests.put(self.request_url, data=json.dumps(payload), headers=headers, timeout=30)
-
-            if request_type == self.REQUEST_GET:
-                r = self.requests.get(self.request_url, headers=headers, timeout=30)
+            r = self.__send(payload, request_type, headers, lane=lane, body=body)
 
-            if request_type == self.REQUEST_POST:
-                r = self.requests.post(self.request_url, data=json.dumps(payload), headers=headers, timeout=30)
-
-            if request_type == self.REQUEST_DELETE:
-                r = self.requests.delete(self.request_url, data=json.dumps(payload), headers=headers, timeout=30)
-
-            response = {}
-            if r.text != '':
-                response = r.json()
+            if self.lazy_responses:
+                response = LazyResponse(r)
+            else:
+                response = {}
+                if r.text != '':
+                    response = self.__decode(r)
 
             response['status_code'] = r.status_code
 
-            logging.debug("Request object", extra={
-                'crossengage_url': r.request.url,
-                'crossengage_headers': r.request.headers,
-                'crossengage_body': r.request.body
-            })
+            if logger.isEnabledFor(logging.DEBUG):
+                self.__log_request(r.request)
 
-        except RequestException as e:
-            # handle all requests HTTP exceptions
-            response = {'success': False, 'errors': {'connection_error': str(e)}}
+        except DeadlineExceeded as e:
+            response = {'success': False, 'errors': {'deadline_exceeded': str(e)}}
         except Exception as e:
-            # handle all exceptions which can be on API side
-            response = {'success': False, 'errors': {'client_error': str(e)}}
+            if _is_request_exception(e):
+                # handle all requests HTTP exceptions
+                response = {'success': False, 'errors': {'connection_error': str(e)}}
+            else:
+                # handle all exceptions which can be on API side
+                response = {'success': False, 'errors': {'client_error': str(e)}}
 
         if 'status_code' not in response:
             response['status_code'] = 0
@@ -443,3 +629,80 @@ class CrossengageClient(object):
             response['success'] = False
 
         return response
+
+    def __send(self, payload, request_type, headers, lane=HIGH, body=None):
+        request = Request(
+            request_type, self.request_url, headers,
+            payload=None if request_type == self.REQUEST_GET else payload,
+            # a lane forced on this thread holds when a middleware sends from another thread
+            lane=lane if self.scheduler is None else self.scheduler.lane_of(lane),
+            deadline=current_deadline(),
+        )
+        # already encoded, __transmit does not encode the payload again
+        request.body = body
+        span = request.span = self.tracer.current_span()
+        span.set_attribute('http.method', request_type.upper())
+        span.set_attribute('http.url', request.url)
+        span.set_attribute('crossengage.api_version', headers[self.API_VERSION_HEADER])
+
+        r = self.__dispatch(request, 0)
+
+        span.set_attribute('http.status_code', r.status_code)
+        return r
+
+    def __dispatch(self, request, index):
+        if index < len(self.middleware):
+            return self.middleware[index](request, lambda next_request: self.__dispatch(next_request, index + 1))
+        return self.__transmit(request)
+
+    def __transmit(self, request):
+        if request.span is not None and self.tracer.current_span() is not request.span:
+            # sent from a middleware thread, e.g. a hedge
+            with self.tracer.activate(request.span):
+                return self.__transmit_request(request)
+        return self.__transmit_request(request)
+
+    def __transmit_request(self, request):
+        try:
+            if request.deadline is not None:
+                # dropped before the payload is encoded and a slot is waited for
+                check_deadline(request.deadline)
+                if self.scheduler is not None:
+                    self.scheduler.admit(request.lane, request.deadline)
+        except DeadlineExceeded as e:
+            self.shed.add(e)
+            raise
+
+        if request.body is None and request.method != self.REQUEST_GET:
+            with self.tracer.start_span('crossengage.encode') as encode_span:
+                request.body = json.dumps(request.payload)
+                encode_span.set_attribute('crossengage.payload_size', len(request.body))
+        if request.body is not None:
+            self.tracer.current_span().set_attribute('crossengage.payload_size', len(request.body))
+
+        transport = self.transport or RequestsTransport(self.requests)
+        # connection acquisition happens inside the transport, so it is part of the http span
+        with self.tracer.start_span('crossengage.http') as http_span:
+            if self.scheduler is None:
+                r = transport.send(request)
+            else:
+                try:
+                    with self.scheduler.slot(request.lane, request.deadline):
+                        r = transport.send(request)
+                except DeadlineExceeded as e:
+                    # gave up waiting for a slot, transport.send does not raise it
+                    self.shed.add(e)
+                    raise
+            http_span.set_attribute('http.status_code', r.status_code)
+        return r
+
+    def __decode(self, r):
+        with self.tracer.start_span('crossengage.decode'):
+            return r.json()
+
+    def __log_request(self, request):
+        logger.debug("Request object", extra={
+            'crossengage_url': request.url,
+            'crossengage_headers': redact_headers(request.headers, [self.AUTH_HEADER]),
+            'crossengage_body': truncate(request.body, self.LOG_BODY_LIMIT)
+        })
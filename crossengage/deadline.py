@@ -0,0 +1,92 @@
+"""
+Deadlines of client calls, so work the caller gave up on is not sent.
+
+deadline() sets a deadline for every client call of the current thread. A call whose deadline passed is dropped
+before its payload is encoded, a PriorityScheduler rejects it at admission when its estimated wait for a request
+slot exceeds the time left, and stops waiting for a slot at the deadline. Dropped calls raise DeadlineExceeded,
+client methods returning a json dict answer with a 'deadline_exceeded' error and status_code 0 instead.
+
+Usage:
+
+ with deadline(0.5):
+     response = client.get_user({'id': '123'})
+
+ print(client.shed.expired, client.shed.rejected)
+
+fan_out() hands the deadline of the calling thread to its worker threads, RetryPolicy does not retry past it.
+"""
+from __future__ import absolute_import
+
+import contextlib
+import threading
+import time
+
+# same clock as crossengage.throttle, which depends on this module through crossengage.retry
+monotonic = getattr(time, 'monotonic', time.time)
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """
+    A call dropped for its deadline.
+    :param rejected: dropped at admission, as its estimated wait exceeded the time left, instead of expired
+    """
+
+    def __init__(self, message, rejected=False):
+        super(DeadlineExceeded, self).__init__(message)
+        self.rejected = rejected
+
+
+def current_deadline():
+    """ monotonic() time of the deadline of the current thread, None without deadline """
+    return getattr(_local, 'deadline', None)
+
+
+def remaining(when=None):
+    """ Seconds left until when, the deadline of the current thread by default, None without deadline """
+    when = current_deadline() if when is None else when
+    return None if when is None else when - monotonic()
+
+
+@contextlib.contextmanager
+def deadline_at(when):
+    """ Set the deadline of the current thread to the monotonic() time when, None keeps the current one """
+    previous = current_deadline()
+    if when is not None:
+        # an inner deadline never extends an outer one
+        _local.deadline = when if previous is None else min(previous, when)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def deadline(seconds):
+    """ Set the deadline of the current thread to seconds from now """
+    return deadline_at(monotonic() + seconds)
+
+
+def check_deadline(when, what='request'):
+    """ Raise DeadlineExceeded when the monotonic() time when passed """
+    if when is not None and monotonic() >= when:
+        raise DeadlineExceeded('{0} expired {1:.3f}s ago'.format(what, monotonic() - when))
+
+
+class ShedCounter(object):
+    """ Counts of the calls dropped for their deadline """
+
+    def __init__(self):
+        self.expired = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def add(self, error):
+        with self._lock:
+            if error.rejected:
+                self.rejected += 1
+            else:
+                self.expired += 1
+
+    def __repr__(self):
+        return '<ShedCounter expired={0} rejected={1}>'.format(self.expired, self.rejected)
@@ -0,0 +1,158 @@
+"""
+Bulk GDPR deletion of users given by id or xngId.
+
+Ids are deleted in chunks through batch_process_async and confirmed through track_user_task, xngIds are deleted
+one by one with delete_user_by_xng_id, all of it concurrently. Every user gets one line in a JSON lines audit log,
+a call raising (e.g. a connection error) is audited as failed with status_code 0 and does not stop the run.
+
+Usage:
+
+ with open('erasure-2019-06-01.log', 'a') as audit_log:
+     result = DeletionPipeline(client, audit_log, concurrency=10, rate=20).run([
+         {'id': '123'},
+         {'xngId': '088818b3-445e-41a6-a7e1-cf86c8cdfbe4'},
+     ])
+"""
+from __future__ import absolute_import
+
+import json
+import time
+
+from crossengage.bulk import BATCH_SIZE, STAGE_PROCESSED, chunked, wait_for_tracking
+from crossengage.fanout import fan_out
+from crossengage.retry import RetryPolicy
+
+# a user that cannot be found is as deleted as it gets
+DELETED_STATUS_CODES = (200, 202, 204, 404)
+
+
+class DeletionResult(object):
+
+    def __init__(self):
+        self.deleted = 0
+        self.failed = 0
+
+    def __repr__(self):
+        return '<DeletionResult deleted={0} failed={1}>'.format(self.deleted, self.failed)
+
+
+class DeletionPipeline(object):
+    """
+    :param client: CrossengageClient
+    :param audit_log: file like object the JSON lines audit records are written to
+    :param batch_size: max ids per batch_process_async call
+    :param concurrency: max requests in flight
+    :param rate: max requests per second, None for unlimited
+    :param wait: poll track_user_task until each batch is PROCESSED before reporting its users
+    :param retry: RetryPolicy of every call, defaults to RetryPolicy()
+    :param limiter: crossengage.throttle.AdaptiveLimiter adjusting the requests in flight, up to concurrency,
+                    batch and single deletions differ in latency so give it latency_tolerance=None
+    """
+
+    def __init__(self, client, audit_log, batch_size=BATCH_SIZE, concurrency=10, rate=None, wait=True,
+                 retry=None, poll_interval=1.0, timeout=300.0, limiter=None):
+        self.client = client
+        self.audit_log = audit_log
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate = rate
+        self.wait = wait
+        self.retry = retry or RetryPolicy()
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.limiter = limiter
+
+    def run(self, users):
+        # type: (iterable) -> DeletionResult
+        """
+        Delete users and write their audit records.
+        :param users: iterable of dicts with either an id or a xngId
+        :return: DeletionResult
+        """
+        result = DeletionResult()
+        for _, records in fan_out(self._delete, self._tasks(users), concurrency=self.concurrency, rate=self.rate):
+            for record in records:
+                if record['success']:
+                    result.deleted += 1
+                else:
+                    result.failed += 1
+                self.audit_log.write(json.dumps(record, sort_keys=True) + '\n')
+        self.audit_log.flush()
+        return result
+
+    def _tasks(self, users):
+        ids = []
+        for user in users:
+            if 'id' in user:
+                ids.append(user['id'])
+                if len(ids) == self.batch_size:
+                    yield ids
+                    ids = []
+            elif 'xngId' in user:
+                yield user['xngId']
+            else:
+                raise ValueError('id or xngId required for deleting users')
+        for chunk in chunked(ids, self.batch_size):
+            yield chunk
+
+    def _delete(self, task):
+        try:
+            if isinstance(task, list):
+                return self._delete_batch(task)
+            return self._delete_by_xng_id(task)
+        except Exception as e:
+            # the call never got an answer, e.g. a connection error
+            key, values = ('id', task) if isinstance(task, list) else ('xngId', [task])
+            return [{
+                key: value,
+                'status_code': 0,
+                'success': False,
+                'errors': {'client_error': str(e)},
+                'time': time.time(),
+            } for value in values]
+
+    def _call(self, func, *args, **kwargs):
+        if self.limiter is None:
+            return self.retry.call(func, *args, **kwargs)
+        return self.retry.call(self.limiter.call, func, *args, **kwargs)
+
+    def _delete_by_xng_id(self, xng_id):
+        response = self._call(self.client.delete_user_by_xng_id, {'xngId': xng_id})
+        return [{
+            'xngId': xng_id,
+            'status_code': response['status_code'],
+            'success': response['status_code'] in DELETED_STATUS_CODES,
+            'errors': response.get('errors'),
+            'time': time.time(),
+        }]
+
+    def _delete_batch(self, ids):
+        with self.client.tracer.start_span('crossengage.deletion.chunk', {'crossengage.deleted': len(ids)}):
+            status_code, body = self._call(
+                self.client.batch_process_async, delete_list=[{'id': user_id} for user_id in ids])
+            tracking_id = (body or {}).get('trackingId')
+            success = status_code == 202
+            errors = None if success else body
+            stage = None
+            if success and self.wait:
+                try:
+                    _, tracking = wait_for_tracking(self.client, tracking_id, self.poll_interval, self.timeout)
+                except Exception as e:
+                    # accepted, the audit record keeps its trackingId to check it later
+                    tracking = {'client_error': str(e)}
+                tracking = tracking or {}
+                stage = tracking.get('stage')
+                # tracking only counts errors, so a batch with errors is reported failed as a whole
+                success = stage == STAGE_PROCESSED and not tracking.get('error')
+                if not success:
+                    errors = tracking
+
+        return [{
+            'id': user_id,
+            'status_code': status_code,
+            'trackingId': tracking_id,
+            'stage': stage,
+            'success': success,
+            'errors': errors,
+            'time': time.time(),
+        } for user_id in ids]
@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+from crossengage.deadline import current_deadline, deadline_at
+from crossengage.throttle import RateLimiter
+
+
+def fan_out(func, items, concurrency=10, ordered=False, rate=None, limiter=None):
+    """
+    Call func(item) for every item from `concurrency` threads and yield (item, result) pairs as they complete.
+
+    Items are read lazily and at most `concurrency` calls are in flight, so memory stays bounded for any number of
+    items. Exceptions raised by func are re-raised in the consuming thread. The calls run under the deadline of the
+    calling thread, see crossengage.deadline.
+
+    :param func: callable taking one item
+    :param items: iterable of items
+    :param concurrency: max number of calls in flight
+    :param ordered: yield results in the order of items instead of completion order
+    :param rate: max calls per second, None for unlimited
+    :param limiter: AdaptiveLimiter the calls go through, concurrency is then the highest limit reachable
+    """
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+    rate_limiter = RateLimiter(rate) if rate else None
+    when = current_deadline()
+    tasks = queue.Queue()
+    done = queue.Queue()
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            index, item = task
+            try:
+                if rate_limiter is not None:
+                    rate_limiter.acquire()
+                with deadline_at(when):
+                    result = func(item) if limiter is None else limiter.call(func, item)
+                done.put((index, item, result, None))
+            except Exception:
+                done.put((index, item, None, sys.exc_info()))
+
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    iterator = iter(items)
+    exhausted = False
+    submitted = 0
+    in_flight = 0
+    buffered = {}
+    next_index = 0
+    try:
+        while True:
+            while not exhausted and in_flight < concurrency and len(buffered) < concurrency:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                tasks.put((submitted, item))
+                submitted += 1
+                in_flight += 1
+
+            if in_flight == 0:
+                return
+
+            index, item, result, error = done.get()
+            in_flight -= 1
+            if error is not None:
+                raise error[1]
+
+            if not ordered:
+                yield item, result
+                continue
+
+            buffered[index] = (item, result)
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+    finally:
+        for _ in threads:
+            tasks.put(None)
@@ -0,0 +1,150 @@
+"""
+Hedged requests for latency critical reads.
+
+HedgingMiddleware sends a second attempt of a GET when the first one did not answer within the given percentile
+of recent GET latencies, and returns whichever answers first. A budget caps the extra requests.
+
+Usage:
+
+ hedging = HedgingMiddleware(percentile=95, budget=0.05)
+ client = CrossengageClient(client_token='YOUR_TOKEN', session=requests.Session(), middleware=[hedging])
+ client.get_user({'id': '123'})
+ print(hedging.hedged, hedging.hedge_wins)
+
+requests can not abort a request in flight: the losing attempt is abandoned, it runs to its end in its own thread,
+its connection goes back to the pool and its response is dropped. Attempts run on their own threads, the Request
+carries what they need of the calling thread: the lane forced by PriorityScheduler.lane(), the deadline and the
+span of the client call.
+"""
+from __future__ import absolute_import
+
+import copy
+import sys
+import threading
+from collections import deque
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+from crossengage.throttle import monotonic
+
+
+class LatencyWindow(object):
+    """ Latencies of the last `size` requests """
+
+    def __init__(self, size=100):
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self._latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+class HedgingMiddleware(object):
+    """
+    Client middleware hedging idempotent requests, see crossengage.transport.
+    :param percentile: hedge once the first attempt is slower than this percentile of recent latencies
+    :param delay: fixed hedge delay in seconds, overrides percentile
+    :param initial_delay: delay used until min_samples latencies were seen
+    :param min_delay: lower bound of the delay, hedging fast answers only doubles the load
+    :param budget: max extra requests as a share of the hedgeable requests, 0.05 is at most 5% more requests
+    :param max_burst: hedges allowed at once when the budget saved up, the cap of saved up hedges
+    :param methods: request methods hedged, only idempotent ones
+    :param window: number of latencies the percentile is computed from
+    """
+
+    def __init__(self, percentile=95, delay=None, initial_delay=0.1, min_delay=0.005, budget=0.05, max_burst=10,
+                 methods=('get',), window=100, min_samples=20):
+        self.percentile = percentile
+        self.delay = delay
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.budget = budget
+        self.max_burst = max_burst
+        self.methods = methods
+        self.min_samples = min_samples
+        self.latencies = LatencyWindow(window)
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        # counters
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """ Seconds to wait for the first attempt before hedging """
+        if self.delay is not None:
+            return self.delay
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def __call__(self, request, call_next):
+        if request.method not in self.methods:
+            return call_next(request)
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.max_burst, self._tokens + self.budget)
+
+        answers = queue.Queue()
+
+        def attempt(attempt_request, hedge):
+            started = monotonic()
+            try:
+                answers.put((hedge, call_next(attempt_request), None))
+            except Exception:
+                answers.put((hedge, None, sys.exc_info()))
+            else:
+                self.latencies.add(monotonic() - started)
+
+        self._start(attempt, request, False)
+        try:
+            return self._answer(answers.get(timeout=self.hedge_delay()), answers, 1)
+        except queue.Empty:
+            pass
+
+        if not self._take_token():
+            return self._answer(answers.get(), answers, 1)
+        # a copy, the transport sets the body of the request it sends
+        self._start(attempt, copy.copy(request), True)
+        return self._answer(answers.get(), answers, 2)
+
+    def _start(self, attempt, request, hedge):
+        thread = threading.Thread(target=attempt, args=(request, hedge))
+        thread.daemon = True
+        thread.start()
+
+    def _answer(self, answer, answers, attempts):
+        # the first response wins, an error only when every attempt failed
+        hedge, response, error = answer
+        if error is not None and attempts > 1:
+            hedge, response, _ = answers.get()
+            if response is None:
+                raise error[1]
+        elif error is not None:
+            raise error[1]
+        if hedge:
+            with self._lock:
+                self.hedge_wins += 1
+        return response
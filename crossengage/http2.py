@@ -0,0 +1,90 @@
+"""
+HTTP/2 transport for the Crossengage client, many concurrent requests share a few multiplexed connections.
+
+Requires the optional http2 dependencies: pip install crossengage-client[http2]
+
+Usage:
+
+ from crossengage.http2 import Http2Session
+
+ client = CrossengageClient(client_token='YOUR_TOKEN', session=Http2Session(max_connections=2))
+"""
+from __future__ import absolute_import
+
+from requests.exceptions import ConnectionError, RequestException, Timeout
+
+try:
+    import httpx
+except ImportError:  # optional dependency
+    httpx = None
+
+
+class Http2Request(object):
+    """ Sent request, with the url / headers / body attributes of a requests.PreparedRequest """
+
+    def __init__(self, request):
+        self.url = str(request.url)
+        self.headers = request.headers
+        self.body = request.content
+
+
+class Http2Response(object):
+    """ httpx response exposing the part of the requests.Response interface used by the client """
+
+    def __init__(self, response):
+        self.raw = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.request = Http2Request(response.request)
+
+    @property
+    def content(self):
+        return self.raw.content
+
+    @property
+    def text(self):
+        return self.raw.text
+
+    def json(self):
+        return self.raw.json()
+
+
+class Http2Session(object):
+    """
+    requests-like session sending over HTTP/2 when the server supports it (TLS with ALPN), HTTP/1.1 otherwise.
+    :param max_connections: max connections kept, each carries many concurrent HTTP/2 streams
+    :param client: preconfigured httpx.Client, overrides max_connections
+    """
+
+    def __init__(self, max_connections=2, client=None):
+        if client is None:
+            if httpx is None:
+                raise ImportError('Http2Session requires httpx[http2]: pip install crossengage-client[http2]')
+            client = httpx.Client(http2=True, limits=httpx.Limits(max_connections=max_connections))
+        self.client = client
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        try:
+            response = self.client.request(method, url, content=data, headers=headers, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise Timeout(str(e))
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e))
+        except httpx.HTTPError as e:
+            raise RequestException(str(e))
+        return Http2Response(response)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.client.close()
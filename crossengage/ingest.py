@@ -0,0 +1,238 @@
+"""
+Replay of partitioned event logs into send_events.
+
+Every file of a source directory is a partition of JSON lines records, one event per record:
+
+ {"id": "123", "businessUnit": "de", "event": {"event": "Order", "properties": {"sku": "A1"}}}
+
+Partitions are ingested concurrently. Each reads a window of records, groups their events by user, in log order,
+and sends them in send_events calls of up to 50 events; users of a window are sent concurrently. The byte offset
+of a partition is committed once every call of its window was acknowledged, and acknowledged calls of an
+unfinished window are checkpointed, so a replay resumes where the last one stopped and does not send an
+acknowledged call again.
+
+Usage:
+
+ ingestor = EventIngestor(client, offsets_dir='/var/lib/replay/offsets', window=1000, concurrency=8)
+ result = ingestor.run('/var/lib/replay/events')
+ print(result.sent, result.failed_partitions)
+"""
+from __future__ import absolute_import
+
+import io
+import json
+import os
+from collections import OrderedDict
+from functools import partial
+
+from crossengage.bulk import chunked
+from crossengage.fanout import fan_out
+from crossengage.retry import RetryPolicy
+
+EVENTS_PER_CALL = 50
+
+
+def read_records(path, start, end=None, limit=None):
+    """
+    Records of a partition file from the start byte offset, up to the end offset or limit records.
+    A last line without newline is being written and is left out.
+    :return: list of records, byte offset after the last record
+    """
+    records = []
+    offset = start
+    with open(path, 'rb') as partition_file:
+        partition_file.seek(start)
+        while (end is None or offset < end) and (limit is None or len(records) < limit):
+            line = partition_file.readline()
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if line.strip():
+                records.append(json.loads(line.decode('utf-8')))
+    return records, offset
+
+
+def group_events(records, size=EVENTS_PER_CALL):
+    """
+    Events of the records grouped by user (id, email, businessUnit) in order of first appearance.
+    :return: list of (user key, list of batches), a batch is a list of up to size events
+    """
+    users = OrderedDict()
+    for record in records:
+        key = (record.get('id'), record.get('email'), record.get('businessUnit'))
+        users.setdefault(key, []).append(record['event'])
+    return [(key, list(chunked(events, size))) for key, events in users.items()]
+
+
+class OffsetStore(object):
+    """
+    Per partition state in `<directory>/<partition>.offset`: the committed byte offset, and for a window not yet
+    committed its end offset and the indexes of its acknowledged batches.
+    """
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+
+    def _path(self, partition):
+        return os.path.join(self.directory, partition + '.offset')
+
+    def load(self, partition):
+        path = self._path(partition)
+        if not os.path.exists(path):
+            return {'offset': 0, 'window_end': None, 'acked': []}
+        with io.open(path, encoding='utf-8') as state_file:
+            return json.load(state_file)
+
+    def save(self, partition, state):
+        path = self._path(partition)
+        with io.open(path + '.tmp', 'w', encoding='utf-8') as state_file:
+            state_file.write(json.dumps(state, sort_keys=True))
+        getattr(os, 'replace', os.rename)(path + '.tmp', path)
+
+
+class PartitionResult(object):
+
+    def __init__(self, partition, offset=0):
+        self.partition = partition
+        self.offset = offset
+        self.sent = 0
+        self.calls = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.failed = False
+        self.errors = None
+
+    def __repr__(self):
+        return '<PartitionResult {0} offset={1} sent={2} failed={3}>'.format(
+            self.partition, self.offset, self.sent, self.failed)
+
+
+class IngestResult(object):
+
+    def __init__(self):
+        self.partitions = []
+
+    @property
+    def sent(self):
+        return sum(partition.sent for partition in self.partitions)
+
+    @property
+    def failed_partitions(self):
+        return [partition.partition for partition in self.partitions if partition.failed]
+
+    def __repr__(self):
+        return '<IngestResult sent={0} partitions={1} failed={2}>'.format(
+            self.sent, len(self.partitions), len(self.failed_partitions))
+
+
+class EventIngestor(object):
+    """
+    :param client: CrossengageClient
+    :param offsets_dir: directory of the committed offsets, one file per partition
+    :param window: records read, sent and committed at once per partition
+    :param concurrency: max send_events calls in flight per partition
+    :param partition_concurrency: max partitions ingested at once, defaults to all
+    :param retry: RetryPolicy of every call, defaults to RetryPolicy()
+    :param transform: function turning a raw record into a record with id / email / businessUnit and event
+    :param limiter: crossengage.throttle.AdaptiveLimiter shared by the partitions, adjusting the calls in flight
+                    up to concurrency per partition
+    """
+
+    def __init__(self, client, offsets_dir, window=1000, concurrency=4, partition_concurrency=None, retry=None,
+                 transform=None, limiter=None):
+        self.client = client
+        self.offsets = OffsetStore(offsets_dir)
+        self.window = window
+        self.concurrency = concurrency
+        self.partition_concurrency = partition_concurrency
+        self.retry = retry or RetryPolicy()
+        self.transform = transform
+        self.limiter = limiter
+
+    def run(self, source_dir):
+        # type: (str) -> IngestResult
+        """ Ingest every partition file of source_dir from its committed offset to its end """
+        paths = [os.path.join(source_dir, name) for name in sorted(os.listdir(source_dir))
+                 if not name.startswith('.') and os.path.isfile(os.path.join(source_dir, name))]
+        result = IngestResult()
+        if not paths:
+            return result
+        for _, partition_result in fan_out(self.ingest_partition, paths,
+                                           concurrency=self.partition_concurrency or len(paths)):
+            result.partitions.append(partition_result)
+        return result
+
+    def ingest_partition(self, path):
+        # type: (str) -> PartitionResult
+        """ Ingest one partition file window by window, stops at the first window that is not acknowledged """
+        partition = os.path.basename(path)
+        state = self.offsets.load(partition)
+        result = PartitionResult(partition, state['offset'])
+        while not result.failed:
+            if state['window_end'] is None:
+                records, end = read_records(path, state['offset'], limit=self.window)
+            else:
+                # resumed window, same bytes so the same batches as before
+                records, end = read_records(path, state['offset'], end=state['window_end'])
+            if end == state['offset']:
+                break
+            with self.client.tracer.start_span('crossengage.ingest.window', {
+                    'crossengage.partition': partition, 'crossengage.offset': state['offset']}):
+                self._send_window(partition, records, end, state, result)
+            if not result.failed:
+                state = {'offset': end, 'window_end': None, 'acked': []}
+                self.offsets.save(partition, state)
+                result.offset = end
+        return result
+
+    def _send_window(self, partition, records, end, state, result):
+        if self.transform is not None:
+            records = [self.transform(record) for record in records]
+        acked = set(state['acked'])
+        users = []
+        index = 0
+        for key, batches in group_events(records):
+            pending = []
+            for batch in batches:
+                if index in acked:
+                    result.skipped += len(batch)
+                else:
+                    pending.append((index, batch))
+                index += 1
+            if pending:
+                users.append((key, pending))
+
+        for _, responses in fan_out(self._send_user, users, concurrency=self.concurrency):
+            for batch_index, batch, response in responses:
+                if response is None:
+                    result.invalid += len(batch)
+                    acked.add(batch_index)
+                elif 200 <= response['status_code'] < 300:
+                    result.sent += len(batch)
+                    result.calls += 1
+                    acked.add(batch_index)
+                else:
+                    result.failed = True
+                    result.errors = response.get('errors')
+            state.update(window_end=end, acked=sorted(acked))
+            self.offsets.save(partition, state)
+
+    def _send_user(self, user):
+        (user_id, email, business_unit), batches = user
+        responses = []
+        send = self.client.send_events
+        if self.limiter is not None:
+            send = partial(self.limiter.call, send)
+        for index, batch in batches:
+            if user_id is None and email is None:
+                # never accepted, would block the partition forever
+                responses.append((index, batch, None))
+                continue
+            response = self.retry.call(send, batch, email=email, user_id=user_id, business_unit=business_unit)
+            responses.append((index, batch, response))
+            if not 200 <= response['status_code'] < 300:
+                # later events of the user must not overtake the failed ones
+                break
+        return responses
@@ -0,0 +1,192 @@
+"""
+Local mirror of user profiles, filled from the API responses the client already gets.
+
+ProfileMirror is a client middleware keeping the profiles seen in get_user, update_user and batch_process responses
+in an embedded SQLite database, indexed on id, email and xngId. Lookups answer from it as long as the profile is not
+older than `max_staleness` seconds. Async writes and deletions drop the profiles they touch, a mirror never answers
+with a profile it knows to be changing. batch_process bodies are decoded to read the xngIds, even with
+lazy_responses. A failing database (locked, full, read only) is logged and never fails the call it observes.
+
+Usage:
+
+ mirror = ProfileMirror('/var/lib/worker/profiles.sqlite', max_staleness=3600)
+ client = CrossengageClient(client_token='YOUR_TOKEN', middleware=[mirror])
+
+ xng_id = mirror.xng_id_of('123', client=client)  # get_user only when not mirrored or stale
+ client.delete_user_by_xng_id({'xngId': xng_id})
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    from urllib.parse import unquote
+except ImportError:  # python 2
+    from urllib import unquote
+
+logger = logging.getLogger(__name__)
+
+_USER = re.compile(r'/users/(?P<id>[^/?]+)$')
+_XNG_ID = re.compile(r'/users/xngId/(?P<xng_id>[^/?]+)$')
+_USERS = re.compile(r'/users$')
+_BATCH = re.compile(r'/users/batch$')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS profiles (id TEXT PRIMARY KEY, email TEXT, xng_id TEXT, profile TEXT NOT NULL, '
+    'updated REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS profiles_email ON profiles (email)',
+    'CREATE INDEX IF NOT EXISTS profiles_xng_id ON profiles (xng_id)',
+)
+
+
+class ProfileMirror(object):
+    """
+    Client middleware mirroring user profiles into SQLite, see crossengage.transport.
+    :param path: SQLite database file, shared by the processes of a host, ':memory:' for one process
+    :param max_staleness: seconds a mirrored profile answers lookups, overridable per lookup
+    :param timeout: seconds a write waits for the lock of a database file another process is writing
+    """
+
+    def __init__(self, path=':memory:', max_staleness=300.0, timeout=5.0):
+        self.path = path
+        self.max_staleness = max_staleness
+        self.hits = 0
+        self.misses = 0
+        # responses not mirrored as the database failed
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+
+    def __call__(self, request, call_next):
+        response = call_next(request)
+        try:
+            if 200 <= response.status_code < 300:
+                self._observe(request, response)
+            elif response.status_code == 404 and request.method == 'get':
+                match = _USER.search(request.url.split('?', 1)[0])
+                if match:
+                    self.remove([unquote(match.group('id'))])
+        except ValueError:
+            # not json, nothing to mirror
+            pass
+        except sqlite3.Error:
+            self.errors += 1
+            logger.warning('Profile mirror failed, %s %s not mirrored', request.method, request.url, exc_info=True)
+        return response
+
+    def _observe(self, request, response):
+        path = request.url.split('?', 1)[0]
+        v2 = request.headers.get('X-XNG-ApiVersion') == '2'
+        if _BATCH.search(path):
+            payload = request.payload or {}
+            written = [user.get('id') for name in ('updated', 'deleted') for user in payload.get(name, [])]
+            if v2 or response.status_code != 200:
+                self.remove(written)
+                return
+            body = response.json()
+            self.remove(written)
+            self.store(self._merged(payload.get('updated', []), body.get('updated', [])))
+            return
+        match = _XNG_ID.search(path)
+        if match and request.method == 'delete':
+            self.remove_xng_id(unquote(match.group('xng_id')))
+            return
+        match = _USER.search(path) or _USERS.search(path)
+        if match is None:
+            return
+        user_id = unquote(match.group('id')) if 'id' in match.groupdict() else (request.payload or {}).get('id')
+        if request.method == 'get' and v2:
+            profile = response.json()
+            profile.setdefault('id', user_id)
+            self.store([profile])
+        elif request.method == 'put' and not v2 and response.status_code == 200:
+            body = response.json()
+            profile = dict(request.payload or {}, id=user_id)
+            if body.get('xngGlobalUserId'):
+                profile['xngId'] = body['xngGlobalUserId']
+            self.store([profile], merge=True)
+        elif request.method in ('put', 'delete'):
+            # accepted, not applied yet or gone
+            self.remove([user_id])
+
+    @staticmethod
+    def _merged(users, results):
+        xng_ids = dict((result.get('id'), result.get('xngId')) for result in results if result.get('success'))
+        for user in users:
+            if user.get('id') in xng_ids:
+                yield dict(user, xngId=xng_ids[user['id']]) if xng_ids[user['id']] else user
+
+    def store(self, profiles, merge=False):
+        """
+        Mirror profiles as of now.
+        :param profiles: iterable of profile dicts with an id
+        :param merge: update the mirrored profile with the given fields instead of replacing it
+        """
+        now = time.time()
+        with self._lock:
+            rows = []
+            for profile in profiles:
+                if merge:
+                    row = self._db.execute('SELECT profile FROM profiles WHERE id = ?', (profile['id'],)).fetchone()
+                    if row is not None:
+                        profile = dict(json.loads(row[0]), **profile)
+                rows.append((profile['id'], profile.get('email'), profile.get('xngId'), json.dumps(profile), now))
+            self._db.executemany('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)', rows)
+
+    def remove(self, ids):
+        """ Forget the profiles of ids """
+        with self._lock:
+            self._db.executemany('DELETE FROM profiles WHERE id = ?', [(user_id,) for user_id in ids])
+
+    def remove_xng_id(self, xng_id):
+        with self._lock:
+            self._db.execute('DELETE FROM profiles WHERE xng_id = ?', (xng_id,))
+
+    def _lookup(self, column, value, max_staleness):
+        max_staleness = self.max_staleness if max_staleness is None else max_staleness
+        with self._lock:
+            row = self._db.execute('SELECT profile FROM profiles WHERE {0} = ? AND updated >= ? '
+                                   'ORDER BY updated DESC LIMIT 1'.format(column),
+                                   (value, time.time() - max_staleness)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def get(self, user_id, max_staleness=None):
+        # type: (str, float) -> dict
+        """ Mirrored profile of user_id not older than max_staleness seconds, None otherwise """
+        return self._lookup('id', user_id, max_staleness)
+
+    def get_by_email(self, email, max_staleness=None):
+        return self._lookup('email', email, max_staleness)
+
+    def get_by_xng_id(self, xng_id, max_staleness=None):
+        return self._lookup('xng_id', xng_id, max_staleness)
+
+    def xng_id_of(self, user_id, max_staleness=None, client=None):
+        """
+        xngId of user_id, from the mirror or through client.get_user when it is not mirrored or stale.
+        :param client: CrossengageClient with this mirror in its middleware, None to only answer locally
+        :return: the xngId, None when unknown
+        """
+        profile = self.get(user_id, max_staleness)
+        if profile is None and client is not None:
+            response = client.get_user({'id': user_id})
+            profile = response if response['status_code'] == 200 else None
+        return (profile or {}).get('xngId')
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM profiles').fetchone()[0]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,192 @@
+"""
+Bulk sync of a JSON lines user file from several processes.
+
+The file is cut into byte ranges on line boundaries, every worker process owns its own CrossengageClient and
+connection pool, parses, transforms and serializes its range and sends it in batch_process(_async) chunks. Workers
+only send compact summaries back to the parent, so throughput scales with cores instead of stopping at the GIL.
+
+Usage:
+
+ def to_crossengage(row):              # must be a module level function, it is pickled to the workers
+     return {'id': row['user_id'], 'email': row['email']}
+
+ summary = MultiprocessSync('YOUR_TOKEN', processes=8, transform=to_crossengage).sync_file('users.jsonl')
+ print(summary.sent, summary.failed, summary.failed_ids[:10])
+"""
+from __future__ import absolute_import
+
+import json
+import multiprocessing
+import os
+import time
+
+import requests
+
+from crossengage.bulk import BATCH_SIZE, chunked
+from crossengage.client import CrossengageClient
+
+# client of the current worker process, see _init_worker
+_client = None
+
+
+def file_partitions(path, partitions):
+    """
+    Cut a file into up to `partitions` byte ranges starting and ending on line boundaries.
+    :return: list of (path, start, end)
+    """
+    size = os.path.getsize(path)
+    step = max(1, size // max(1, partitions))
+    ranges = []
+    start = 0
+    with open(path, 'rb') as users_file:
+        while start < size:
+            users_file.seek(min(size, start + step))
+            users_file.readline()
+            end = min(size, users_file.tell())
+            ranges.append((path, start, end))
+            start = end
+    return ranges
+
+
+def read_partition(path, start, end):
+    """ User dicts of the JSON lines between the start and end offsets """
+    with open(path, 'rb') as users_file:
+        users_file.seek(start)
+        while users_file.tell() < end:
+            line = users_file.readline()
+            if not line:
+                return
+            if line.strip():
+                yield json.loads(line.decode('utf-8'))
+
+
+class PartitionSummary(object):
+    """ Outcome of a partition, small enough to be pickled back to the parent cheaply """
+    __slots__ = ('partition', 'sent', 'failed', 'failed_ids', 'tracking_ids', 'seconds')
+
+    def __init__(self, partition, sent=0, failed=0, failed_ids=None, tracking_ids=None, seconds=0.0):
+        self.partition = partition
+        self.sent = sent
+        self.failed = failed
+        self.failed_ids = failed_ids or []
+        self.tracking_ids = tracking_ids or []
+        self.seconds = seconds
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class SyncSummary(object):
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.failed_ids = []
+        self.tracking_ids = []
+        self.partitions = []
+
+    def merge(self, partition_summary):
+        self.sent += partition_summary.sent
+        self.failed += partition_summary.failed
+        self.failed_ids.extend(partition_summary.failed_ids)
+        self.tracking_ids.extend(partition_summary.tracking_ids)
+        self.partitions.append(partition_summary)
+
+    def __repr__(self):
+        return '<SyncSummary sent={0} failed={1} partitions={2}>'.format(self.sent, self.failed, len(self.partitions))
+
+
+def _init_worker(client_token, api_url):
+    global _client
+    _client = CrossengageClient(client_token=client_token, session=requests.Session())
+    if api_url:
+        _client.API_URL = api_url
+
+
+def sync_partition(client, partition, transform=None, batch_size=BATCH_SIZE, use_async=True):
+    # type: (CrossengageClient, tuple, callable, int, bool) -> PartitionSummary
+    """
+    Send the users of a (path, start, end) partition in chunks.
+    With use_async a chunk fails when it is not accepted, without it the failed users of the response are listed.
+    A chunk whose call raises fails as a whole.
+    """
+    started = time.time()
+    summary = PartitionSummary(partition)
+    users = read_partition(*partition)
+    if transform is not None:
+        users = (transform(user) for user in users)
+
+    for chunk in chunked(users, batch_size):
+        try:
+            if use_async:
+                status_code, body = client.batch_process_async(update_list=chunk)
+                if status_code == 202:
+                    summary.tracking_ids.append(body['trackingId'])
+                    summary.sent += len(chunk)
+                    continue
+                failed_ids = [user.get('id') for user in chunk]
+            else:
+                status_code, body = client.batch_process(update_list=chunk)
+                results = (body or {}).get('updated') if status_code < 500 else None
+                if results is None:
+                    failed_ids = [user.get('id') for user in chunk]
+                else:
+                    failed_ids = [result.get('id') for result in results if not result.get('success')]
+        except Exception:
+            # no answer or not json, e.g. a connection error or an empty 5xx: the chunk failed, the partition goes on
+            failed_ids = [user.get('id') for user in chunk]
+        summary.sent += len(chunk) - len(failed_ids)
+        summary.failed += len(failed_ids)
+        summary.failed_ids.extend(failed_ids)
+
+    summary.seconds = time.time() - started
+    return summary
+
+
+def _sync_partition(args):
+    return sync_partition(_client, *args)
+
+
+class MultiprocessSync(object):
+    """
+    :param client_token: Crossengage token, every worker creates its own client with it
+    :param processes: number of worker processes, defaults to the number of cores
+    :param batch_size: max users per batch call
+    :param use_async: send through batch_process_async (v2) instead of batch_process (v1)
+    :param transform: module level function turning a parsed line into a Crossengage user dict
+    :param api_url: override of CrossengageClient.API_URL, for tests and benchmarks
+    """
+
+    def __init__(self, client_token, processes=None, batch_size=BATCH_SIZE, use_async=True, transform=None,
+                 api_url=None):
+        self.client_token = client_token
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.use_async = use_async
+        self.transform = transform
+        self.api_url = api_url
+
+    def sync_file(self, path, partitions=None):
+        # type: (str, int) -> SyncSummary
+        """
+        Sync a JSON lines user file.
+        :param path: file with one JSON user per line
+        :param partitions: number of byte ranges, defaults to 4 per process to even out slow ranges
+        :return: SyncSummary merged from the partition summaries
+        """
+        tasks = [(partition, self.transform, self.batch_size, self.use_async)
+                 for partition in file_partitions(path, partitions or self.processes * 4)]
+        summary = SyncSummary()
+        pool = multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                    initargs=(self.client_token, self.api_url))
+        try:
+            for partition_summary in pool.imap_unordered(_sync_partition, tasks):
+                summary.merge(partition_summary)
+        finally:
+            pool.close()
+            pool.join()
+        return summary
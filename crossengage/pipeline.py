@@ -0,0 +1,176 @@
+"""
+Pipelined bulk sync through batch_process_async.
+
+Waiting for a batch to be PROCESSED before submitting the next leaves the API processing queue and the client idle
+by turns. PipelinedSync keeps a window of submitted but unprocessed batches: the calling thread submits chunks
+while a poller thread tracks the pending ones and collects their outcomes. The window is an AdaptiveLimiter fed
+with the time each batch took to reach PROCESSED, it grows while that time stays flat and shrinks when the
+processing queue falls behind, so submissions slow down instead of piling up.
+
+Usage:
+
+ result = PipelinedSync(client, window=4, max_window=16).run(users)
+ print(result.results.summary(), result.failed_ids, result.window)
+"""
+from __future__ import absolute_import
+
+import sys
+import threading
+from collections import OrderedDict
+
+from crossengage.bulk import BATCH_SIZE, STAGE_PROCESSED, chunked
+from crossengage.records import BatchResults
+from crossengage.retry import RetryPolicy
+from crossengage.throttle import AdaptiveLimiter, monotonic
+
+
+class PendingBatch(object):
+    __slots__ = ('tracking_id', 'ids', 'submitted', 'stages')
+
+    def __init__(self, tracking_id, ids, submitted):
+        self.tracking_id = tracking_id
+        self.ids = ids
+        self.submitted = submitted
+        # seconds from submission to the first poll seeing each stage
+        self.stages = {}
+
+
+class PipelineResult(object):
+
+    def __init__(self):
+        self.results = BatchResults()
+        self.submitted = 0
+        self.failed_ids = []
+        self.timed_out = []
+        self.stage_timings = []
+        self.max_in_flight = 0
+        self.window = None
+
+    def __repr__(self):
+        return '<PipelineResult submitted={0} processed={1} failed={2} timed_out={3}>'.format(
+            self.submitted, len(self.results.tracking), len(self.failed_ids), len(self.timed_out))
+
+
+class PipelinedSync(object):
+    """
+    :param client: CrossengageClient
+    :param window: batches submitted but not PROCESSED to start with
+    :param max_window: largest window the pipeline grows to
+    :param batch_size: max users per batch_process_async call
+    :param poll_interval: seconds between two polls of the pending batches
+    :param timeout: seconds after which a batch not PROCESSED is given up, listed in timed_out, polls raising
+                    count as not PROCESSED
+    :param retry: RetryPolicy of the submissions and polls, defaults to RetryPolicy()
+    :param latency_tolerance: processing time / lowest processing time ratio shrinking the window, see
+                              crossengage.throttle.AdaptiveLimiter, None to keep the window to submission errors
+    """
+
+    def __init__(self, client, window=4, max_window=16, batch_size=BATCH_SIZE, poll_interval=1.0, timeout=300.0,
+                 retry=None, latency_tolerance=2.0):
+        self.client = client
+        self.limiter = AdaptiveLimiter(initial_limit=window, max_limit=max_window,
+                                       latency_tolerance=latency_tolerance)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+
+    def run(self, users, delete=False):
+        # type: (iterable, bool) -> PipelineResult
+        """
+        Submit users in chunks through batch_process_async and wait until every batch is processed.
+        :param users: iterable of user dicts, read lazily
+        :param delete: delete the users instead of updating them
+        """
+        result = PipelineResult()
+        pending = OrderedDict()
+        cond = threading.Condition()
+        state = {'submitting': True, 'error': None}
+        poller = threading.Thread(target=self._poll, args=(pending, cond, state, result))
+        poller.daemon = True
+        poller.start()
+
+        try:
+            for chunk in chunked(users, self.batch_size):
+                self.limiter.acquire()
+                if state['error'] is not None:
+                    self.limiter.release(0.0)
+                    break
+                self._submit(chunk, delete, pending, cond, result)
+        finally:
+            with cond:
+                state['submitting'] = False
+                cond.notify()
+            poller.join()
+
+        if state['error'] is not None:
+            raise state['error'][1]
+        result.window = self.limiter.limit
+        return result
+
+    def _submit(self, chunk, delete, pending, cond, result):
+        key = 'delete_list' if delete else 'update_list'
+        with self.client.tracer.start_span('crossengage.pipeline.chunk', {
+                'crossengage.users': len(chunk), 'crossengage.window': self.limiter.limit}):
+            started = monotonic()
+            try:
+                status_code, body = self.retry.call(self.client.batch_process_async, **{key: chunk})
+            except Exception:
+                # no answer, e.g. a connection error: a failed submission like a 5xx
+                status_code, body = 0, None
+        tracking_id = (body or {}).get('trackingId') if status_code == 202 else None
+        if tracking_id is None:
+            self.limiter.release(monotonic() - started, overloaded=True)
+            result.failed_ids.extend(user.get('id') for user in chunk)
+            return
+        with cond:
+            pending[tracking_id] = PendingBatch(tracking_id, [user.get('id') for user in chunk], started)
+            result.submitted += 1
+            result.max_in_flight = max(result.max_in_flight, len(pending))
+            cond.notify()
+
+    def _poll(self, pending, cond, state, result):
+        try:
+            while True:
+                with cond:
+                    while not pending and state['submitting']:
+                        cond.wait()
+                    if not pending:
+                        return
+                    batches = list(pending.values())
+                for batch in batches:
+                    self._track(batch, pending, cond, result)
+                with cond:
+                    if pending:
+                        cond.wait(self.poll_interval)
+        except Exception:
+            state['error'] = sys.exc_info()
+            with cond:
+                # unblock the submitting thread, it stops at its next chunk
+                for _ in pending:
+                    self.limiter.release(0.0)
+                pending.clear()
+
+    def _track(self, batch, pending, cond, result):
+        try:
+            _, body = self.retry.call(self.client.track_user_task, batch.tracking_id)
+        except Exception:
+            # no answer, e.g. a connection error: not PROCESSED yet, polled again until the timeout
+            body = None
+        elapsed = monotonic() - batch.submitted
+        stage = (body or {}).get('stage')
+        if stage is not None and stage not in batch.stages:
+            batch.stages[stage] = round(elapsed, 6)
+
+        if stage == STAGE_PROCESSED:
+            result.results.add_tracking(batch.tracking_id, body)
+            result.stage_timings.append(batch.stages)
+            # the time to PROCESSED is the backpressure signal of the window
+            self.limiter.release(elapsed)
+        elif elapsed >= self.timeout:
+            result.timed_out.append(batch.tracking_id)
+            self.limiter.release(elapsed, overloaded=True)
+        else:
+            return
+        with cond:
+            del pending[batch.tracking_id]
@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from crossengage.client import CrossengageClient
+from crossengage.throttle import Quota
+
+
+class ThrottledSession(object):
+    """
+    requests-like object sending through a shared session within a tenant quota. The quota is taken inside the
+    transport, after a PriorityScheduler slot, ClientPool gives the quota to its clients as middleware instead.
+    """
+
+    def __init__(self, session, quota):
+        self.session = session
+        self.quota = quota
+
+    def _request(self, method, url, **kwargs):
+        with self.quota:
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self._request('GET', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self._request('PUT', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._request('DELETE', url, **kwargs)
+
+
+class ClientPool(object):
+    """
+    Clients for many tokens / business units sharing one connection pool to the Crossengage API.
+
+    Each tenant gets its own CrossengageClient (so its own X-XNG-AuthToken header) and its own rate and
+    concurrency quota, so one tenant backfilling cannot starve the others. The quota is client middleware, a tenant
+    waiting for it holds no slot of a shared scheduler.
+
+    Usage:
+
+     pool = ClientPool(pool_maxsize=20, rate=50, max_concurrency=5)
+     pool.register('DE_TOKEN', business_unit='de', rate=200, max_concurrency=10)
+     pool.client('DE_TOKEN', business_unit='de').update_user(user={'id': '1', 'email': 'john@example.com'})
+     pool.client('AT_TOKEN', business_unit='at').send_events(events=[...], user_id='1')
+    """
+
+    def __init__(self, session=None, pool_maxsize=10, rate=None, max_concurrency=None, tracer=None, scheduler=None):
+        """
+        :param session: requests.Session shared by all tenants, one is created if missing
+        :param pool_maxsize: max connections kept open to the Crossengage API
+        :param rate: default max requests per second of a tenant
+        :param max_concurrency: default max requests in flight of a tenant
+        :param tracer: tracer given to every tenant client
+        :param scheduler: PriorityScheduler shared by every tenant client
+        """
+        if session is None:
+            session = requests.Session()
+            session.mount(CrossengageClient.API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize))
+        self.session = session
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.tracer = tracer
+        self.scheduler = scheduler
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register(self, client_token, business_unit=None, rate=None, max_concurrency=None):
+        # type: (str, str, float, int) -> CrossengageClient
+        """
+        Create the client of a tenant with its own quota, replacing any previous one.
+        :param client_token: Crossengage token of the tenant
+        :param business_unit: businessUnit of the tenant, part of the tenant key
+        :param rate: max requests per second, defaults to the pool rate
+        :param max_concurrency: max requests in flight, defaults to the pool max_concurrency
+        :return: CrossengageClient of the tenant
+        """
+        client = self._create_client(client_token, rate, max_concurrency)
+        with self._lock:
+            self._clients[(client_token, business_unit)] = client
+        return client
+
+    def client(self, client_token, business_unit=None):
+        # type: (str, str) -> CrossengageClient
+        """
+        Client of a tenant, registered with the pool default quota on first use.
+        """
+        with self._lock:
+            client = self._clients.get((client_token, business_unit))
+            if client is None:
+                client = self._clients[(client_token, business_unit)] = self._create_client(client_token)
+        return client
+
+    def _create_client(self, client_token, rate=None, max_concurrency=None):
+        quota = Quota(
+            rate=rate if rate is not None else self.rate,
+            max_concurrency=max_concurrency if max_concurrency is not None else self.max_concurrency,
+        )
+        return CrossengageClient(
+            client_token=client_token,
+            tracer=self.tracer,
+            scheduler=self.scheduler,
+            session=self.session,
+            middleware=[quota],
+        )
+
+    def tenants(self):
+        with self._lock:
+            return list(self._clients)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
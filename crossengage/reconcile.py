@@ -0,0 +1,228 @@
+"""
+Incremental sync of a local user table to Crossengage.
+
+A snapshot file keeps one `id<TAB>hash` line per user last synced, sorted by id. Reconciler merges it with the
+local users (sorted by id too) in one pass and only sends the inserts, updates and deletes through
+batch_process_async, so a nightly sync costs as much as the day's changes.
+
+Usage:
+
+ reconciler = Reconciler(client, snapshot_path='/var/lib/sync/crossengage.snapshot')
+ result = reconciler.sync(users_sorted_by_id)
+ print(result.inserted, result.updated, result.deleted, result.failed)
+"""
+from __future__ import absolute_import
+
+import hashlib
+import io
+import json
+import numbers
+import os
+
+from crossengage.bulk import BATCH_SIZE
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+UNCHANGED = 'unchanged'
+
+
+def record_hash(user):
+    """ Stable hash of a user dict """
+    encoded = json.dumps(user, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class Snapshot(object):
+    """ Sorted `id<TAB>hash` file of the users last synced """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        if not os.path.exists(self.path):
+            return
+        with io.open(self.path, encoding='utf-8') as snapshot_file:
+            for line in snapshot_file:
+                user_id, digest = line.rstrip('\n').split('\t')
+                yield user_id, digest
+
+    def writer(self):
+        return SnapshotWriter(self.path)
+
+
+class SnapshotWriter(object):
+    """ Writes a new snapshot next to the old one and replaces it on close, unless an error occurred """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self._file = io.open(self.tmp_path, 'w', encoding='utf-8')
+
+    def write(self, user_id, digest):
+        self._file.write(u'{0}\t{1}\n'.format(user_id, digest))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        if exc_type is None:
+            getattr(os, 'replace', os.rename)(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+
+def _is_integer(user_id):
+    return isinstance(user_id, numbers.Integral) and not isinstance(user_id, bool)
+
+
+def diff(users, snapshot, id_key=None):
+    """
+    Sorted merge of local users and snapshot entries, both sorted by id.
+    :param id_key: sort key of an id as written in the snapshot, defaults to int when the first local id is an
+                   integer, so integer ids are sorted numerically, and to str otherwise
+    :return: generator of (operation, user_id, user dict or None, new hash or None, old hash or None)
+    """
+    local = iter(users)
+    remote = iter(snapshot)
+    user = next(local, None)
+    entry = next(remote, None)
+    if id_key is None:
+        id_key = int if user is not None and _is_integer(user['id']) else str
+    previous_id = previous_key = None
+
+    while user is not None or entry is not None:
+        if user is not None:
+            user_id = str(user['id'])
+            user_key = id_key(user_id)
+            if previous_id is not None and user_key <= previous_key:
+                raise ValueError('local users must be sorted by id and unique, got {0} after {1}'.format(
+                    user_id, previous_id))
+        entry_key = id_key(entry[0]) if entry is not None else None
+
+        if entry is None or (user is not None and user_key < entry_key):
+            yield INSERT, user_id, user, record_hash(user), None
+            previous_id, previous_key, user = user_id, user_key, next(local, None)
+        elif user is None or entry_key < user_key:
+            yield DELETE, entry[0], None, None, entry[1]
+            entry = next(remote, None)
+        else:
+            digest = record_hash(user)
+            yield (UNCHANGED if digest == entry[1] else UPDATE), user_id, user, digest, entry[1]
+            previous_id, previous_key, user = user_id, user_key, next(local, None)
+            entry = next(remote, None)
+
+
+class ReconcileResult(object):
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.tracking_ids = []
+
+    @property
+    def changed(self):
+        return self.inserted + self.updated + self.deleted
+
+    def __repr__(self):
+        return '<ReconcileResult inserted={0} updated={1} deleted={2} unchanged={3} failed={4}>'.format(
+            self.inserted, self.updated, self.deleted, self.unchanged, self.failed)
+
+
+class Reconciler(object):
+    """
+    Keeps Crossengage a mirror of a local user table by sending only what changed since the last sync.
+    :param client: CrossengageClient
+    :param snapshot_path: path of the snapshot file, created on the first sync
+    :param batch_size: max users per batch_process_async call
+    :param max_pending: max snapshot entries held back while a batch fills up, a smaller batch is sent beyond it
+    :param id_key: sort key of an id as written in the snapshot, see diff(), keep it the same between syncs
+    """
+
+    def __init__(self, client, snapshot_path, batch_size=BATCH_SIZE, max_pending=100000, id_key=None):
+        self.client = client
+        self.snapshot = Snapshot(snapshot_path)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.id_key = id_key
+
+    def plan(self, users):
+        """ Changes between the snapshot and users, without sending anything """
+        return ((operation, user_id) for operation, user_id, _, _, _ in diff(users, self.snapshot, self.id_key)
+                if operation != UNCHANGED)
+
+    def sync(self, users):
+        # type: (iterable) -> ReconcileResult
+        """
+        Send the delta between the snapshot and users and write the new snapshot.
+        Users of a rejected batch, or of a call raising, keep their old snapshot entry, so they are sent again on
+        the next sync.
+        :param users: iterable of user dicts sorted by id, numerically for integer ids
+        :return: ReconcileResult
+        """
+        result = ReconcileResult()
+        # (operation, user_id, new hash, old hash) of the users in the current batch
+        pending = []
+        updates = []
+        deletes = []
+
+        with self.snapshot.writer() as writer:
+            for operation, user_id, user, digest, old_digest in diff(users, self.snapshot, self.id_key):
+                if operation == UNCHANGED:
+                    result.unchanged += 1
+                    # keep the snapshot sorted, unchanged users are written after the pending batch
+                    if not pending:
+                        writer.write(user_id, digest)
+                        continue
+                elif operation == DELETE:
+                    deletes.append({'id': user_id})
+                else:
+                    updates.append(user)
+                pending.append((operation, user_id, digest, old_digest))
+
+                if len(updates) + len(deletes) >= self.batch_size or len(pending) >= self.max_pending:
+                    self._submit(updates, deletes, pending, writer, result)
+                    pending, updates, deletes = [], [], []
+
+            if pending:
+                self._submit(updates, deletes, pending, writer, result)
+        return result
+
+    def _submit(self, updates, deletes, pending, writer, result):
+        accepted = True
+        if updates or deletes:
+            with self.client.tracer.start_span('crossengage.reconcile.chunk', {
+                'crossengage.updated': len(updates),
+                'crossengage.deleted': len(deletes),
+            }) as span:
+                try:
+                    status_code, body = self.client.batch_process_async(delete_list=deletes, update_list=updates)
+                except Exception:
+                    # no answer, e.g. a connection error or a deadline: rejected, the batches accepted before are
+                    # still written to the snapshot
+                    status_code, body = 0, None
+                span.set_attribute('http.status_code', status_code)
+            accepted = status_code == 202
+            if accepted:
+                result.tracking_ids.append(body['trackingId'])
+
+        for operation, user_id, digest, old_digest in pending:
+            if operation == UNCHANGED:
+                writer.write(user_id, digest)
+            elif not accepted:
+                result.failed += 1
+                if old_digest is not None:
+                    writer.write(user_id, old_digest)
+            elif operation == INSERT:
+                result.inserted += 1
+                writer.write(user_id, digest)
+            elif operation == UPDATE:
+                result.updated += 1
+                writer.write(user_id, digest)
+            else:
+                result.deleted += 1
@@ -0,0 +1,126 @@
+"""
+Compact records of batch_process results and tracking outcomes.
+
+A batch_process response dict per user costs several hundred bytes, mostly for the repeated `id`, `xngId`,
+`success` and `errors` keys. The slotted records below keep only the values, and equal errors share one tuple.
+
+Usage:
+
+ results = BatchResults(failures_only=True)
+ for chunk in chunks:
+     status_code, body = client.batch_process(update_list=chunk)
+     results.add(body)
+ print(results.summary(), results.error_counts())
+"""
+from __future__ import absolute_import
+
+from collections import Counter
+
+
+class UserResult(object):
+    """ Result of one user of a batch, errors is a tuple of (field, type) tuples """
+    __slots__ = ('id', 'xng_id', 'success', 'errors')
+
+    def __init__(self, id, xng_id, success, errors=()):
+        self.id = id
+        self.xng_id = xng_id
+        self.success = success
+        self.errors = errors
+
+    def to_dict(self):
+        result = {'id': self.id, 'xngId': self.xng_id, 'success': self.success}
+        if self.errors:
+            result['errors'] = [{'field': field, 'type': error_type} for field, error_type in self.errors]
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, UserResult) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<UserResult id={0!r} success={1!r} errors={2!r}>'.format(self.id, self.success, self.errors)
+
+
+class TrackingOutcome(object):
+    """ Last track_user_task answer of a batch_process_async call """
+    __slots__ = ('tracking_id', 'stage', 'total', 'success', 'error')
+
+    def __init__(self, tracking_id, stage=None, total=0, success=0, error=0):
+        self.tracking_id = tracking_id
+        self.stage = stage
+        self.total = total
+        self.success = success
+        self.error = error
+
+    @classmethod
+    def from_dict(cls, tracking_id, body):
+        body = body or {}
+        return cls(tracking_id, body.get('stage'), body.get('total', 0), body.get('success', 0),
+                   body.get('error', 0))
+
+
+class BatchResults(object):
+    """
+    Collects the per user results of batch_process responses and the outcomes of tracked batches.
+    :param failures_only: keep records of failed users only, successes are just counted
+    """
+
+    def __init__(self, failures_only=False):
+        self.failures_only = failures_only
+        self.updated = []
+        self.deleted = []
+        self.tracking = []
+        self.succeeded = 0
+        self.failed = 0
+        self._errors = {}
+
+    def _error_tuple(self, errors):
+        key = tuple((error.get('field'), error.get('type')) for error in errors or ())
+        return self._errors.setdefault(key, key)
+
+    def add(self, body):
+        """ Add the updated / deleted results of a batch_process json dict response """
+        body = body or {}
+        for name in ('updated', 'deleted'):
+            records = getattr(self, name)
+            for result in body.get(name) or ():
+                success = bool(result.get('success'))
+                if success:
+                    self.succeeded += 1
+                    if self.failures_only:
+                        continue
+                else:
+                    self.failed += 1
+                records.append(UserResult(
+                    result.get('id'), result.get('xngId'), success, self._error_tuple(result.get('errors'))))
+
+    def add_tracking(self, tracking_id, body):
+        """ Add a track_user_task json dict response """
+        outcome = TrackingOutcome.from_dict(tracking_id, body)
+        self.tracking.append(outcome)
+        return outcome
+
+    def failures(self):
+        return [record for record in self.updated + self.deleted if not record.success]
+
+    def failed_ids(self):
+        return [record.id for record in self.failures()]
+
+    def error_counts(self):
+        """ Counter of (field, type) error tuples over the failed users """
+        counts = Counter()
+        for record in self.failures():
+            counts.update(record.errors)
+        return counts
+
+    def summary(self):
+        return {
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'tracked': len(self.tracking),
+            'tracked_success': sum(outcome.success for outcome in self.tracking),
+            'tracked_error': sum(outcome.error for outcome in self.tracking),
+        }
@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+
+import re
+from collections import namedtuple
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # python 2
+    from collections import MutableMapping
+
+BatchSummary = namedtuple('BatchSummary', ['status_code', 'success_count', 'failed_ids'])
+
+_SUCCESS_FLAG = re.compile(br'"success"\s*:\s*(true|false)')
+
+
+class LazyResponse(MutableMapping):
+    """
+    dict-like json response, the body is only decoded when a key missing from the values set by the client
+    (status_code, success, errors) is read. Empty bodies are never decoded, a body that is not json decodes to
+    success False and a client_error.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self._values = {}
+        self._decoded = False
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def decoded(self):
+        return self._decoded
+
+    def _data(self):
+        if not self._decoded:
+            try:
+                body = self.response.json() if self.response.content else {}
+            except ValueError as e:
+                # not json, e.g. the html error page of a proxy, failed like the client does without lazy_responses
+                body = {}
+                self._values.update(success=False, errors={'client_error': str(e)})
+            body.update(self._values)
+            self._values = body
+            self._decoded = True
+        return self._values
+
+    def __getitem__(self, key):
+        if not self._decoded and key in self._values:
+            return self._values[key]
+        return self._data()[key]
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        del self._data()[key]
+
+    def __contains__(self, key):
+        return (not self._decoded and key in self._values) or key in self._data()
+
+    def __iter__(self):
+        return iter(self._data())
+
+    def __len__(self):
+        return len(self._data())
+
+    def __repr__(self):
+        return repr(self._data())
+
+
+class LazyBatchResponse(LazyResponse):
+    """ batch_process response whose summary() avoids decoding when every user succeeded """
+
+    def summary(self):
+        # type: () -> BatchSummary
+        """ Status code, number of successful users and ids of the failed users """
+        if not self._decoded:
+            flags = _SUCCESS_FLAG.findall(self.response.content or b'')
+            if b'false' not in flags:
+                return BatchSummary(self.status_code, len(flags), [])
+
+        results = list(self.get('updated') or []) + list(self.get('deleted') or [])
+        return BatchSummary(
+            self.status_code,
+            sum(1 for result in results if result.get('success')),
+            [result.get('id') for result in results if not result.get('success')],
+        )
@@ -0,0 +1,52 @@
+from __future__ import absolute_import
+
+import random
+import time
+
+from crossengage.deadline import remaining
+
+# status_code 0 is what the client returns when the request never got an answer
+RETRY_STATUS_CODES = (0, 429, 500, 502, 503, 504)
+
+
+def status_of(response):
+    """ status_code of a json dict response or of a (status_code, body) tuple """
+    if isinstance(response, tuple):
+        return response[0]
+    return response.get('status_code', 0)
+
+
+class RetryPolicy(object):
+    """
+    Retry client calls answered with a retryable status code, with exponential backoff and full jitter, as long as
+    the backoff ends before the deadline of the current thread, see crossengage.deadline.
+    :param max_retries: retries after the first attempt
+    :param backoff: base delay in seconds, attempt n waits up to backoff * 2 ** n
+    :param max_backoff: max delay in seconds
+    :param status_codes: status codes worth retrying
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=10.0, status_codes=RETRY_STATUS_CODES):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.status_codes = status_codes
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            response = func(*args, **kwargs)
+            if status_of(response) not in self.status_codes or attempt >= self.max_retries:
+                return response
+            delay = self.delay(attempt)
+            left = remaining()
+            if left is not None and left <= delay:
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+
+NO_RETRY = RetryPolicy(max_retries=0)
@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+
+import contextlib
+import threading
+from collections import deque
+
+from crossengage.deadline import DeadlineExceeded
+from crossengage.throttle import monotonic
+
+HIGH = 'high'
+LOW = 'low'
+
+
+class PriorityScheduler(object):
+    """
+    Hands out a fixed number of request slots to a high (real-time) and a low (bulk / backfill) lane.
+
+    Waiting high lane requests get the next free slot, except that after `high_weight` high grants in a row a
+    waiting low lane request gets one (weighted fair sharing), and a low lane request waiting longer than
+    `max_low_wait` seconds is served first (starvation protection).
+
+    Requests with a deadline, see crossengage.deadline, are rejected by admit() when their estimated wait for a slot
+    exceeds the time they have left, and give up waiting at their deadline. `rejected` and `expired` count them.
+
+    Usage:
+
+     scheduler = PriorityScheduler(slots=10)
+     client = CrossengageClient(client_token='...', scheduler=scheduler)
+     client.update_user_opt_out_status('123', 'MAIL')            # high lane
+     client.batch_process_async(update_list=users)              # low lane
+     with scheduler.lane(LOW):
+         client.update_user(user)                               # forced into the low lane
+    """
+
+    def __init__(self, slots, high_weight=4, max_low_wait=1.0):
+        if slots < 1:
+            raise ValueError('slots must be at least 1')
+        self.slots = slots
+        self.high_weight = high_weight
+        self.max_low_wait = max_low_wait
+        self.in_use = 0
+        self.granted = {HIGH: 0, LOW: 0}
+        self.rejected = {HIGH: 0, LOW: 0}
+        self.expired = {HIGH: 0, LOW: 0}
+        # moving average of the seconds a slot is held, for the wait estimate of admit()
+        self.hold_time = 0.0
+        self._high_streak = 0
+        self._waiting = {HIGH: deque(), LOW: deque()}
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def _next(self):
+        high, low = self._waiting[HIGH], self._waiting[LOW]
+        if low and (not high
+                    or self._high_streak >= self.high_weight
+                    or monotonic() - low[0][1] >= self.max_low_wait):
+            return LOW
+        if high:
+            return HIGH
+        return None
+
+    def estimated_wait(self, lane):
+        """ Seconds a request of the lane would wait for a slot, from the requests ahead and the average hold time """
+        with self._condition:
+            if self.in_use < self.slots and not self._waiting[HIGH] and not self._waiting[LOW]:
+                return 0.0
+            # the high lane goes first, low requests wait for the high ones too
+            ahead = len(self._waiting[HIGH]) + (len(self._waiting[LOW]) if lane == LOW else 0)
+            return (ahead + 1) * self.hold_time / self.slots
+
+    def admit(self, lane, deadline):
+        """ Raise DeadlineExceeded when the estimated wait of the lane ends after the monotonic() time deadline """
+        lane = self.lane_of(lane)
+        wait = self.estimated_wait(lane)
+        if monotonic() + wait >= deadline:
+            with self._condition:
+                self.rejected[lane] += 1
+            raise DeadlineExceeded('estimated wait for a {0} slot {1:.3f}s exceeds the deadline'.format(lane, wait),
+                                   rejected=True)
+
+    def acquire(self, lane, deadline=None):
+        ticket = (object(), monotonic())
+        with self._condition:
+            self._waiting[lane].append(ticket)
+            while self.in_use >= self.slots or self._next() != lane or self._waiting[lane][0] is not ticket:
+                timeout = None if deadline is None else deadline - monotonic()
+                if timeout is not None and timeout <= 0:
+                    self._waiting[lane].remove(ticket)
+                    self.expired[lane] += 1
+                    self._condition.notify_all()
+                    raise DeadlineExceeded('expired waiting for a {0} slot'.format(lane))
+                self._condition.wait(timeout)
+            self._waiting[lane].popleft()
+            self.in_use += 1
+            self.granted[lane] += 1
+            self._high_streak = self._high_streak + 1 if lane == HIGH else 0
+            self._condition.notify_all()
+
+    def release(self, held=None):
+        """ :param held: seconds the slot was held, feeds the wait estimate """
+        with self._condition:
+            self.in_use -= 1
+            if held is not None:
+                self.hold_time = held if not self.hold_time else 0.9 * self.hold_time + 0.1 * held
+            self._condition.notify_all()
+
+    def lane_of(self, lane=None):
+        """ Lane a request of the given lane goes to from the current thread, the one forced by lane() if any """
+        return getattr(self._local, 'lane', None) or lane or HIGH
+
+    @contextlib.contextmanager
+    def slot(self, lane=None, deadline=None):
+        """
+        Hold a request slot of the given lane, or of the lane forced by lane() on this thread.
+        :param deadline: monotonic() time after which to stop waiting, raising DeadlineExceeded
+        """
+        self.acquire(self.lane_of(lane), deadline)
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self.release(monotonic() - started)
+
+    @contextlib.contextmanager
+    def lane(self, lane):
+        """ Force every request of the current thread into the given lane """
+        previous = getattr(self._local, 'lane', None)
+        self._local.lane = lane
+        try:
+            yield
+        finally:
+            self._local.lane = previous
+
+    def waiting(self, lane):
+        with self._condition:
+            return len(self._waiting[lane])
@@ -0,0 +1,219 @@
+"""
+FIFO buffer of events or users in front of send_events / batch_process_async that spills to disk.
+
+Up to max_memory_items are kept in memory, past that watermark items are appended to JSON lines segment files in
+a local directory and read back, oldest first, once the memory part is drained. During an API outage memory stays
+bounded and items are kept on disk, a queue opened on the same directory after a restart picks up the segments left.
+A segment file read back into memory is only removed once all its items were popped, until then a `.offset` file
+next to it counts its popped items, so peeked but unsent items survive a restart.
+
+Usage:
+
+ queue = SpillQueue('/var/lib/worker/crossengage-buffer', max_memory_items=50000)
+ for user in users:
+     queue.put(user)
+
+ def submit(batch):
+     status_code, body = client.batch_process_async(update_list=batch)
+     return status_code == 202
+
+ drain(queue, submit, batch_size=BATCH_SIZE)  # stops at the first failed batch, it stays at the head of the queue
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import re
+import threading
+from collections import deque
+from itertools import islice
+
+from crossengage.bulk import BATCH_SIZE
+
+_SEGMENT = re.compile(r'^segment-(\d+)\.jsonl$')
+
+
+class SpillQueue(object):
+    """
+    Thread-safe FIFO queue of json serializable items, memory bounded by spilling to segment files.
+    :param directory: directory of the segment files, created if missing
+    :param max_memory_items: watermark of items kept in memory
+    :param segment_items: items per segment file, at most max_memory_items
+    """
+
+    def __init__(self, directory, max_memory_items=10000, segment_items=1000):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.segment_items = min(segment_items, max_memory_items)
+        self._memory = deque()
+        # [segment path or None for items never spilled, items left, items popped] of the memory items, in order
+        self._runs = deque()
+        self._segments = deque()
+        self._spilled = 0
+        self._writer = None
+        self._writer_items = 0
+        self._next_segment = 0
+        self._lock = threading.Lock()
+        self._recover()
+
+    def _recover(self):
+        numbers = sorted(int(match.group(1)) for match in map(_SEGMENT.match, os.listdir(self.directory)) if match)
+        for number in numbers:
+            path = self._segment_path(number)
+            with open(path) as segment:
+                self._spilled += sum(1 for _ in segment) - self._read_offset(path)
+            self._segments.append(path)
+        self._next_segment = numbers[-1] + 1 if numbers else 0
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, 'segment-{0:08d}.jsonl'.format(number))
+
+    @staticmethod
+    def _read_offset(path):
+        try:
+            with open(path + '.offset') as offset:
+                return int(offset.read())
+        except (IOError, OSError, ValueError):
+            return 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._memory) + self._spilled
+
+    @property
+    def in_memory(self):
+        return len(self._memory)
+
+    @property
+    def spilled(self):
+        """ Number of items in segment files """
+        return self._spilled
+
+    def put(self, item):
+        with self._lock:
+            # once anything is on disk new items go to disk as well, behind it
+            if not self._segments and len(self._memory) < self.max_memory_items:
+                self._memory.append(item)
+                if self._runs and self._runs[-1][0] is None:
+                    self._runs[-1][1] += 1
+                else:
+                    self._runs.append([None, 1, 0])
+                return
+            if self._writer is None or self._writer_items >= self.segment_items:
+                self._rotate()
+            self._writer.write(json.dumps(item) + '\n')
+            self._writer_items += 1
+            self._spilled += 1
+
+    def _rotate(self):
+        self._close_writer()
+        path = self._segment_path(self._next_segment)
+        self._next_segment += 1
+        self._writer = open(path, 'a')
+        self._writer_items = 0
+        self._segments.append(path)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _refill(self, wanted):
+        # load whole segments, oldest first, while they fit under the watermark
+        while self._segments and len(self._memory) < wanted and (
+                not self._memory or len(self._memory) + self.segment_items <= self.max_memory_items):
+            path = self._segments.popleft()
+            if self._writer is not None and self._writer.name == path:
+                self._close_writer()
+            popped = self._read_offset(path)
+            loaded = 0
+            with open(path) as segment:
+                for line in islice(segment, popped, None):
+                    self._spilled -= 1
+                    try:
+                        self._memory.append(json.loads(line))
+                    except ValueError:
+                        # line torn by a crash while it was written
+                        continue
+                    loaded += 1
+            if loaded:
+                # removed by _consume once its items are popped
+                self._runs.append([path, loaded, popped])
+            else:
+                self._remove_segment(path)
+
+    @staticmethod
+    def _remove_segment(path):
+        os.remove(path)
+        if os.path.exists(path + '.offset'):
+            os.remove(path + '.offset')
+
+    def _consume(self, count):
+        count = min(count, len(self._memory))
+        items = [self._memory.popleft() for _ in range(count)]
+        while count:
+            run = self._runs[0]
+            taken = min(count, run[1])
+            run[1] -= taken
+            run[2] += taken
+            count -= taken
+            if run[1] == 0:
+                self._runs.popleft()
+                if run[0] is not None:
+                    self._remove_segment(run[0])
+            elif run[0] is not None:
+                with open(run[0] + '.offset', 'w') as offset:
+                    offset.write(str(run[2]))
+        return items
+
+    def peek(self, max_items):
+        """ Up to max_items items from the head of the queue, left in the queue """
+        with self._lock:
+            self._refill(max_items)
+            return list(islice(self._memory, max_items))
+
+    def pop(self, count):
+        """ Remove count items from the head of the queue, after they were peeked """
+        with self._lock:
+            self._consume(count)
+
+    def get(self, max_items):
+        """ Remove and return up to max_items items from the head of the queue """
+        with self._lock:
+            self._refill(max_items)
+            return self._consume(max_items)
+
+    def flush(self):
+        """ Write buffered spilled items to their segment file """
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+
+    def close(self):
+        """ Close the segment file, items never spilled are lost, spilled items stay for the next queue """
+        with self._lock:
+            self._close_writer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def drain(queue, send, batch_size=BATCH_SIZE):
+    """
+    Send the queued items in FIFO batches until the queue is empty or a batch fails, a failed batch stays queued.
+    :param queue: SpillQueue
+    :param send: callable taking a list of items and returning True when they were accepted
+    :return: number of items sent
+    """
+    sent = 0
+    while True:
+        batch = queue.peek(batch_size)
+        if not batch or not send(batch):
+            return sent
+        queue.pop(len(batch))
+        sent += len(batch)
@@ -0,0 +1,103 @@
+"""
+Compiled payload templates for high volume event producers.
+
+A Template is a dict with Field placeholders for the values that change. Its constant parts are json encoded once,
+render() only encodes the field values and joins the fragments, no dict is built per event. events_body() wraps
+rendered events into a send_events body for CrossengageClient.send_encoded_events().
+
+Usage:
+
+ ORDER = Template({'event': 'Order', 'properties': {'sku': Field('sku'), 'price': Field('price'), 'currency': 'EUR'}})
+
+ events = [ORDER.render(sku=item.sku, price=item.price) for item in basket]
+ client.send_encoded_events(events, user_id='123', business_unit='de')
+
+render() gives the same string as json.dumps of the filled in dict.
+"""
+from __future__ import absolute_import
+
+import json
+import re
+from json.encoder import encode_basestring_ascii
+
+# str and unicode on python 2
+string_types = (str, type(u''))
+
+_MARKER = '\x00field:{0}\x00'
+_MARKERS = re.compile(r'"\\u0000field:(.*?)\\u0000"')
+
+
+class Field(object):
+    """ Placeholder of a variable value in a Template """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Field({0!r})'.format(self.name)
+
+
+def _encode_float(value):
+    # nan and infinity, as json.dumps writes them
+    return float.__repr__(value) if value == value and value not in (_INFINITY, -_INFINITY) else json.dumps(value)
+
+
+_INFINITY = float('inf')
+# exact types only, subclasses (bool of int, enums...) go through json.dumps
+_ENCODERS = {
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+for _string_type in string_types:
+    _ENCODERS[_string_type] = encode_basestring_ascii
+
+
+def encode_value(value):
+    """ json encoding of one value, the C string encoder and repr skip the json.dumps machinery """
+    encoder = _ENCODERS.get(type(value))
+    return encoder(value) if encoder is not None else json.dumps(value)
+
+
+class Template(object):
+    """
+    json document with Field placeholders, compiled into constant fragments.
+    :param document: dict / list of json values and Field placeholders
+    """
+
+    def __init__(self, document):
+        encoded = json.dumps(document, default=self._placeholder)
+        fragments = _MARKERS.split(encoded)
+        # constants at even indexes, field names at odd ones
+        self.fields = tuple(fragments[1::2])
+        self._format = '%s'.join(fragment.replace('%', '%%') for fragment in fragments[::2])
+
+    @staticmethod
+    def _placeholder(value):
+        if isinstance(value, Field):
+            return _MARKER.format(value.name)
+        raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+    def render(self, **values):
+        """ json string of the document with the field values filled in, KeyError for a missing field """
+        return self._format % tuple([encode_value(values[name]) for name in self.fields])
+
+    def render_values(self, *values):
+        """ render() with the values given in the order of self.fields, the fastest way """
+        if len(values) != len(self.fields):
+            raise ValueError('{0} values expected for {1}'.format(len(self.fields), self.fields))
+        return self._format % tuple([encode_value(value) for value in values])
+
+
+def events_body(events, email=None, user_id=None, business_unit=None):
+    """ send_events request body of json encoded events, same as json.dumps of the send_events payload """
+    parts = ['{"events": [', ', '.join(events), ']']
+    if email is not None:
+        parts.append(', "email": ' + encode_value(email))
+    if user_id is not None:
+        parts.append(', "id": ' + encode_value(user_id))
+    if business_unit is not None:
+        parts.append(', "businessUnit": ' + encode_value(business_unit))
+    parts.append('}')
+    return ''.join(parts)
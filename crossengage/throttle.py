@@ -0,0 +1,178 @@
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import deque
+
+from crossengage.retry import RETRY_STATUS_CODES, status_of
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class RateLimiter(object):
+    """
+    Token bucket allowing `rate` calls per second with bursts of up to `burst` calls.
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Quota(object):
+    """
+    Rate and concurrency quota, used as a context manager around each request or as client middleware. As
+    middleware it is taken before the request waits for a PriorityScheduler slot, so a request waiting for its quota
+    holds no slot other clients of the scheduler need.
+    :param rate: max requests per second, None for unlimited
+    :param max_concurrency: max requests in flight, None for unlimited
+    """
+
+    def __init__(self, rate=None, max_concurrency=None):
+        self.rate_limiter = RateLimiter(rate) if rate else None
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def __enter__(self):
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.semaphore is not None:
+            self.semaphore.release()
+        return False
+
+    def __call__(self, request, call_next):
+        with self:
+            return call_next(request)
+
+
+def is_overload(response):
+    """ True for json dict or (status_code, body) responses saying the API is overloaded or unreachable """
+    if not isinstance(response, tuple) and not hasattr(response, 'get'):
+        return False
+    return status_of(response) in RETRY_STATUS_CODES
+
+
+class AdaptiveLimiter(object):
+    """
+    Concurrency limit adjusted from the calls made through it, additive increase / multiplicative decrease.
+
+    Every call answered in time while the limit was used up raises the limit by 1 / limit, so by about one per round
+    trip. An overload answer (429, 5xx, no answer) or a smoothed latency above latency_tolerance times the lowest
+    recent latency multiplies it by backoff, once per round trip. Share one limiter between every path sending to
+    the same API, acquire() blocks while `limit` calls are in flight.
+
+    :param initial_limit: limit to start from
+    :param min_limit: lowest limit
+    :param max_limit: highest limit, callers need at least as many threads to reach it
+    :param backoff: factor applied to the limit on overload
+    :param latency_tolerance: smoothed latency / lowest latency ratio counted as overload, None to ignore latency
+    :param window: number of latencies the lowest one is taken from
+    :param on_change: callable taking the new limit, called when it changes, e.g. to update a gauge metric
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, backoff=0.5, latency_tolerance=2.0, window=100,
+                 on_change=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.on_change = on_change
+        self._limit = float(max(min_limit, min(max_limit, initial_limit)))
+        self._in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._smoothed = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        # counters
+        self.calls = 0
+        self.overloads = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        """ End of a call started with acquire() """
+        with self._cond:
+            before = int(self._limit)
+            saturated = self._in_flight >= before
+            self._in_flight -= 1
+            self.calls += 1
+            if not overloaded:
+                # rejections are answered fast, only accepted calls tell the latency of the API
+                self._smoothed = latency if self._smoothed is None else 0.9 * self._smoothed + 0.1 * latency
+                if self.latency_tolerance and self._latencies:
+                    overloaded = self._smoothed > self.latency_tolerance * min(self._latencies)
+                self._latencies.append(latency)
+
+            if overloaded:
+                self.overloads += 1
+                now = monotonic()
+                # a burst of overload answers is one congestion signal
+                if now - self._last_decrease >= (self._smoothed or latency):
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+            elif saturated:
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            limit = int(self._limit)
+            # wake as many waiters as there are free slots, not every thread of a large pool
+            if limit > self._in_flight:
+                self._cond.notify(limit - self._in_flight)
+
+        if limit != before and self.on_change is not None:
+            self.on_change(limit)
+
+    def call(self, func, *args, **kwargs):
+        """ func(*args, **kwargs) within the limit, its response and latency adjust the limit """
+        self.acquire()
+        started = monotonic()
+        try:
+            response = func(*args, **kwargs)
+        except Exception:
+            self.release(monotonic() - started, overloaded=True)
+            raise
+        self.release(monotonic() - started, overloaded=is_overload(response))
+        return response
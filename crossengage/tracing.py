@@ -0,0 +1,153 @@
+from __future__ import absolute_import
+
+import contextlib
+import functools
+import threading
+import time
+
+
+class NoopSpan(object):
+    """ Span that records nothing, used when tracing is disabled """
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class NoopTracer(object):
+    """ Default tracer of the client, every span is a no-op """
+
+    def start_span(self, name, attributes=None):
+        return NOOP_SPAN
+
+    def current_span(self):
+        return NOOP_SPAN
+
+    def activate(self, span):
+        return NOOP_SPAN
+
+
+class Span(object):
+    """ Finished spans keep name, parent, attributes and start / end times (seconds) """
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_time = time.time()
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.attributes['error'] = repr(exc_value)
+        self.end_time = time.time()
+        self.tracer._pop(self)
+        return False
+
+
+class InMemoryTracer(object):
+    """
+    Tracer keeping every finished span in memory, meant for tests and local profiling.
+
+    Usage:
+
+     tracer = InMemoryTracer()
+     client = CrossengageClient(client_token='...', tracer=tracer)
+     client.get_user({'id': '123'})
+     [(span.name, span.duration) for span in tracer.spans]
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _push(self, span):
+        self._stack().append(span)
+
+    def _pop(self, span):
+        self._stack().remove(span)
+        with self._lock:
+            self.spans.append(span)
+
+    def start_span(self, name, attributes=None):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        return Span(self, name, parent=parent, attributes=attributes)
+
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else NOOP_SPAN
+
+    @contextlib.contextmanager
+    def activate(self, span):
+        """ Make span, started on another thread, the current span of this thread, without finishing it """
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+
+    def find(self, name):
+        """ Finished spans with the given name """
+        return [span for span in self.spans if span.name == name]
+
+    def clear(self):
+        with self._lock:
+            del self.spans[:]
+
+
+class OpenTelemetryTracer(object):
+    """ Adapter exposing an opentelemetry.trace.Tracer through the client tracer interface """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def start_span(self, name, attributes=None):
+        return self.tracer.start_as_current_span(name, attributes=attributes)
+
+    def current_span(self):
+        from opentelemetry import trace
+        return trace.get_current_span()
+
+    def activate(self, span):
+        from opentelemetry import trace
+        return trace.use_span(span, end_on_exit=False)
+
+
+def traced(method):
+    """ Wrap a client method into a crossengage.<method name> span of the client tracer """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.tracer.start_span('crossengage.' + method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,154 @@
+"""
+Request pipeline of the Crossengage client.
+
+Every client call builds a Request and hands it to the client middleware, in order, and finally to the transport.
+A middleware is a callable taking the Request and the next handler of the chain:
+
+ def timing(request, call_next):
+     started = time.time()
+     response = call_next(request)
+     print(request.method, request.url, time.time() - started)
+     return response
+
+ client = CrossengageClient(client_token='YOUR_TOKEN', middleware=[timing], transport=InMemoryTransport())
+
+Middleware run before the payload is encoded, request.body is only set by the client when they call call_next.
+"""
+from __future__ import absolute_import
+
+import json
+import re
+
+
+class Request(object):
+    """
+    :param method: one of CrossengageClient.REQUEST_GET / PUT / POST / DELETE
+    :param url: full url
+    :param headers: dict of headers
+    :param payload: json payload, None for GET
+    :param lane: scheduling lane, see crossengage.scheduling
+    :param timeout: seconds
+    :param deadline: monotonic() time after which the request is dropped instead of sent, see crossengage.deadline
+    """
+
+    def __init__(self, method, url, headers, payload=None, lane=None, timeout=30, deadline=None):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.payload = payload
+        self.lane = lane
+        self.timeout = timeout
+        self.deadline = deadline
+        # encoded payload, set by the client or by a middleware that encodes itself
+        self.body = None
+        # span of the client call, the spans of a request sent from another thread are parented to it
+        self.span = None
+
+    def __repr__(self):
+        return '<Request {0} {1}>'.format(self.method.upper(), self.url)
+
+
+class Transport(object):
+    """ Sends an encoded Request, returns a response with status_code, text, content, json() and request """
+
+    def send(self, request):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """ Sends through a requests-like object: the requests module, a requests.Session or an Http2Session """
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def send(self, request):
+        send = getattr(self.requests, request.method)
+        if request.body is None:
+            return send(request.url, headers=request.headers, timeout=request.timeout)
+        return send(request.url, data=request.body, headers=request.headers, timeout=request.timeout)
+
+    def close(self):
+        if hasattr(self.requests, 'close'):
+            self.requests.close()
+
+
+class InMemoryRequest(object):
+
+    def __init__(self, request):
+        self.url = request.url
+        self.headers = request.headers
+        self.body = request.body
+
+
+class InMemoryResponse(object):
+    """ Response of the InMemoryTransport, with the requests.Response attributes used by the client """
+
+    def __init__(self, status_code, body=None, request=None):
+        self.status_code = status_code
+        self.request = request
+        self._body = body
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = json.dumps(self._body).encode('utf-8') if self._body is not None else b''
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        if self._body is None:
+            raise ValueError('No JSON object could be decoded')
+        # the client adds keys to the response, so it gets its own copy of the top level dict
+        return dict(self._body)
+
+
+_TRACK = re.compile(r'/users/track/[^/?]+$')
+_USER = re.compile(r'/users/(?P<id>[^/?]+)$')
+
+
+def default_handler(request):
+    """ Canned answers of the main endpoints, 200 {"success": true} for everything else """
+    path = request.url.split('?', 1)[0]
+    v2 = request.headers.get('X-XNG-ApiVersion') == '2'
+    if _TRACK.search(path):
+        return 200, {'stage': 'PROCESSED', 'total': 1, 'success': 1, 'error': 0}
+    if v2 and request.method != 'get':
+        import uuid
+        return 202, {'trackingId': str(uuid.uuid4())}
+    if path.endswith('/users/batch'):
+        payload = request.payload or {}
+        return 200, dict((name, [{'id': user.get('id'), 'success': True} for user in payload.get(name, [])])
+                         for name in ('updated', 'deleted'))
+    match = _USER.search(path)
+    if match and request.method == 'get':
+        return 200, {'id': match.group('id')}
+    if request.method == 'delete':
+        return 204, None
+    return 200, {'success': True}
+
+
+class InMemoryTransport(Transport):
+    """
+    Answers requests in memory, for tests and benchmarks of the client itself.
+    :param handler: callable taking the Request and returning (status_code, json body or None),
+                    defaults to default_handler
+    :param record: keep every sent Request in self.sent
+    """
+
+    def __init__(self, handler=default_handler, record=True):
+        self.handler = handler
+        self.record = record
+        self.sent = []
+
+    def send(self, request):
+        if self.record:
+            self.sent.append(request)
+        status_code, body = self.handler(request)
+        return InMemoryResponse(status_code, body, InMemoryRequest(request))
@@ -1,5 +1,23 @@
+REDACTED = '***'
+
+
 def update_dict(old_dict, values):
     """ Update dictionary without change the original object """
     new_dict = old_dict.copy()
     new_dict.update(values)
     return new_dict
+
+
+def redact_headers(headers, names):
+    """ Copy headers replacing the values of the given header names (case insensitive) """
+    names = set(name.lower() for name in names)
+    return dict((key, REDACTED if key.lower() in names else value) for key, value in headers.items())
+
+
+def truncate(value, limit):
+    """ Shorten a str / bytes value to limit characters, marking how much was cut off """
+    if value is None or len(value) <= limit:
+        return value
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    return '{0}...<{1} more>'.format(value[:limit], len(value) - limit)
@@ -0,0 +1,200 @@
+"""
+Connection pre-warming for short-lived workers.
+
+warm_session() builds a requests.Session whose connections resolve hosts through a DNS cache with a TTL and resume
+TLS sessions of earlier connections, warm_up() opens and handshakes pooled connections concurrently so the first
+calls of a job do not pay DNS, TCP and TLS setup one after the other.
+
+Usage:
+
+ client = CrossengageClient(client_token='YOUR_TOKEN', session=warm_session(pool_maxsize=8))
+ client.warmup(n_connections=8)
+"""
+from __future__ import absolute_import
+
+import select
+import socket
+import ssl
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from crossengage.throttle import monotonic
+
+# TLS session resumption needs python 3.6+, older ones get plain pooled sessions from warm_session()
+HAS_TLS_SESSIONS = hasattr(ssl, 'PROTOCOL_TLS_CLIENT') and hasattr(ssl.SSLSocket, 'session')
+
+
+class CachingResolver(object):
+    """ getaddrinfo results cached for ttl seconds, first address wins """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        now = monotonic()
+        with self._lock:
+            cached = self._cache.get((host, port))
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+        with self._lock:
+            self._cache[(host, port)] = (address, now + self.ttl)
+        return address
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """ SSLContext offering the last TLS session of a host to its next connections """
+
+    def __init__(self, *args, **kwargs):
+        super(ResumingSSLContext, self).__init__()
+        self._sessions = {}
+        self.resumed = 0
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        host = kwargs.get('server_hostname')
+        if HAS_TLS_SESSIONS and kwargs.get('session') is None and host in self._sessions:
+            kwargs['session'] = self._sessions[host]
+        ssl_sock = super(ResumingSSLContext, self).wrap_socket(sock, *args, **kwargs)
+        if getattr(ssl_sock, 'session_reused', False):
+            self.resumed += 1
+        self.remember(ssl_sock)
+        return ssl_sock
+
+    def remember(self, ssl_sock):
+        session = getattr(ssl_sock, 'session', None)
+        if session is not None and getattr(ssl_sock, 'server_hostname', None):
+            self._sessions[ssl_sock.server_hostname] = session
+
+
+def _settle(sock, wait=0.05):
+    """
+    Process the session tickets a TLS 1.3 server sends after the handshake. Unread, they make the idle connection
+    look dropped to urllib3, and the session they carry is the one that can be resumed.
+    """
+    if not isinstance(sock, ssl.SSLSocket):
+        return
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        while select.select([sock], [], [], wait)[0]:
+            try:
+                if not sock.recv(1):
+                    break
+            except ssl.SSLWantReadError:
+                pass
+    finally:
+        sock.settimeout(timeout)
+    if HAS_TLS_SESSIONS and isinstance(sock.context, ResumingSSLContext):
+        sock.context.remember(sock)
+
+
+def create_ssl_context():
+    """ ResumingSSLContext, a default context without TLS session support """
+    if not HAS_TLS_SESSIONS:
+        return ssl.create_default_context()
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_default_certs()
+    return context
+
+
+def _resolving(connection_class, resolver):
+    class ResolvingConnection(connection_class):
+        def _new_conn(self):
+            host = self._dns_host
+            self._dns_host = resolver.resolve(host, self.port)
+            try:
+                return super(ResolvingConnection, self)._new_conn()
+            finally:
+                self._dns_host = host
+    return ResolvingConnection
+
+
+class WarmHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with cached DNS resolution and TLS session resumption.
+    :param resolver: CachingResolver, shared by every connection of the adapter
+    :param ssl_context: ResumingSSLContext, shared by every connection of the adapter
+    """
+
+    def __init__(self, resolver=None, ssl_context=None, **kwargs):
+        self.resolver = resolver or CachingResolver()
+        self.ssl_context = ssl_context or create_ssl_context()
+        self.pool_classes = {
+            'http': type('ResolvingHTTPConnectionPool', (HTTPConnectionPool,), {
+                'ConnectionCls': _resolving(HTTPConnection, self.resolver)}),
+            'https': type('ResolvingHTTPSConnectionPool', (HTTPSConnectionPool,), {
+                'ConnectionCls': _resolving(HTTPSConnection, self.resolver)}),
+        }
+        super(WarmHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        super(WarmHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.pool_classes
+
+    def __setstate__(self, state):
+        super(WarmHTTPAdapter, self).__setstate__(state)
+        self.poolmanager.pool_classes_by_scheme = self.pool_classes
+
+
+def warm_session(pool_maxsize=10, dns_ttl=300.0):
+    # type: (int, float) -> requests.Session
+    """ requests.Session whose http(s) connections use a WarmHTTPAdapter, a plain HTTPAdapter before python 3.6 """
+    session = requests.Session()
+    if HAS_TLS_SESSIONS:
+        adapter = WarmHTTPAdapter(resolver=CachingResolver(ttl=dns_ttl), pool_connections=1,
+                                  pool_maxsize=pool_maxsize)
+    else:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def warm_up(session, url, n_connections, verify=None):
+    # type: (requests.Session, str, int, bool) -> int
+    """
+    Concurrently open n_connections pooled connections to url and put them back into the session pool.
+    :param verify: as the verify argument of requests, defaults to what session.request() would use
+    :return: number of connections opened
+    """
+    if verify is None:
+        # environment settings (REQUESTS_CA_BUNDLE...) pick the pool as well
+        verify = session.merge_environment_settings(url, {}, None, None, None)['verify']
+    adapter = session.get_adapter(url)
+    # the same pool requests.Session.send() picks
+    if hasattr(adapter, 'get_connection_with_tls_context'):
+        pool = adapter.get_connection_with_tls_context(requests.Request('GET', url).prepare(), verify)
+    else:
+        pool = adapter.get_connection(url)
+    adapter.cert_verify(pool, url, verify, None)
+
+    connections = [pool._get_conn() for _ in range(n_connections)]
+    opened = []
+
+    def connect(connection):
+        try:
+            connection.connect()
+            _settle(connection.sock)
+            opened.append(connection)
+        except Exception:
+            connection.close()
+
+    threads = [threading.Thread(target=connect, args=(connection,)) for connection in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for connection in connections:
+        pool._put_conn(connection)
+    return len(opened)
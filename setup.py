@@ -11,6 +11,9 @@ EXTRAS = {
     'dev': [
         'tox',
     ],
+    'http2': [
+        'httpx[http2]',
+    ],
 }
 
 setup(
@@ -21,7 +24,7 @@ setup(
     keywords=["HelloFresh", "Crossengage", "CRM"],
     install_requires=REQUIRES,
     extras_require=EXTRAS,
-    packages=find_packages(exclude=('tests',)),
+    packages=find_packages(exclude=('tests', 'benchmarks')),
     license='MIT',
     classifiers=[
         'License :: OSI Approved :: MIT License',
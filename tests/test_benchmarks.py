@@ -0,0 +1,70 @@
+import unittest
+
+from benchmarks.run import compare, percentile
+from benchmarks.stub_server import StubServer
+from crossengage.client import CrossengageClient
+
+
+class TestStubServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(seed=1).start()
+        self.client = CrossengageClient(client_token='SOME_TOKEN')
+        self.client.API_URL = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_user_endpoints(self):
+        self.assertEqual('1', self.client.get_user({'id': '1'})['id'])
+        self.assertTrue(self.client.update_user({'id': '1', 'email': 'a@example.com'})['success'])
+        self.assertEqual(204, self.client.delete_user({'id': '1'})['status_code'])
+        self.assertEqual(202, self.client.delete_user_async({'id': '1'})['status_code'])
+        self.assertFalse(self.client.get_user_opt_out_status('1')['optOut'])
+        self.assertTrue(self.client.update_user_opt_out_status('1', 'MAIL')['optOut'])
+        self.assertEqual(200, self.client.send_events([{'foo': 'bar'}], user_id='1')['status_code'])
+
+        self.assertEqual({'get_user': 1, 'put_user': 1, 'delete_user': 2, 'get_opt_out': 1, 'put_opt_out': 1,
+                          'events': 1}, self.server.requests)
+
+    def test_batch_and_tracking(self):
+        status_code, body = self.client.batch_process(update_list=[{'id': '1'}], delete_list=[{'id': '2'}])
+        self.assertEqual(200, status_code)
+        self.assertEqual(['1'], [user['id'] for user in body['updated']])
+
+        status_code, body = self.client.batch_process_async(update_list=[{'id': '1'}], delete_list=[{'id': '2'}])
+        self.assertEqual(202, status_code)
+
+        status_code, body = self.client.track_user_task(body['trackingId'])
+        self.assertEqual((200, 'PROCESSED', 2), (status_code, body['stage'], body['total']))
+
+    def test_fault_injection(self):
+        self.server.error_rate = 0.5
+        self.server.throttle_rate = 0.5
+
+        statuses = set(self.client.get_user({'id': str(i)})['status_code'] for i in range(10))
+
+        self.assertEqual({429, 500}, statuses)
+
+    def test_slow_requests_independent_of_faults(self):
+        self.server.error_rate = 0.3
+        self.server.slow_rate = 0.3
+
+        draws = [(self.server.delay() == self.server.slow_latency, self.server.fault() == 500) for _ in range(200)]
+
+        self.assertNotEqual([slow for slow, _ in draws], [faulted for _, faulted in draws])
+        self.assertTrue(any(slow and not faulted for slow, faulted in draws))
+
+
+class TestBenchmarkReport(unittest.TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(0.0, percentile([], 99))
+        self.assertEqual(50, percentile(range(101), 50))
+        self.assertEqual(99, percentile(range(101), 99))
+
+    def test_compare(self):
+        baseline = {'fast': {'ops_per_sec': 100.0}, 'slow': {'ops_per_sec': 100.0}}
+        results = {'fast': {'ops_per_sec': 80.0}, 'slow': {'ops_per_sec': 60.0}, 'new': {'ops_per_sec': 1.0}}
+
+        self.assertEqual(['slow'], compare(results, baseline, tolerance=0.3))
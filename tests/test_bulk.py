@@ -0,0 +1,33 @@
+import unittest
+
+import mock
+from mock import Mock
+
+from crossengage.bulk import chunked, wait_for_tracking
+
+
+class TestBulk(unittest.TestCase):
+
+    def test_chunked(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(chunked(iter(range(5)), 2)))
+        self.assertEqual([], list(chunked([], 2)))
+
+    @mock.patch('crossengage.bulk.time.sleep')
+    def test_wait_for_tracking(self, sleep):
+        client = Mock()
+        client.track_user_task.side_effect = [
+            (200, {'stage': 'QUEUED'}),
+            (404, None),
+            (200, {'stage': 'PROCESSED', 'total': 2}),
+        ]
+
+        self.assertEqual((200, {'stage': 'PROCESSED', 'total': 2}), wait_for_tracking(client, 'tracking'))
+        self.assertEqual(2, sleep.call_count)
+
+    @mock.patch('crossengage.bulk.time.sleep')
+    def test_wait_for_tracking_timeout(self, sleep):
+        client = Mock()
+        client.track_user_task.return_value = (200, {'stage': 'QUEUED'})
+
+        self.assertEqual((200, {'stage': 'QUEUED'}), wait_for_tracking(client, 'tracking', timeout=0))
+        self.assertFalse(sleep.called)
@@ -0,0 +1,127 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+from benchmarks.stub_server import StubServer
+from crossengage.capture import Replayer, TrafficRecorder, endpoint_of, read_capture
+from crossengage.client import CrossengageClient
+from crossengage.transport import InMemoryTransport
+
+
+class TestTrafficRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.capture = io.StringIO()
+        self.recorder = TrafficRecorder(self.capture)
+        self.client = CrossengageClient(client_token='SECRET_TOKEN', transport=InMemoryTransport(),
+                                        middleware=[self.recorder])
+
+    def records(self):
+        return [json.loads(line) for line in self.capture.getvalue().splitlines()]
+
+    def test_records_requests(self):
+        self.client.update_user({'id': '1', 'email': 'a@example.com'})
+        self.client.get_user({'id': '1'})
+
+        put, get = self.records()
+        self.assertEqual(('put', '/users/1', 200), (put['method'], put['endpoint'], put['status']))
+        self.assertEqual({'id': '1', 'email': 'a@example.com'}, put['body'])
+        self.assertEqual(len(json.dumps({'id': '1', 'email': 'a@example.com'})), put['size'])
+        self.assertEqual(0.0, put['t'])
+        self.assertGreaterEqual(get['t'], 0.0)
+        self.assertNotIn('body', get)
+        self.assertEqual('2', get['headers']['X-XNG-ApiVersion'])
+        self.assertEqual(2, self.recorder.recorded)
+
+    def test_token_redacted(self):
+        self.client.update_user({'id': '1'})
+
+        self.assertNotIn('SECRET_TOKEN', self.capture.getvalue())
+        self.assertEqual('***', self.records()[0]['headers']['X-XNG-AuthToken'])
+
+    def test_without_bodies(self):
+        self.recorder.record_bodies = False
+        self.client.update_user({'id': '1'})
+
+        record, = self.records()
+        self.assertNotIn('body', record)
+        self.assertEqual(len('{"id": "1"}'), record['size'])
+
+    def test_failed_request_recorded(self):
+        def handler(request):
+            raise ValueError('down')
+        self.client.transport = InMemoryTransport(handler=handler)
+
+        self.client.update_user({'id': '1'})
+        self.assertEqual(0, self.records()[0]['status'])
+
+    def test_endpoint_of(self):
+        self.assertEqual('/users/1/optout-status?channelType=MAIL',
+                         endpoint_of('https://api.crossengage.io/users/1/optout-status?channelType=MAIL'))
+
+
+class TestReplayer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.jsonl.gz')
+        with gzip.open(self.path, 'wt') as capture:
+            recorder = TrafficRecorder(capture)
+            client = CrossengageClient(client_token='SECRET_TOKEN', transport=InMemoryTransport(),
+                                       middleware=[recorder])
+            for i in range(5):
+                client.update_user({'id': str(i)})
+                client.get_user({'id': str(i)})
+                time.sleep(0.01)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay_against_stub(self):
+        with StubServer() as server:
+            client = CrossengageClient(client_token='REPLAY_TOKEN', session=requests.Session())
+            client.API_URL = server.url
+
+            result = Replayer(client, speed=None).replay(self.path)
+
+            self.assertEqual(10, result.sent)
+            self.assertEqual({200: 10}, dict(result.status_codes))
+            self.assertEqual((5, 5), (server.requests['get_user'], server.requests['put_user']))
+
+    def test_replay_uses_client_token_and_pace(self):
+        transport = InMemoryTransport()
+        client = CrossengageClient(client_token='REPLAY_TOKEN', transport=transport)
+        records = list(read_capture(self.path))
+
+        started = time.time()
+        result = Replayer(client, speed=1).replay(records)
+
+        self.assertGreaterEqual(time.time() - started, records[-1]['t'])
+        self.assertEqual(10, result.sent)
+        self.assertEqual({'REPLAY_TOKEN'}, set(request.headers['X-XNG-AuthToken'] for request in transport.sent))
+        self.assertEqual([record['endpoint'] for record in records],
+                         [request.url[len(client.API_URL):] for request in transport.sent])
+        self.assertEqual({'id': '0'}, json.loads(transport.sent[0].body))
+
+    def test_faster_replay(self):
+        client = CrossengageClient(client_token='REPLAY_TOKEN', transport=InMemoryTransport())
+        records = list(read_capture(self.path))
+
+        started = time.time()
+        Replayer(client, speed=10).replay(records)
+        self.assertLess(time.time() - started, records[-1]['t'])
+
+    def test_size_only_capture(self):
+        transport = InMemoryTransport()
+        client = CrossengageClient(client_token='REPLAY_TOKEN', transport=transport)
+
+        Replayer(client, speed=None).replay([{'t': 0, 'method': 'post', 'endpoint': '/events', 'headers': {},
+                                             'size': 12, 'status': 200}])
+        self.assertEqual(12, len(transport.sent[0].body))
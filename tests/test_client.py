@@ -1,10 +1,15 @@
 import json
+import logging
 import unittest
 
+import mock
+import requests
 from mock import Mock
 from requests import RequestException, codes
 
-from crossengage.client import CrossengageClient
+from benchmarks.stub_server import StubServer
+from crossengage.client import CrossengageClient, logger
+from crossengage.throttle import AdaptiveLimiter
 
 
 class DummyRequest(object):
@@ -42,6 +47,17 @@ class DummyRequestException(object):
         return {'success': True, 'errors': ''}
 
 
+class DummyRequestNoLogging(DummyRequest):
+    """Fails the call if the request object is inspected for logging"""
+    @property
+    def request(self):
+        raise AssertionError('request inspected while debug logging is disabled')
+
+    @request.setter
+    def request(self, value):
+        pass
+
+
 class TestCrossengageClient(unittest.TestCase):
 
     CROSSENGAGE_URL = "https://api.crossengage.io/"
@@ -98,6 +114,38 @@ class TestCrossengageClient(unittest.TestCase):
         )
         self.assertEqual(expected_response, result)
 
+    def test_get_users(self):
+        ok = Mock(status_code=codes.ok)
+        ok.json.side_effect = lambda: {'id': '1'}
+        throttled = Mock(status_code=codes.too_many_requests, text='')
+        requests = Mock()
+        requests.get.side_effect = [throttled, ok, ok]
+        self.client.requests = requests
+
+        with mock.patch('crossengage.retry.time.sleep'):
+            result = list(self.client.get_users(['1', '2'], concurrency=1, ordered=True))
+
+        self.assertEqual([('1', {'id': '1', 'status_code': codes.ok}), ('2', {'id': '1', 'status_code': codes.ok})],
+                         result)
+        self.assertEqual(3, requests.get.call_count)
+
+    def test_get_users_adaptive_limit(self):
+        ok = Mock(status_code=codes.ok)
+        ok.json.side_effect = lambda: {'id': '1'}
+        throttled = Mock(status_code=codes.too_many_requests, text='')
+        requests = Mock()
+        requests.get.side_effect = [throttled, ok, ok]
+        self.client.requests = requests
+        limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=None)
+
+        with mock.patch('crossengage.retry.time.sleep'):
+            result = list(self.client.get_users(['1', '2'], concurrency=1, limiter=limiter))
+
+        self.assertEqual(2, len(result))
+        self.assertEqual(3, limiter.calls)
+        self.assertEqual(1, limiter.overloads)
+        self.assertEqual(2, limiter.limit)
+
     def test_update_user(self):
         self.client.requests = DummyRequest()
         response = self.client.update_user(self.user)
@@ -110,6 +158,37 @@ class TestCrossengageClient(unittest.TestCase):
         self.assertEqual(response['errors'], '')
         self.assertEqual(response['success'], True)
 
+    def test_update_user_debug_logging_disabled(self):
+        self.client.requests = DummyRequestNoLogging()
+
+        logger.setLevel(logging.INFO)
+        try:
+            response = self.client.update_user(self.user)
+        finally:
+            logger.setLevel(logging.NOTSET)
+
+        self.assertEqual(response['status_code'], codes.ok)
+        self.assertEqual(response['success'], True)
+
+    def test_update_user_debug_logging_redacts_token(self):
+        dummy_request = DummyRequest()
+        dummy_request.request.url = self.CROSSENGAGE_URL + 'users/1234'
+        dummy_request.request.headers = self.default_headers_api_v1
+        dummy_request.request.body = 'x' * (CrossengageClient.LOG_BODY_LIMIT + 10)
+        self.client.requests = dummy_request
+
+        logger.setLevel(logging.DEBUG)
+        try:
+            with mock.patch.object(logger, 'debug') as debug:
+                self.client.update_user(self.user)
+        finally:
+            logger.setLevel(logging.NOTSET)
+
+        extra = debug.call_args[1]['extra']
+        self.assertEqual(extra['crossengage_headers']['X-XNG-AuthToken'], '***')
+        self.assertEqual(extra['crossengage_headers']['X-XNG-ApiVersion'], '1')
+        self.assertTrue(extra['crossengage_body'].endswith('...<10 more>'))
+
     def test_update_user_request_exception(self):
         self.client.requests = DummyRequestException()
         response = self.client.update_user(self.user)
@@ -706,3 +785,86 @@ class TestCrossengageClient(unittest.TestCase):
         )
 
         self.assertEqual(expected_response, result)
+
+    def test_get_opt_out_statuses(self):
+        response = Mock(status_code=codes.ok, text='{"optOut": false}')
+        response.json.return_value = {'optOut': False}
+        requests = Mock()
+        requests.get.return_value = response
+        self.client.requests = requests
+
+        result = list(self.client.get_opt_out_statuses(['1', '2', '3'], concurrency=2, ordered=True))
+
+        self.assertEqual([
+            ('1', {'optOut': False, 'status_code': codes.ok}),
+            ('2', {'optOut': False, 'status_code': codes.ok}),
+            ('3', {'optOut': False, 'status_code': codes.ok}),
+        ], result)
+        self.assertEqual(
+            sorted(self.CROSSENGAGE_URL + 'users/{0}/optout-status'.format(i) for i in '123'),
+            sorted(call[0][0] for call in requests.get.call_args_list)
+        )
+
+    def test_set_opt_status_bulk(self):
+        response = Mock(status_code=codes.ok, text='{}')
+        response.json.side_effect = lambda: {}
+        requests = Mock()
+        requests.put.return_value = response
+        self.client.requests = requests
+
+        result = dict(self.client.set_opt_status_bulk([
+            ('1', 'MAIL', True),
+            ('2', 'SMS', False),
+            ('3', 'FAX', True),
+        ]))
+
+        self.assertEqual({'status_code': codes.ok}, result[('1', 'MAIL', True)])
+        self.assertEqual({'status_code': codes.ok}, result[('2', 'SMS', False)])
+        self.assertEqual({
+            'success': False,
+            'errors': {'client_error': 'unknown channel FAX'},
+            'status_code': 0,
+        }, result[('3', 'FAX', True)])
+        self.assertEqual({
+            (self.CROSSENGAGE_URL + 'users/1/optout-status?channelType=MAIL', '{"optOut": true}'),
+            (self.CROSSENGAGE_URL + 'users/2/optout-status?channelType=SMS', '{"optOut": false}'),
+        }, set((call[0][0], call[1]['data']) for call in requests.put.call_args_list))
+
+
+class TestFanOutSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(latency=0.01).start()
+        self.addCleanup(self.server.stop)
+        self.client = CrossengageClient(client_token='SOME_TOKEN')
+        self.client.API_URL = self.server.url
+
+    def test_opt_out_statuses_pooled(self):
+        result = list(self.client.get_opt_out_statuses([str(i) for i in range(20)], concurrency=4))
+
+        self.assertEqual(20, len(result))
+        self.assertIsInstance(self.client.requests, requests.Session)
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_opt_status_bulk_pooled(self):
+        result = list(self.client.set_opt_status_bulk([(str(i), 'MAIL', True) for i in range(20)], concurrency=4))
+
+        self.assertEqual(20, len(result))
+        self.assertLessEqual(self.server.connections, 4)
+
+    @mock.patch('crossengage.warmup.HAS_TLS_SESSIONS', False)
+    def test_pooled_without_tls_sessions(self):
+        # python 2.7 / 3.5
+        result = list(self.client.set_opt_status_bulk([(str(i), 'MAIL', True) for i in range(20)], concurrency=4))
+
+        self.assertEqual(20, len(result))
+        self.assertEqual(10, self.client.requests.get_adapter(self.server.url)._pool_maxsize)
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_given_session_kept(self):
+        session = requests.Session()
+        self.client.requests = session
+
+        list(self.client.get_opt_out_statuses(['1', '2'], concurrency=2))
+
+        self.assertIs(session, self.client.requests)
@@ -0,0 +1,68 @@
+import unittest
+
+from mock import patch
+
+from crossengage.client import CrossengageClient
+from crossengage.deadline import (DeadlineExceeded, ShedCounter, check_deadline, current_deadline, deadline,
+                                  deadline_at, remaining)
+from crossengage.throttle import monotonic
+from crossengage.transport import InMemoryTransport
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_nested_deadlines_never_extend(self):
+        self.assertIsNone(current_deadline())
+        self.assertIsNone(remaining())
+        with deadline(1):
+            outer = current_deadline()
+            with deadline(10):
+                self.assertEqual(outer, current_deadline())
+            with deadline(0.5):
+                self.assertLess(current_deadline(), outer)
+            with deadline_at(None):
+                self.assertEqual(outer, current_deadline())
+            self.assertLessEqual(remaining(), 1)
+        self.assertIsNone(current_deadline())
+
+    def test_check_deadline(self):
+        check_deadline(None)
+        check_deadline(monotonic() + 1)
+        self.assertRaises(DeadlineExceeded, check_deadline, monotonic())
+
+    def test_shed_counter(self):
+        counter = ShedCounter()
+        counter.add(DeadlineExceeded('expired'))
+        counter.add(DeadlineExceeded('rejected', rejected=True))
+        counter.add(DeadlineExceeded('rejected', rejected=True))
+
+        self.assertEqual((1, 2), (counter.expired, counter.rejected))
+
+
+class TestClientDeadline(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = InMemoryTransport()
+        self.client = CrossengageClient(client_token='SOME_TOKEN', transport=self.transport)
+
+    def test_expired_calls_dropped_before_encoding(self):
+        with deadline(0):
+            with patch('crossengage.client.json.dumps') as dumps:
+                response = self.client.update_user({'id': '1'})
+                self.assertRaises(DeadlineExceeded, self.client.batch_process_async, update_list=[{'id': '1'}])
+
+        self.assertFalse(dumps.called)
+        self.assertEqual([], self.transport.sent)
+        self.assertEqual({'success': False, 'status_code': 0, 'errors': {
+            'deadline_exceeded': response['errors']['deadline_exceeded']}}, response)
+        self.assertEqual((2, 0), (self.client.shed.expired, self.client.shed.rejected))
+
+    def test_calls_within_deadline_sent(self):
+        with deadline(10):
+            response = self.client.update_user({'id': '1'})
+
+        self.assertEqual(200, response['status_code'])
+        self.assertIsNone(current_deadline())
+        self.assertIsNotNone(self.transport.sent[0].deadline)
+        self.client.update_user({'id': '1'})
+        self.assertIsNone(self.transport.sent[1].deadline)
@@ -0,0 +1,115 @@
+import json
+import unittest
+
+import mock
+import requests
+from mock import Mock
+
+from benchmarks.stub_server import StubServer
+from crossengage.client import CrossengageClient
+from crossengage.deletion import DeletionPipeline
+from crossengage.retry import NO_RETRY
+from crossengage.tracing import NoopTracer
+from crossengage.transport import InMemoryTransport, default_handler
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class TestDeletionPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Mock(tracer=NoopTracer())
+        self.client.batch_process_async.return_value = (202, {'trackingId': 'tracking'})
+        self.client.track_user_task.return_value = (200, {'stage': 'PROCESSED', 'total': 2, 'success': 2, 'error': 0})
+        self.client.delete_user_by_xng_id.return_value = {'status_code': 204}
+        self.audit_log = StringIO()
+        self.pipeline = DeletionPipeline(self.client, self.audit_log, batch_size=2, concurrency=2, retry=NO_RETRY)
+
+    def records(self):
+        return [json.loads(line) for line in self.audit_log.getvalue().splitlines()]
+
+    def test_routes_ids_to_batches_and_xng_ids_to_single_deletes(self):
+        result = self.pipeline.run([{'id': '1'}, {'xngId': 'x1'}, {'id': '2'}, {'id': '3'}, {'xngId': 'x2'}])
+
+        self.assertEqual((5, 0), (result.deleted, result.failed))
+        self.assertEqual(
+            [((), {'delete_list': [{'id': '1'}, {'id': '2'}]}), ((), {'delete_list': [{'id': '3'}]})],
+            sorted(self.client.batch_process_async.call_args_list, key=lambda call: len(call[1]['delete_list']),
+                   reverse=True)
+        )
+        xng_calls = self.client.delete_user_by_xng_id.call_args_list
+        self.assertEqual({'x1', 'x2'}, set(call[0][0]['xngId'] for call in xng_calls))
+
+        records = self.records()
+        self.assertEqual(['1', '2', '3'], sorted(record['id'] for record in records if 'id' in record))
+        self.assertEqual(['x1', 'x2'], sorted(record['xngId'] for record in records if 'xngId' in record))
+        batch_record = [record for record in records if record.get('id') == '1'][0]
+        self.assertEqual(('tracking', 'PROCESSED', 202, True),
+                         (batch_record['trackingId'], batch_record['stage'], batch_record['status_code'],
+                          batch_record['success']))
+
+    def test_failures(self):
+        self.client.delete_user_by_xng_id.return_value = {'status_code': 500, 'errors': {'server_error': 'x'}}
+        self.client.batch_process_async.return_value = (400, {'errors': 'bad'})
+
+        result = self.pipeline.run([{'id': '1'}, {'xngId': 'x1'}])
+
+        self.assertEqual((0, 2), (result.deleted, result.failed))
+        self.assertFalse(self.client.track_user_task.called)
+        self.assertEqual({'server_error': 'x'}, [r for r in self.records() if 'xngId' in r][0]['errors'])
+
+    @mock.patch('crossengage.bulk.time.sleep')
+    def test_batch_with_tracked_errors_fails(self, sleep):
+        self.client.track_user_task.return_value = (200, {'stage': 'PROCESSED', 'total': 1, 'success': 0, 'error': 1})
+
+        result = self.pipeline.run([{'id': '1'}])
+
+        self.assertEqual((0, 1), (result.deleted, result.failed))
+
+    def test_no_wait(self):
+        pipeline = DeletionPipeline(self.client, self.audit_log, wait=False, retry=NO_RETRY)
+
+        self.assertEqual(1, pipeline.run([{'id': '1'}]).deleted)
+        self.assertFalse(self.client.track_user_task.called)
+
+    def test_missing_key(self):
+        self.assertRaises(ValueError, self.pipeline.run, [{'email': 'john@example.com'}])
+
+
+class TestDeletionPipelineFaults(unittest.TestCase):
+
+    def setUp(self):
+        self.audit_log = StringIO()
+
+    def records(self):
+        return [json.loads(line) for line in self.audit_log.getvalue().splitlines()]
+
+    def test_empty_5xx_bodies_audited(self):
+        with StubServer(error_rate=0.3, seed=3) as server:
+            client = CrossengageClient(client_token='SOME_TOKEN', session=requests.Session())
+            client.requests.trust_env = False
+            client.API_URL = server.url
+            result = DeletionPipeline(client, self.audit_log, batch_size=2, concurrency=4, retry=NO_RETRY,
+                                      poll_interval=0.001).run([{'id': str(i)} for i in range(40)])
+
+        self.assertEqual(40, result.deleted + result.failed)
+        self.assertGreater(result.failed, 0)
+        self.assertEqual(40, len(self.records()))
+        self.assertIn(500, set(record['status_code'] for record in self.records()))
+
+    def test_connection_errors_audited(self):
+        def handler(request):
+            if request.url.endswith('/users/batch'):
+                raise requests.ConnectionError('connection refused')
+            return default_handler(request)
+
+        client = CrossengageClient(client_token='SOME_TOKEN', transport=InMemoryTransport(handler=handler))
+        result = DeletionPipeline(client, self.audit_log, retry=NO_RETRY).run([{'id': '1'}, {'xngId': 'x1'}])
+
+        self.assertEqual((1, 1), (result.deleted, result.failed))
+        record = [r for r in self.records() if 'id' in r][0]
+        self.assertEqual((0, False), (record['status_code'], record['success']))
+        self.assertIn('connection refused', record['errors']['client_error'])
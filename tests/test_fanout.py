@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+
+from crossengage.deadline import current_deadline, deadline
+from crossengage.fanout import fan_out
+
+
+class TestFanOut(unittest.TestCase):
+
+    def test_invalid_concurrency(self):
+        self.assertRaises(ValueError, list, fan_out(str, [1], concurrency=0))
+
+    def test_unordered_yields_all(self):
+        results = list(fan_out(lambda item: item * 2, range(20), concurrency=4))
+
+        self.assertEqual(sorted((i, i * 2) for i in range(20)), sorted(results))
+
+    def test_ordered(self):
+        def slow_first(item):
+            if item == 0:
+                time.sleep(0.05)
+            return item
+
+        results = list(fan_out(slow_first, range(10), concurrency=4, ordered=True))
+
+        self.assertEqual([(i, i) for i in range(10)], results)
+
+    def test_unordered_yields_in_completion_order(self):
+        def slow_first(item):
+            if item == 0:
+                time.sleep(0.05)
+            return item
+
+        results = [item for item, _ in fan_out(slow_first, range(4), concurrency=4)]
+
+        self.assertEqual(0, results[-1])
+
+    def test_bounded_in_flight(self):
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'peak': 0}
+
+        def work(item):
+            with lock:
+                state['in_flight'] += 1
+                state['peak'] = max(state['peak'], state['in_flight'])
+            time.sleep(0.005)
+            with lock:
+                state['in_flight'] -= 1
+            return item
+
+        consumed = []
+
+        def items():
+            for i in range(20):
+                consumed.append(i)
+                yield i
+
+        results = fan_out(work, items(), concurrency=3)
+        next(results)
+
+        self.assertLessEqual(len(consumed), 4)
+        self.assertEqual(19, len(list(results)))
+        self.assertEqual(3, state['peak'])
+
+    def test_exception_reraised(self):
+        def fail(item):
+            raise KeyError(item)
+
+        self.assertRaises(KeyError, list, fan_out(fail, [1, 2], concurrency=2))
+
+    def test_rate(self):
+        started = time.time()
+        list(fan_out(lambda item: item, range(6), concurrency=3, rate=100))
+
+        # burst of 100 tokens, so no waiting is expected within the first second
+        self.assertLess(time.time() - started, 0.5)
+
+    def test_deadline_handed_to_workers(self):
+        with deadline(10):
+            when = current_deadline()
+            results = dict(fan_out(lambda item: current_deadline(), range(4), concurrency=2))
+
+        self.assertEqual({when}, set(results.values()))
+        self.assertEqual({None}, set(dict(fan_out(lambda item: current_deadline(), range(2))).values()))
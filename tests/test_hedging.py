@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+
+from crossengage.client import CrossengageClient
+from crossengage.hedging import HedgingMiddleware, LatencyWindow
+from crossengage.scheduling import HIGH, LOW, PriorityScheduler
+from crossengage.tracing import InMemoryTracer
+from crossengage.transport import InMemoryTransport
+
+
+class SlowFirstHandler(object):
+    """ The first attempt of every user is slow, later ones answer at once """
+
+    def __init__(self, slow=0.5):
+        self.slow = slow
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        with self.lock:
+            count = self.calls[request.url] = self.calls.get(request.url, 0) + 1
+        if count == 1:
+            time.sleep(self.slow)
+            return 200, {'attempt': 'first'}
+        return 200, {'attempt': 'hedge'}
+
+
+class TestLatencyWindow(unittest.TestCase):
+
+    def test_percentile(self):
+        window = LatencyWindow(size=100)
+        self.assertIsNone(window.percentile(95))
+        for latency in range(200):
+            window.add(latency / 1000.0)
+
+        self.assertEqual(100, len(window))
+        self.assertEqual(0.195, window.percentile(95))
+        self.assertEqual(0.15, window.percentile(50))
+
+
+class TestHedgingMiddleware(unittest.TestCase):
+
+    def client(self, hedging, handler):
+        self.transport = InMemoryTransport(handler=handler)
+        return CrossengageClient(client_token='SOME_TOKEN', transport=self.transport, middleware=[hedging])
+
+    def test_slow_first_attempt_hedged(self):
+        hedging = HedgingMiddleware(delay=0.01, budget=1.0)
+        client = self.client(hedging, SlowFirstHandler())
+
+        started = time.time()
+        response = client.get_user({'id': '1'})
+
+        self.assertLess(time.time() - started, 0.4)
+        self.assertEqual('hedge', response['attempt'])
+        self.assertEqual(200, response['status_code'])
+        self.assertEqual(2, len(self.transport.sent))
+        self.assertIsNot(self.transport.sent[0], self.transport.sent[1])
+        self.assertEqual((1, 1, 1), (hedging.requests, hedging.hedged, hedging.hedge_wins))
+
+    def test_fast_answer_not_hedged(self):
+        hedging = HedgingMiddleware(delay=0.5, budget=1.0)
+        client = self.client(hedging, lambda request: (200, {'id': '1'}))
+
+        self.assertEqual('1', client.get_user({'id': '1'})['id'])
+        self.assertEqual(1, len(self.transport.sent))
+        self.assertEqual(0, hedging.hedged)
+
+    def test_budget_caps_hedges(self):
+        hedging = HedgingMiddleware(delay=0.001, budget=0.25, max_burst=1)
+        client = self.client(hedging, SlowFirstHandler(slow=0.02))
+
+        for i in range(8):
+            client.get_user({'id': str(i)})
+
+        self.assertEqual(8, hedging.requests)
+        self.assertEqual(2, hedging.hedged)
+
+    def test_writes_not_hedged(self):
+        hedging = HedgingMiddleware(delay=0.001, budget=1.0)
+        client = self.client(hedging, SlowFirstHandler(slow=0.02))
+
+        client.update_user({'id': '1'})
+        self.assertEqual(1, len(self.transport.sent))
+        self.assertEqual(0, hedging.requests)
+
+    def test_percentile_delay(self):
+        hedging = HedgingMiddleware(percentile=90, initial_delay=1.0, min_delay=0.001, min_samples=5)
+        self.assertEqual(1.0, hedging.hedge_delay())
+        for latency in (0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.07, 0.08, 0.09, 0.5):
+            hedging.latencies.add(latency)
+
+        self.assertEqual(0.5, hedging.hedge_delay())
+        hedging.latencies.add(0.0001)
+        self.assertEqual(0.09, hedging.hedge_delay())
+
+    def test_error_of_one_attempt_ignored(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                time.sleep(0.05)
+                raise ValueError('first attempt failed')
+            time.sleep(0.1)
+            return 200, {'id': '1'}
+        client = self.client(HedgingMiddleware(delay=0.01, budget=1.0), handler)
+
+        self.assertEqual('1', client.get_user({'id': '1'})['id'])
+
+    def test_error_of_every_attempt_raised(self):
+        def handler(request):
+            time.sleep(0.02)
+            raise ValueError('down')
+        client = self.client(HedgingMiddleware(delay=0.001, budget=1.0), handler)
+
+        self.assertEqual({'client_error': 'down'}, client.get_user({'id': '1'})['errors'])
+
+    def test_attempts_keep_the_caller_context(self):
+        tracer = InMemoryTracer()
+        scheduler = PriorityScheduler(slots=4)
+        hedging = HedgingMiddleware(delay=0.01, budget=1.0)
+        client = CrossengageClient(client_token='SOME_TOKEN', middleware=[hedging], tracer=tracer, scheduler=scheduler,
+                                   transport=InMemoryTransport(handler=SlowFirstHandler(0.05)))
+
+        with scheduler.lane(LOW):
+            client.get_user({'id': '1'})
+        time.sleep(0.1)
+
+        self.assertEqual(1, hedging.hedged)
+        self.assertEqual({HIGH: 0, LOW: 2}, scheduler.granted)
+        http_spans = tracer.find('crossengage.http')
+        self.assertEqual(2, len(http_spans))
+        self.assertEqual(['crossengage.get_user'] * 2, [span.parent.name for span in http_spans])
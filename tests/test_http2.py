@@ -0,0 +1,127 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from requests.exceptions import ConnectionError, Timeout
+
+import tests.test_benchmarks as default_transport
+from benchmarks.stub_server import StubServer, make_certificate
+from crossengage.client import CrossengageClient
+
+try:
+    import httpx
+    from crossengage.http2 import Http2Session
+except ImportError:  # optional dependency
+    httpx = None
+
+
+@unittest.skipIf(httpx is None, 'httpx[http2] is not installed')
+class TestStubServerHttp2(default_transport.TestStubServer):
+    """ Same stub server suite as the default transport, sent over HTTP/2 through Http2Session """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        certfile = make_certificate(self.directory)
+        self.server = StubServer(seed=1, certfile=certfile, http2=True).start()
+        self.session = Http2Session(client=httpx.Client(
+            http2=True, verify=certfile, trust_env=False, limits=httpx.Limits(max_connections=1)))
+        self.client = CrossengageClient(client_token='SOME_TOKEN', session=self.session)
+        self.client.API_URL = self.server.url
+
+    def tearDown(self):
+        self.session.close()
+        super(TestStubServerHttp2, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_http2(self):
+        response = self.session.get(self.server.url + '/users/1')
+
+        self.assertEqual('HTTP/2', response.raw.http_version)
+        self.assertEqual('1', response.json()['id'])
+
+    def test_concurrent_requests_share_a_connection(self):
+        self.server.latency = 0.2
+        responses = []
+
+        def get(user_id):
+            responses.append(self.session.get('{0}/users/{1}'.format(self.server.url, user_id)))
+
+        workers = [threading.Thread(target=get, args=(str(i),)) for i in range(10)]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(['HTTP/2'] * 10, [response.raw.http_version for response in responses])
+        self.assertEqual({str(i) for i in range(10)}, {response.json()['id'] for response in responses})
+        self.assertEqual(1, self.server.connections)
+        # multiplexed streams wait for the stub latency together, not one after the other
+        self.assertLess(time.time() - started, 1.0)
+
+    def test_fan_out_shares_a_connection(self):
+        users = list(self.client.get_users([str(i) for i in range(20)], concurrency=10))
+
+        self.assertEqual(20, len(users))
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual({'get_user': 20}, self.server.requests)
+
+    def test_large_response(self):
+        # more than the default flow control window of 64KiB
+        users = [{'id': str(i)} for i in range(2000)]
+
+        status_code, body = self.client.batch_process(update_list=users)
+
+        self.assertEqual(200, status_code)
+        self.assertEqual(2000, len(body['updated']))
+
+
+class TestStubServerHttp2Fallback(unittest.TestCase):
+
+    def test_requires_certfile(self):
+        self.assertRaises(ValueError, StubServer, http2=True)
+
+    @unittest.skipIf(httpx is None, 'httpx[http2] is not installed')
+    def test_http11_without_alpn(self):
+        with StubServer() as server:
+            session = Http2Session(max_connections=1)
+            try:
+                response = session.get(server.url + '/users/1')
+            finally:
+                session.close()
+
+        self.assertEqual('HTTP/1.1', response.raw.http_version)
+
+
+@unittest.skipIf(httpx is None, 'httpx[http2] is not installed')
+class TestHttp2Session(unittest.TestCase):
+
+    def session(self, handler):
+        return Http2Session(client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    def test_request(self):
+        def handler(request):
+            self.assertEqual(b'{"optOut": true}', request.content)
+            self.assertEqual('SOME_TOKEN', request.headers['X-XNG-AuthToken'])
+            return httpx.Response(200, json={'optOut': True})
+
+        client = CrossengageClient(client_token='SOME_TOKEN', session=self.session(handler))
+
+        self.assertEqual({'optOut': True, 'status_code': 200}, client.update_user_opt_out_status('1', 'MAIL'))
+
+    def test_connection_error(self):
+        def handler(request):
+            raise httpx.ConnectError('refused')
+
+        self.assertRaises(ConnectionError, self.session(handler).get, 'https://api.crossengage.io/users/1')
+
+        client = CrossengageClient(client_token='SOME_TOKEN', session=self.session(handler))
+        self.assertEqual({'connection_error': 'refused'}, client.get_user({'id': '1'})['errors'])
+
+    def test_timeout(self):
+        def handler(request):
+            raise httpx.ReadTimeout('slow')
+
+        self.assertRaises(Timeout, self.session(handler).get, 'https://api.crossengage.io/users/1')
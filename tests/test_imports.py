@@ -0,0 +1,48 @@
+import re
+import subprocess
+import sys
+import unittest
+
+
+def import_times(statement):
+    """ Cumulative import time in microseconds per module, from python -X importtime """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', statement],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    times = {}
+    for line in stderr.decode('utf-8').splitlines():
+        match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(.+)$', line)
+        if match:
+            times[match.group(2).strip()] = int(match.group(1))
+    return times
+
+
+def imported_modules(statement):
+    output = subprocess.check_output([sys.executable, '-c', statement + '; import sys; print(" ".join(sys.modules))'])
+    return set(output.decode('utf-8').split())
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime and module __getattr__ need python 3.7')
+class TestImportTime(unittest.TestCase):
+    # generous for slow CI machines, about 20ms on a laptop, requests alone adds 60ms+
+    BUDGET_MS = 60
+
+    def test_client_budget(self):
+        times = import_times('import crossengage.client')
+        self.assertLess(times['crossengage.client'] / 1000.0, self.BUDGET_MS)
+
+    def test_package_import_loads_nothing(self):
+        modules = imported_modules('import crossengage')
+        self.assertEqual({'crossengage'}, set(name for name in modules if name.startswith('crossengage')))
+
+    def test_requests_loaded_on_first_use(self):
+        self.assertNotIn('requests', imported_modules('import crossengage.client'))
+        self.assertNotIn('requests', imported_modules(
+            'from crossengage.client import CrossengageClient; CrossengageClient("TOKEN")'))
+        self.assertIn('requests', imported_modules(
+            'from crossengage.client import CrossengageClient; CrossengageClient("TOKEN").requests'))
+
+    def test_lazy_exports(self):
+        modules = imported_modules('import crossengage; crossengage.CrossengageClient')
+        self.assertIn('crossengage.client', modules)
+        self.assertNotIn('crossengage.bulk', modules)
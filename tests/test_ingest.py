@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock
+
+from crossengage.client import CrossengageClient
+from crossengage.ingest import EventIngestor, OffsetStore, group_events, read_records
+from crossengage.retry import NO_RETRY
+from crossengage.tracing import NoopTracer
+from crossengage.transport import InMemoryTransport
+
+
+def record(user_id, sku, business_unit='de'):
+    return {'id': user_id, 'businessUnit': business_unit, 'event': {'event': 'Order', 'properties': {'sku': sku}}}
+
+
+class IngestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'events')
+        self.offsets = os.path.join(self.directory, 'offsets')
+        os.makedirs(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, partition, records, tail=''):
+        with open(os.path.join(self.source, partition), 'a') as partition_file:
+            for item in records:
+                partition_file.write(json.dumps(item) + '\n')
+            partition_file.write(tail)
+
+
+class TestReadRecords(IngestTestCase):
+
+    def test_window_and_offsets(self):
+        self.write('p0', [record('1', i) for i in range(5)])
+        path = os.path.join(self.source, 'p0')
+
+        records, offset = read_records(path, 0, limit=3)
+        self.assertEqual([0, 1, 2], [r['event']['properties']['sku'] for r in records])
+        records, end = read_records(path, offset)
+        self.assertEqual([3, 4], [r['event']['properties']['sku'] for r in records])
+        self.assertEqual(os.path.getsize(path), end)
+        self.assertEqual(3, len(read_records(path, 0, end=offset)[0]))
+
+    def test_partial_last_line_left(self):
+        self.write('p0', [record('1', 0)], tail='{"id": "2", "ev')
+        path = os.path.join(self.source, 'p0')
+
+        records, offset = read_records(path, 0)
+        self.assertEqual(1, len(records))
+        self.assertEqual(([], offset), read_records(path, offset))
+
+
+class TestGroupEvents(unittest.TestCase):
+
+    def test_grouped_by_user_in_order(self):
+        records = [record('1', 0), record('2', 1), record('1', 2), record('1', 3, business_unit='at')]
+
+        self.assertEqual([
+            (('1', None, 'de'), [[{'event': 'Order', 'properties': {'sku': 0}},
+                                  {'event': 'Order', 'properties': {'sku': 2}}]]),
+            (('2', None, 'de'), [[{'event': 'Order', 'properties': {'sku': 1}}]]),
+            (('1', None, 'at'), [[{'event': 'Order', 'properties': {'sku': 3}}]]),
+        ], group_events(records))
+
+    def test_batches_of_50(self):
+        (_, batches), = group_events([record('1', i) for i in range(120)])
+        self.assertEqual([50, 50, 20], [len(batch) for batch in batches])
+
+
+class TestEventIngestor(IngestTestCase):
+
+    def setUp(self):
+        super(TestEventIngestor, self).setUp()
+        self.client = Mock(tracer=NoopTracer())
+        self.client.send_events.return_value = {'status_code': 200}
+        self.ingestor = EventIngestor(self.client, self.offsets, window=100, retry=NO_RETRY)
+
+    def sent_skus(self):
+        return sorted(event['properties']['sku'] for call in self.client.send_events.call_args_list
+                      for event in call[0][0])
+
+    def test_partitions_sent_and_committed(self):
+        self.write('p0', [record(str(i % 3), i) for i in range(150)])
+        self.write('p1', [record('x', i) for i in range(150, 210)])
+
+        result = self.ingestor.run(self.source)
+
+        self.assertEqual(210, result.sent)
+        self.assertEqual(list(range(210)), self.sent_skus())
+        for call in self.client.send_events.call_args_list:
+            self.assertLessEqual(len(call[0][0]), 50)
+            self.assertEqual('de', call[1]['business_unit'])
+        size = os.path.getsize(os.path.join(self.source, 'p0'))
+        self.assertEqual(size, OffsetStore(self.offsets).load('p0')['offset'])
+
+    def test_replay_sends_only_new_records(self):
+        self.write('p0', [record('1', i) for i in range(10)])
+        self.ingestor.run(self.source)
+        self.client.send_events.reset_mock()
+
+        self.assertEqual(0, self.ingestor.run(self.source).sent)
+        self.assertFalse(self.client.send_events.called)
+
+        self.write('p0', [record('1', i) for i in range(10, 15)])
+        self.assertEqual(5, self.ingestor.run(self.source).sent)
+        self.assertEqual(list(range(10, 15)), self.sent_skus())
+
+    def test_failed_window_not_committed_and_never_double_sent(self):
+        self.write('p0', [record('ok', 0), record('down', 1), record('ok', 2)] + [record('ok', 3)])
+        self.write('p0', [record('later', 4)])
+        self.ingestor.window = 4
+
+        def send_events(events, email=None, user_id=None, business_unit=None):
+            return {'status_code': 500 if user_id == 'down' else 200, 'errors': {'server_error': 'down'}}
+        self.client.send_events.side_effect = send_events
+
+        result = self.ingestor.run(self.source)
+        self.assertEqual(['p0'], result.failed_partitions)
+        self.assertEqual(3, result.sent)
+        state = OffsetStore(self.offsets).load('p0')
+        self.assertEqual(0, state['offset'])
+        self.assertEqual([0], state['acked'])
+
+        self.client.send_events.reset_mock()
+        self.client.send_events.side_effect = None
+        result = self.ingestor.run(self.source)
+        self.assertEqual([], result.failed_partitions)
+        self.assertEqual(3, result.partitions[0].skipped)
+        self.assertEqual([1, 4], self.sent_skus())
+
+    def test_failed_event_not_overtaken_by_later_events_of_the_user(self):
+        self.write('p0', [record('1', i) for i in range(120)])
+        self.client.send_events.side_effect = [{'status_code': 200}, {'status_code': 429}]
+
+        result = self.ingestor.run(self.source)
+
+        self.assertEqual(2, self.client.send_events.call_count)
+        self.assertEqual(50, result.sent)
+        self.assertEqual([0], OffsetStore(self.offsets).load('p0')['acked'])
+
+    def test_records_without_user_skipped(self):
+        self.write('p0', [{'event': {'event': 'Order'}}, record('1', 0)])
+
+        result = self.ingestor.run(self.source)
+
+        self.assertEqual(1, result.partitions[0].invalid)
+        self.assertEqual(1, result.sent)
+        self.assertEqual([], result.failed_partitions)
+
+    def test_transform(self):
+        self.write('p0', [{'user': '1', 'type': 'Order'}])
+        self.ingestor.transform = lambda raw: {'id': raw['user'], 'event': {'event': raw['type']}}
+
+        self.ingestor.run(self.source)
+        self.client.send_events.assert_called_once_with(
+            [{'event': 'Order'}], email=None, user_id='1', business_unit=None)
+
+
+class TestEventIngestorWithClient(IngestTestCase):
+
+    def test_in_memory_transport(self):
+        transport = InMemoryTransport()
+        client = CrossengageClient(client_token='SOME_TOKEN', transport=transport)
+        for partition in ('p0', 'p1', 'p2'):
+            self.write(partition, [record(str(i % 7), i) for i in range(200)])
+
+        result = EventIngestor(client, self.offsets, window=64, concurrency=4).run(self.source)
+
+        self.assertEqual(600, result.sent)
+        self.assertEqual(600, sum(len(request.payload['events']) for request in transport.sent))
+        self.assertTrue(all(request.url.endswith('/events') for request in transport.sent))
@@ -0,0 +1,132 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from mock import patch
+
+from crossengage.client import CrossengageClient
+from crossengage.mirror import ProfileMirror
+from crossengage.transport import InMemoryTransport, default_handler
+
+
+def handler(request):
+    path = request.url.split('?', 1)[0]
+    if request.method == 'get' and path.endswith('/users/123'):
+        return 200, {'id': '123', 'email': 'john@example.com', 'xngId': 'xng-123', 'firstName': 'John'}
+    if request.method == 'get' and path.endswith('/users/404'):
+        return 404, {'success': False}
+    if request.method == 'put' and request.headers.get('X-XNG-ApiVersion') == '1':
+        return 200, {'success': True, 'id': request.payload['id'], 'xngGlobalUserId': 'xng-' + request.payload['id']}
+    if path.endswith('/users/batch') and request.headers.get('X-XNG-ApiVersion') == '1':
+        return 200, {
+            'updated': [{'id': user['id'], 'xngId': 'xng-' + user['id'], 'success': user['id'] != 'bad'}
+                        for user in request.payload['updated']],
+            'deleted': [{'id': user['id'], 'success': True} for user in request.payload['deleted']],
+        }
+    return default_handler(request)
+
+
+class TestProfileMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.mirror = ProfileMirror(max_staleness=60)
+        self.transport = InMemoryTransport(handler=handler)
+        self.client = CrossengageClient(client_token='SOME_TOKEN', transport=self.transport,
+                                        middleware=[self.mirror])
+
+    def test_filled_from_get_user(self):
+        self.client.get_user({'id': '123'})
+
+        self.assertEqual('John', self.mirror.get('123')['firstName'])
+        self.assertEqual('123', self.mirror.get_by_email('john@example.com')['id'])
+        self.assertEqual('123', self.mirror.get_by_xng_id('xng-123')['id'])
+        self.assertEqual('xng-123', self.mirror.xng_id_of('123'))
+
+    def test_update_user_merged(self):
+        self.client.get_user({'id': '123'})
+        self.client.update_user({'id': '123', 'lastName': 'Doe'})
+
+        profile = self.mirror.get('123')
+        self.assertEqual(('John', 'Doe'), (profile['firstName'], profile['lastName']))
+        self.client.update_user({'id': '7', 'email': 'seven@example.com'})
+        self.assertEqual('xng-7', self.mirror.get_by_email('seven@example.com')['xngId'])
+
+    def test_filled_from_batch_process(self):
+        self.mirror.store([{'id': '9', 'xngId': 'xng-9'}])
+        self.client.batch_process(update_list=[{'id': '1', 'email': 'one@example.com'}, {'id': 'bad'}],
+                                  delete_list=[{'id': '9'}])
+
+        self.assertEqual('xng-1', self.mirror.xng_id_of('1'))
+        self.assertIsNone(self.mirror.get('bad'))
+        self.assertIsNone(self.mirror.get('9'))
+
+    def test_async_writes_and_deletes_invalidate(self):
+        self.mirror.store([{'id': str(i), 'xngId': 'xng-{0}'.format(i)} for i in range(5)])
+        self.client.update_user_async({'id': '0'})
+        self.client.batch_process_async(update_list=[{'id': '1'}])
+        self.client.delete_user({'id': '2'})
+        self.client.delete_user_by_xng_id({'xngId': 'xng-3'})
+        self.client.get_user({'id': '404'})
+
+        self.assertEqual(['4'], [i for i in map(str, range(5)) if self.mirror.get(i)])
+        self.mirror.store([{'id': '404'}])
+        self.client.get_user({'id': '404'})
+        self.assertIsNone(self.mirror.get('404'))
+
+    def test_staleness_bound(self):
+        self.mirror.store([{'id': '1', 'xngId': 'xng-1'}])
+        later = time.time() + 61
+        with patch('crossengage.mirror.time.time', return_value=later):
+            self.assertIsNone(self.mirror.get('1'))
+            self.assertEqual('xng-1', self.mirror.xng_id_of('1', max_staleness=120))
+        self.assertEqual((1, 1), (self.mirror.hits, self.mirror.misses))
+
+    def test_xng_id_of_fetches_when_missing(self):
+        self.assertEqual('xng-123', self.mirror.xng_id_of('123', client=self.client))
+        self.assertEqual('xng-123', self.mirror.xng_id_of('123', client=self.client))
+
+        self.assertEqual(1, len(self.transport.sent))
+        self.assertIsNone(self.mirror.xng_id_of('404', client=self.client))
+
+    def test_shared_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'profiles.sqlite')
+        ProfileMirror(path).store([{'id': '1', 'xngId': 'xng-1'}])
+
+        other = ProfileMirror(path)
+        self.assertEqual('xng-1', other.xng_id_of('1'))
+        self.assertEqual(1, len(other))
+        other.close()
+
+    def test_database_failure_does_not_fail_the_call(self):
+        self.mirror.close()
+
+        with patch('crossengage.mirror.logger') as logger:
+            response = self.client.get_user({'id': '123'})
+            self.client.get_user({'id': '404'})
+
+        self.assertEqual('John', response['firstName'])
+        self.assertEqual(2, self.mirror.errors)
+        self.assertEqual(2, logger.warning.call_count)
+
+    def test_locked_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'profiles.sqlite')
+        mirror = ProfileMirror(path, timeout=0.05)
+        self.addCleanup(mirror.close)
+        client = CrossengageClient(client_token='SOME_TOKEN', transport=self.transport, middleware=[mirror])
+        other = sqlite3.connect(path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute('BEGIN EXCLUSIVE')
+
+        self.assertEqual('xng-123', client.get_user({'id': '123'})['xngId'])
+        self.assertEqual(1, mirror.errors)
+
+        other.execute('ROLLBACK')
+        client.get_user({'id': '123'})
+        self.assertEqual('xng-123', mirror.xng_id_of('123'))
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock
+
+from benchmarks.stub_server import StubServer
+from crossengage.multiprocess import (MultiprocessSync, PartitionSummary, file_partitions, read_partition,
+                                      sync_partition)
+
+
+def rename_id(user):
+    return {'id': user['user_id']}
+
+
+class TestMultiprocessSync(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'users.jsonl')
+        with open(self.path, 'w') as users_file:
+            for i in range(25):
+                users_file.write(json.dumps({'user_id': str(i)}) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_partitions_cover_every_line_once(self):
+        for partitions in (1, 3, 7, 100):
+            ranges = file_partitions(self.path, partitions)
+            users = [user for partition in ranges for user in read_partition(*partition)]
+
+            self.assertEqual([str(i) for i in range(25)], [user['user_id'] for user in users])
+            self.assertLessEqual(len(ranges), partitions)
+
+    def test_sync_partition_async(self):
+        client = Mock()
+        client.batch_process_async.side_effect = [(202, {'trackingId': 't1'}), (500, {})]
+        partition = (self.path, 0, os.path.getsize(self.path))
+
+        summary = sync_partition(client, partition, transform=rename_id, batch_size=20)
+
+        self.assertEqual((20, 5, ['t1']), (summary.sent, summary.failed, summary.tracking_ids))
+        self.assertEqual([str(i) for i in range(20, 25)], summary.failed_ids)
+
+    def test_sync_partition_chunk_raising(self):
+        client = Mock()
+        client.batch_process.side_effect = [ValueError('No JSON object could be decoded'),
+                                            (200, {'updated': [{'id': '20', 'success': True}]})]
+        partition = (self.path, 0, os.path.getsize(self.path))
+
+        summary = sync_partition(client, partition, transform=rename_id, batch_size=20, use_async=False)
+
+        self.assertEqual((5, 20), (summary.sent, summary.failed))
+        self.assertEqual([str(i) for i in range(20)], summary.failed_ids)
+
+    def test_sync_partition_v1_lists_failed_users(self):
+        client = Mock()
+        client.batch_process.return_value = (200, {'updated': [{'id': '0', 'success': False},
+                                                               {'id': '1', 'success': True}]})
+        partition = (self.path, 0, os.path.getsize(self.path))
+
+        summary = sync_partition(client, partition, transform=rename_id, batch_size=25, use_async=False)
+
+        self.assertEqual((24, 1, ['0']), (summary.sent, summary.failed, summary.failed_ids))
+
+    def test_partition_summary_pickles_compactly(self):
+        summary = PartitionSummary(('path', 0, 10), sent=3, failed_ids=['1'])
+
+        self.assertEqual((('path', 0, 10), 3, 0, ['1'], [], 0.0), summary.__getstate__())
+        copy = PartitionSummary(None)
+        copy.__setstate__(summary.__getstate__())
+        self.assertEqual(['1'], copy.failed_ids)
+
+    def test_sync_file_with_processes(self):
+        with StubServer() as server:
+            summary = MultiprocessSync('SOME_TOKEN', processes=2, batch_size=10, transform=rename_id,
+                                       api_url=server.url).sync_file(self.path, partitions=4)
+
+            self.assertEqual((25, 0), (summary.sent, summary.failed))
+            self.assertEqual(sum(len(p.tracking_ids) for p in summary.partitions), server.requests['batch'])
+
+    def test_sync_file_with_faults(self):
+        with StubServer(error_rate=0.5, seed=1) as server:
+            summary = MultiprocessSync('SOME_TOKEN', processes=2, batch_size=5, transform=rename_id, use_async=False,
+                                       api_url=server.url).sync_file(self.path, partitions=4)
+
+        self.assertEqual(25, summary.sent + summary.failed)
+        self.assertGreater(summary.failed, 0)
+        self.assertEqual(4, len(summary.partitions))
@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+import uuid
+
+import requests
+from mock import Mock
+
+from crossengage.pipeline import PipelinedSync
+from crossengage.retry import NO_RETRY
+from crossengage.tracing import NoopTracer
+
+
+class FakeQueue(object):
+    """ batch_process_async / track_user_task of an API processing one batch after the other """
+
+    def __init__(self, processing_time=0.0, fail=(), error=None):
+        self.processing_time = processing_time
+        self.fail = fail
+        # raised instead of answering 500 for the failing batches
+        self.error = error
+        self.tracked = {}
+        self.done = set()
+        self.submitted = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._free = 0.0
+        self._lock = threading.Lock()
+
+    def batch_process_async(self, update_list=(), delete_list=()):
+        users = list(update_list) + list(delete_list)
+        if users[0]['id'] in self.fail:
+            if self.error is not None:
+                raise self.error
+            return 500, None
+        tracking_id = str(uuid.uuid4())
+        with self._lock:
+            started = max(time.time(), self._free)
+            self._free = started + self.processing_time
+            self.tracked[tracking_id] = (len(users), self._free)
+            self.submitted.append(users)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return 202, {'trackingId': tracking_id}
+
+    def track_user_task(self, tracking_id):
+        total, processed = self.tracked[tracking_id]
+        if time.time() < processed:
+            return 200, {'stage': 'PROCESSING', 'total': total, 'success': 0, 'error': 0}
+        with self._lock:
+            if tracking_id not in self.done:
+                self.done.add(tracking_id)
+                self.in_flight -= 1
+        return 200, {'stage': 'PROCESSED', 'total': total, 'success': total, 'error': 0}
+
+
+def users(count):
+    return [{'id': str(i)} for i in range(count)]
+
+
+def client_of(queue):
+    return Mock(tracer=NoopTracer(), batch_process_async=queue.batch_process_async,
+                track_user_task=queue.track_user_task)
+
+
+class TestPipelinedSync(unittest.TestCase):
+
+    def test_all_batches_processed(self):
+        queue = FakeQueue()
+        result = PipelinedSync(client_of(queue), batch_size=10, poll_interval=0.001).run(users(95))
+
+        self.assertEqual(10, result.submitted)
+        self.assertEqual(10, len(result.results.tracking))
+        self.assertEqual([], result.failed_ids)
+        self.assertEqual(95, sum(len(batch) for batch in queue.submitted))
+        self.assertTrue(all('PROCESSED' in stages for stages in result.stage_timings))
+
+    def test_delete(self):
+        client = Mock(tracer=NoopTracer())
+        client.batch_process_async.return_value = 202, {'trackingId': 't'}
+        client.track_user_task.return_value = 200, {'stage': 'PROCESSED', 'total': 2, 'success': 2, 'error': 0}
+        PipelinedSync(client, poll_interval=0.001).run(users(2), delete=True)
+
+        client.batch_process_async.assert_called_once_with(delete_list=users(2))
+
+    def test_batches_overlap_up_to_the_window(self):
+        queue = FakeQueue(processing_time=0.02)
+        result = PipelinedSync(client_of(queue), window=3, max_window=3, batch_size=1, poll_interval=0.001,
+                               latency_tolerance=None).run(users(8))
+
+        self.assertEqual(8, len(result.results.tracking))
+        self.assertEqual(3, queue.max_in_flight)
+        self.assertEqual(3, result.max_in_flight)
+
+    def test_failed_submission(self):
+        queue = FakeQueue(fail=('2',))
+        result = PipelinedSync(client_of(queue), batch_size=2, poll_interval=0.001, retry=NO_RETRY).run(users(6))
+
+        self.assertEqual(['2', '3'], result.failed_ids)
+        self.assertEqual(2, len(result.results.tracking))
+
+    def test_submission_raising(self):
+        queue = FakeQueue(fail=('2',), error=requests.ConnectionError('connection reset'))
+        result = PipelinedSync(client_of(queue), batch_size=2, poll_interval=0.001, retry=NO_RETRY).run(users(6))
+
+        self.assertEqual(['2', '3'], result.failed_ids)
+        self.assertEqual(2, len(result.results.tracking))
+
+    def test_timeout(self):
+        client = Mock(tracer=NoopTracer())
+        client.batch_process_async.return_value = 202, {'trackingId': 't'}
+        client.track_user_task.return_value = 200, {'stage': 'QUEUED'}
+        result = PipelinedSync(client, poll_interval=0.001, timeout=0.02).run(users(1))
+
+        self.assertEqual(['t'], result.timed_out)
+        self.assertEqual([], result.stage_timings)
+        self.assertEqual(0, len(result.results.tracking))
+
+    def test_window_shrinks_when_processing_falls_behind(self):
+        queue = FakeQueue(processing_time=0.01)
+        result = PipelinedSync(client_of(queue), window=8, max_window=8, batch_size=1,
+                               poll_interval=0.001).run(users(40))
+
+        # batches wait behind each other, the time to PROCESSED grows with the window
+        self.assertEqual(40, len(result.results.tracking))
+        self.assertLess(result.window, 8)
+
+    def test_transient_poll_error(self):
+        queue = FakeQueue()
+        polls = []
+
+        def track_user_task(tracking_id):
+            polls.append(tracking_id)
+            if len(polls) == 2:
+                raise requests.ConnectionError('connection reset')
+            return queue.track_user_task(tracking_id)
+
+        client = client_of(queue)
+        client.track_user_task = track_user_task
+        result = PipelinedSync(client, window=2, batch_size=1, poll_interval=0.001, retry=NO_RETRY).run(users(5))
+
+        self.assertEqual(5, len(result.results.tracking))
+        self.assertEqual(([], []), (result.failed_ids, result.timed_out))
+
+    def test_poll_error_times_out(self):
+        client = Mock(tracer=NoopTracer())
+        client.batch_process_async.return_value = 202, {'trackingId': 't'}
+        client.track_user_task.side_effect = requests.ConnectionError('refused')
+        sync = PipelinedSync(client, window=1, batch_size=1, poll_interval=0.001, timeout=0.01, retry=NO_RETRY)
+
+        result = sync.run(users(1))
+
+        self.assertEqual(['t'], result.timed_out)
+        self.assertEqual(0, len(result.results.tracking))
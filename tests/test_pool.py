@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+
+from mock import Mock
+from requests import codes
+
+from crossengage.pool import ClientPool, ThrottledSession
+from crossengage.scheduling import LOW, PriorityScheduler
+from crossengage.throttle import Quota
+
+
+class TestClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.response = Mock(status_code=codes.ok, text='{"success": true}')
+        self.response.json.return_value = {'success': True}
+        self.session = Mock()
+        for method in ('get', 'put', 'post', 'delete'):
+            getattr(self.session, method).return_value = self.response
+        self.pool = ClientPool(session=self.session, rate=100, max_concurrency=2)
+
+    def test_client_per_tenant(self):
+        de = self.pool.client('DE_TOKEN', business_unit='de')
+        at = self.pool.client('AT_TOKEN', business_unit='at')
+
+        self.assertIs(de, self.pool.client('DE_TOKEN', business_unit='de'))
+        self.assertIsNot(de, at)
+        self.assertEqual({('DE_TOKEN', 'de'), ('AT_TOKEN', 'at')}, set(self.pool.tenants()))
+
+    def test_shared_session_with_tenant_token(self):
+        self.pool.client('DE_TOKEN', 'de').update_user({'id': '1'})
+        self.pool.client('AT_TOKEN', 'at').get_user({'id': '2'})
+
+        (first,) = self.session.put.call_args_list
+        (second,) = self.session.get.call_args_list
+        self.assertEqual(('https://api.crossengage.io/users/1',), first[0])
+        self.assertEqual('DE_TOKEN', first[1]['headers']['X-XNG-AuthToken'])
+        self.assertEqual(('https://api.crossengage.io/users/2',), second[0])
+        self.assertEqual('AT_TOKEN', second[1]['headers']['X-XNG-AuthToken'])
+
+    def test_register_with_own_quota(self):
+        client = self.pool.register('DE_TOKEN', 'de', rate=5, max_concurrency=1)
+        default = self.pool.client('AT_TOKEN', 'at')
+
+        self.assertEqual(5, client.middleware[0].rate_limiter.rate)
+        self.assertEqual(100, default.middleware[0].rate_limiter.rate)
+
+    def test_quota_waits_without_a_scheduler_slot(self):
+        scheduler = PriorityScheduler(slots=2)
+        pool = ClientPool(session=self.session, scheduler=scheduler)
+        backfill = pool.register('DE_TOKEN', 'de', rate=1)
+        realtime = pool.client('AT_TOKEN', 'at')
+        stop = threading.Event()
+
+        def backfill_users():
+            with scheduler.lane(LOW):
+                while not stop.is_set():
+                    backfill.update_user({'id': '1'})
+
+        threads = [threading.Thread(target=backfill_users) for _ in range(2)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        # the backfill threads used up the burst and wait for their rate
+        time.sleep(0.1)
+
+        started = time.time()
+        realtime.update_user_opt_out_status('2', 'MAIL')
+        waited = time.time() - started
+        stop.set()
+
+        self.assertLess(waited, 0.2)
+
+    def test_default_session_is_pooled(self):
+        with ClientPool(pool_maxsize=20) as pool:
+            adapter = pool.session.get_adapter('https://api.crossengage.io/users')
+            self.assertEqual(20, adapter._pool_maxsize)
+
+
+class TestThrottledSession(unittest.TestCase):
+
+    def test_requests_within_quota(self):
+        barrier = threading.Event()
+        state = {'in_flight': 0, 'peak': 0}
+        lock = threading.Lock()
+
+        def request(method, url, **kwargs):
+            with lock:
+                state['in_flight'] += 1
+                state['peak'] = max(state['peak'], state['in_flight'])
+            barrier.wait(0.05)
+            with lock:
+                state['in_flight'] -= 1
+
+        session = Mock()
+        session.request.side_effect = request
+        throttled = ThrottledSession(session, Quota(max_concurrency=1))
+        threads = [threading.Thread(target=throttled.post, args=('url',), kwargs={'data': '{}'}) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        barrier.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, state['peak'])
+        self.assertEqual(3, session.request.call_count)
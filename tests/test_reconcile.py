@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+from mock import Mock
+
+from crossengage.reconcile import DELETE, INSERT, UNCHANGED, UPDATE, Reconciler, Snapshot, diff, record_hash
+from crossengage.tracing import NoopTracer
+
+
+class TestDiff(unittest.TestCase):
+
+    def test_record_hash_is_stable(self):
+        self.assertEqual(record_hash({'id': '1', 'email': 'a'}), record_hash({'email': 'a', 'id': '1'}))
+        self.assertNotEqual(record_hash({'id': '1', 'email': 'a'}), record_hash({'id': '1', 'email': 'b'}))
+
+    def test_diff(self):
+        users = [{'id': '1', 'v': 1}, {'id': '2', 'v': 2}, {'id': '4', 'v': 4}]
+        snapshot = [('2', record_hash({'id': '2', 'v': 2})), ('3', 'old3'), ('4', 'old4'), ('5', 'old5')]
+
+        changes = [(operation, user_id) for operation, user_id, _, _, _ in diff(users, snapshot)]
+
+        self.assertEqual([(INSERT, '1'), (UNCHANGED, '2'), (DELETE, '3'), (UPDATE, '4'), (DELETE, '5')], changes)
+
+    def test_diff_requires_sorted_users(self):
+        self.assertRaises(ValueError, list, diff([{'id': '2'}, {'id': '1'}], []))
+        self.assertRaises(ValueError, list, diff([{'id': '1'}, {'id': '1'}], []))
+        self.assertRaises(ValueError, list, diff([{'id': 10}, {'id': 9}], []))
+
+    def test_diff_integer_ids_in_numeric_order(self):
+        users = [{'id': 9}, {'id': 10}, {'id': 100}]
+        snapshot = [('9', record_hash({'id': 9})), ('20', 'old20'), ('100', 'old100')]
+
+        changes = [(operation, user_id) for operation, user_id, _, _, _ in diff(users, snapshot)]
+
+        self.assertEqual([(UNCHANGED, '9'), (INSERT, '10'), (DELETE, '20'), (UPDATE, '100')], changes)
+
+    def test_diff_string_ids_in_string_order(self):
+        changes = [(operation, user_id) for operation, user_id, _, _, _ in diff([{'id': '10'}, {'id': '9'}], [])]
+
+        self.assertEqual([(INSERT, '10'), (INSERT, '9')], changes)
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+        self.client = Mock(tracer=NoopTracer())
+        self.client.batch_process_async.return_value = (202, {'trackingId': 'tracking'})
+        self.reconciler = Reconciler(self.client, self.path, batch_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_first_sync_inserts_everything(self):
+        users = [{'id': str(i)} for i in range(3)]
+
+        result = self.reconciler.sync(users)
+
+        self.assertEqual((3, 0, 0, 0), (result.inserted, result.updated, result.deleted, result.failed))
+        self.assertEqual(['tracking', 'tracking'], result.tracking_ids)
+        self.assertEqual([((), {'delete_list': [], 'update_list': users[:2]}),
+                          ((), {'delete_list': [], 'update_list': users[2:]})],
+                         self.client.batch_process_async.call_args_list)
+        self.assertEqual([(u['id'], record_hash(u)) for u in users], list(Snapshot(self.path)))
+
+    def test_second_sync_sends_only_delta(self):
+        self.reconciler.sync([{'id': '1'}, {'id': '2'}, {'id': '3'}])
+        self.client.batch_process_async.reset_mock()
+
+        users = [{'id': '1'}, {'id': '2', 'email': 'new@example.com'}, {'id': '4'}]
+        self.assertEqual([(UPDATE, '2'), (DELETE, '3'), (INSERT, '4')], list(self.reconciler.plan(users)))
+
+        result = self.reconciler.sync(users)
+
+        self.assertEqual((1, 1, 1, 1), (result.inserted, result.updated, result.deleted, result.unchanged))
+        self.assertEqual([((), {'delete_list': [{'id': '3'}], 'update_list': [users[1]]}),
+                          ((), {'delete_list': [], 'update_list': [users[2]]})],
+                         self.client.batch_process_async.call_args_list)
+        self.assertEqual(['1', '2', '4'], [user_id for user_id, _ in Snapshot(self.path)])
+
+        self.client.batch_process_async.reset_mock()
+        self.assertEqual(0, self.reconciler.sync(users).changed)
+        self.assertFalse(self.client.batch_process_async.called)
+
+    def test_integer_ids(self):
+        self.reconciler.sync([{'id': i} for i in range(8, 12)])
+        self.assertEqual(['8', '9', '10', '11'], [user_id for user_id, _ in Snapshot(self.path)])
+        self.client.batch_process_async.reset_mock()
+
+        result = self.reconciler.sync([{'id': 9}, {'id': 10, 'v': 2}, {'id': 11}, {'id': 100}])
+
+        self.assertEqual((1, 1, 1, 2), (result.inserted, result.updated, result.deleted, result.unchanged))
+        self.assertEqual(['9', '10', '11', '100'], [user_id for user_id, _ in Snapshot(self.path)])
+
+    def test_rejected_batch_is_retried_next_sync(self):
+        self.reconciler.sync([{'id': '1'}, {'id': '2'}])
+        self.client.batch_process_async.return_value = (500, {})
+
+        result = self.reconciler.sync([{'id': '1', 'v': 2}, {'id': '3'}])
+
+        self.assertEqual(3, result.failed)
+        # old state kept: 1 with its old hash, 2 not deleted, 3 not inserted
+        self.assertEqual([('1', record_hash({'id': '1'})), ('2', record_hash({'id': '2'}))],
+                         list(Snapshot(self.path)))
+
+    def test_raising_batch_is_retried_next_sync(self):
+        self.client.batch_process_async.side_effect = [
+            (202, {'trackingId': 'tracking'}), requests.ConnectionError('connection reset'),
+            (202, {'trackingId': 'tracking'})]
+        users = [{'id': str(i)} for i in range(5)]
+
+        result = self.reconciler.sync(users)
+
+        self.assertEqual((3, 2), (result.inserted, result.failed))
+        self.assertEqual(['0', '1', '4'], [user_id for user_id, _ in Snapshot(self.path)])
+
+        self.client.batch_process_async.side_effect = None
+        self.assertEqual([(INSERT, '2'), (INSERT, '3')], list(self.reconciler.plan(users)))
+
+    def test_snapshot_untouched_on_error(self):
+        self.reconciler.sync([{'id': '1'}])
+
+        self.assertRaises(ValueError, self.reconciler.sync, [{'id': '2'}, {'id': '1'}])
+
+        self.assertEqual(['1'], [user_id for user_id, _ in Snapshot(self.path)])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
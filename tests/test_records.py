@@ -0,0 +1,90 @@
+import unittest
+
+from crossengage.records import BatchResults, TrackingOutcome, UserResult
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+BODY = {
+    'updated': [
+        {'id': '1', 'xngId': 'x1', 'success': True},
+        {'id': '2', 'xngId': 'x2', 'success': False,
+         'errors': [{'field': 'id', 'type': 'NOT_NULL'}, {'field': 'email', 'type': 'WRONG_FORMAT'}]},
+    ],
+    'deleted': [
+        {'id': '3', 'xngId': 'x3', 'success': False, 'errors': [{'field': 'email', 'type': 'WRONG_FORMAT'}]},
+    ],
+}
+
+
+class TestBatchResults(unittest.TestCase):
+
+    def test_add(self):
+        results = BatchResults()
+        results.add(BODY)
+
+        self.assertEqual([UserResult('1', 'x1', True), UserResult('2', 'x2', False, (
+            ('id', 'NOT_NULL'), ('email', 'WRONG_FORMAT')))], results.updated)
+        self.assertEqual(['2', '3'], results.failed_ids())
+        self.assertEqual({('email', 'WRONG_FORMAT'): 2, ('id', 'NOT_NULL'): 1}, dict(results.error_counts()))
+        self.assertEqual(BODY['updated'][1], results.updated[1].to_dict())
+
+    def test_failures_only(self):
+        results = BatchResults(failures_only=True)
+        results.add(BODY)
+        results.add(None)
+
+        self.assertEqual(['2'], [record.id for record in results.updated])
+        self.assertEqual((1, 2), (results.succeeded, results.failed))
+
+    def test_equal_errors_are_shared(self):
+        results = BatchResults()
+        results.add(BODY)
+        results.add(BODY)
+
+        self.assertIs(results.deleted[0].errors, results.deleted[1].errors)
+
+    def test_tracking(self):
+        results = BatchResults()
+        outcome = results.add_tracking('t1', {'stage': 'PROCESSED', 'total': 2, 'success': 1, 'error': 1})
+        results.add_tracking('t2', None)
+
+        self.assertEqual(('t1', 'PROCESSED', 2), (outcome.tracking_id, outcome.stage, outcome.total))
+        self.assertEqual({'succeeded': 0, 'failed': 0, 'tracked': 2, 'tracked_success': 1, 'tracked_error': 1},
+                         results.summary())
+
+    def test_records_have_no_dict(self):
+        self.assertFalse(hasattr(UserResult('1', 'x1', True), '__dict__'))
+        self.assertFalse(hasattr(TrackingOutcome('t1'), '__dict__'))
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc requires python 3')
+    def test_memory_per_user(self):
+        def allocated(build):
+            tracemalloc.start()
+            try:
+                kept = build()
+                size = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            del kept
+            return size
+
+        # ids are kept by both, allocate them outside of the measurement
+        ids = [(str(i), 'x%d' % i) for i in range(5000)]
+
+        def body(i):
+            return {'id': ids[i][0], 'xngId': ids[i][1], 'success': False,
+                    'errors': [{'field': 'email', 'type': 'WRONG_FORMAT'}]}
+
+        def as_dicts():
+            return [body(i) for i in range(5000)]
+
+        def as_records():
+            results = BatchResults()
+            for i in range(5000):
+                results.add({'updated': [body(i)]})
+            return results
+
+        self.assertGreater(allocated(as_dicts), 3 * allocated(as_records))
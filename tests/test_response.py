@@ -0,0 +1,116 @@
+import json
+import unittest
+
+from mock import Mock
+from requests import codes
+
+from crossengage.client import CrossengageClient
+from crossengage.response import BatchSummary, LazyBatchResponse, LazyResponse
+
+
+def make_response(status_code, body):
+    content = json.dumps(body).encode('utf-8') if body is not None else b''
+    response = Mock(status_code=status_code, content=content)
+    response.json.side_effect = lambda: json.loads(content.decode('utf-8'))
+    return response
+
+
+class TestLazyResponse(unittest.TestCase):
+
+    def test_client_values_do_not_decode(self):
+        response = make_response(codes.ok, {'id': '1'})
+        lazy = LazyResponse(response)
+        lazy['status_code'] = codes.ok
+
+        self.assertEqual(codes.ok, lazy['status_code'])
+        self.assertTrue('status_code' in lazy)
+        self.assertFalse(lazy.decoded)
+        self.assertFalse(response.json.called)
+
+    def test_decodes_on_access(self):
+        lazy = LazyResponse(make_response(codes.ok, {'id': '1', 'success': True}))
+        lazy['success'] = False
+
+        self.assertEqual('1', lazy['id'])
+        self.assertTrue(lazy.decoded)
+        self.assertEqual({'id': '1', 'success': False}, lazy)
+        self.assertEqual(2, len(lazy))
+        del lazy['id']
+        self.assertEqual({'success': False}, dict(lazy))
+
+    def test_empty_body_never_decoded(self):
+        response = make_response(codes.no_content, None)
+        lazy = LazyResponse(response)
+
+        self.assertEqual({}, lazy)
+        self.assertIsNone(lazy.get('trackingId'))
+        self.assertFalse(response.json.called)
+
+
+class TestLazyBatchResponse(unittest.TestCase):
+
+    def test_summary_without_failures_skips_decoding(self):
+        response = make_response(codes.ok, {
+            'updated': [{'id': '1', 'xngId': 'x1', 'success': True}],
+            'deleted': [{'id': '2', 'xngId': 'x2', 'success': True}],
+        })
+
+        self.assertEqual(BatchSummary(codes.ok, 2, []), LazyBatchResponse(response).summary())
+        self.assertFalse(response.json.called)
+
+    def test_summary_with_failures(self):
+        response = make_response(codes.bad_request, {
+            'updated': [{'id': '1', 'success': True}, {'id': '2', 'success': False, 'errors': []}],
+            'deleted': [{'id': '3', 'success': False}],
+        })
+
+        self.assertEqual(BatchSummary(codes.bad_request, 1, ['2', '3']), LazyBatchResponse(response).summary())
+
+
+class TestClientLazyResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.client = CrossengageClient(client_token='SOME_TOKEN', lazy_responses=True)
+        self.client.requests = Mock()
+
+    def test_create_request(self):
+        self.client.requests.put.return_value = make_response(codes.bad_request, {'success': True, 'errors': []})
+
+        response = self.client.update_user({'id': '1'})
+
+        self.assertFalse(response['success'])
+        self.assertEqual(codes.bad_request, response['status_code'])
+        self.assertFalse(response.decoded)
+        self.assertEqual({'success': False, 'errors': [], 'status_code': codes.bad_request}, response)
+
+    def test_accepted_without_body(self):
+        self.client.requests.delete.return_value = make_response(codes.no_content, None)
+
+        response = self.client.delete_user({'id': '1'})
+
+        self.assertEqual({'status_code': codes.no_content, 'success': False}, response)
+
+    def test_batch_process(self):
+        self.client.requests.post.return_value = make_response(codes.ok, {
+            'updated': [{'id': '1', 'success': True}], 'deleted': []})
+
+        status_code, body = self.client.batch_process(update_list=[{'id': '1'}])
+
+        self.assertEqual(BatchSummary(codes.ok, 1, []), body.summary())
+        self.assertEqual('1', body['updated'][0]['id'])
+
+    def test_body_not_json(self):
+        response = Mock(status_code=codes.bad_gateway, content=b'<html>Bad Gateway</html>',
+                        text='<html>Bad Gateway</html>')
+        response.json.side_effect = ValueError('No JSON object could be decoded')
+        self.client.requests.get.return_value = response
+        eager = CrossengageClient(client_token='SOME_TOKEN', session=self.client.requests)
+
+        lazy = self.client.get_user({'id': '1'})
+        expected = eager.get_user({'id': '1'})
+
+        self.assertIsNone(lazy.get('id'))
+        self.assertEqual(codes.bad_gateway, lazy['status_code'])
+        self.assertEqual((False, expected['errors']), (lazy['success'], lazy['errors']))
+        self.assertEqual({'success': False, 'errors': expected['errors'], 'status_code': codes.bad_gateway},
+                         dict(lazy))
@@ -0,0 +1,56 @@
+import unittest
+
+import mock
+from mock import Mock
+
+from crossengage.deadline import deadline
+from crossengage.retry import NO_RETRY, RetryPolicy, status_of
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_status_of(self):
+        self.assertEqual(200, status_of({'status_code': 200}))
+        self.assertEqual(0, status_of({'success': False}))
+        self.assertEqual(202, status_of((202, {'trackingId': 'x'})))
+
+    def test_delay_bounds(self):
+        policy = RetryPolicy(backoff=1, max_backoff=3)
+        for attempt in range(5):
+            self.assertLessEqual(policy.delay(attempt), min(3, 2 ** attempt))
+
+    @mock.patch('crossengage.retry.time.sleep')
+    def test_retries_until_success(self, sleep):
+        func = Mock(side_effect=[{'status_code': 429}, {'status_code': 0}, {'status_code': 200}])
+
+        response = RetryPolicy(max_retries=3).call(func, 'a', b=1)
+
+        self.assertEqual({'status_code': 200}, response)
+        self.assertEqual(3, func.call_count)
+        func.assert_called_with('a', b=1)
+        self.assertEqual(2, sleep.call_count)
+
+    @mock.patch('crossengage.retry.time.sleep')
+    def test_gives_up(self, sleep):
+        func = Mock(return_value=(503, None))
+
+        self.assertEqual((503, None), RetryPolicy(max_retries=2).call(func))
+        self.assertEqual(3, func.call_count)
+
+    def test_no_retry_on_client_errors(self):
+        func = Mock(return_value={'status_code': 400})
+
+        NO_RETRY.call(func)
+        RetryPolicy().call(func)
+
+        self.assertEqual(2, func.call_count)
+
+    @mock.patch('crossengage.retry.time.sleep')
+    def test_no_retry_past_the_deadline(self, sleep):
+        func = Mock(return_value={'status_code': 503})
+
+        with deadline(0.05):
+            RetryPolicy(max_retries=3, backoff=1.0, max_backoff=1.0).call(func)
+
+        self.assertEqual(1, func.call_count)
+        self.assertEqual(0, sleep.call_count)
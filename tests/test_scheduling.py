@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+
+from mock import Mock
+from requests import codes
+
+from crossengage.client import CrossengageClient
+from crossengage.deadline import DeadlineExceeded, deadline
+from crossengage.scheduling import HIGH, LOW, PriorityScheduler
+from crossengage.throttle import monotonic
+
+
+class TestPriorityScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.order = []
+        self.lock = threading.Lock()
+
+    def _enqueue(self, scheduler, lane, name):
+        def work():
+            with scheduler.slot(lane):
+                with self.lock:
+                    self.order.append(name)
+
+        waiting = scheduler.waiting(lane)
+        thread = threading.Thread(target=work)
+        thread.start()
+        while scheduler.waiting(lane) == waiting:
+            time.sleep(0.001)
+        return thread
+
+    def _run(self, scheduler, requests):
+        scheduler.acquire(HIGH)
+        threads = [self._enqueue(scheduler, lane, name) for lane, name in requests]
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+        return self.order
+
+    def test_invalid_slots(self):
+        self.assertRaises(ValueError, PriorityScheduler, 0)
+
+    def test_high_lane_first(self):
+        scheduler = PriorityScheduler(slots=1, high_weight=10)
+
+        order = self._run(scheduler, [(LOW, 'low1'), (LOW, 'low2'), (HIGH, 'high1'), (HIGH, 'high2')])
+
+        self.assertEqual(['high1', 'high2', 'low1', 'low2'], order)
+        self.assertEqual({HIGH: 3, LOW: 2}, scheduler.granted)
+        self.assertEqual(0, scheduler.in_use)
+
+    def test_weighted_sharing(self):
+        scheduler = PriorityScheduler(slots=1, high_weight=2)
+
+        order = self._run(scheduler, [(LOW, 'low1'), (LOW, 'low2')] + [(HIGH, 'high%d' % i) for i in range(1, 5)])
+
+        # the slot holder counts as the first high grant
+        self.assertEqual(['high1', 'low1', 'high2', 'high3', 'low2', 'high4'], order)
+
+    def test_starvation_protection(self):
+        scheduler = PriorityScheduler(slots=1, high_weight=100, max_low_wait=0.0)
+
+        order = self._run(scheduler, [(LOW, 'low1'), (HIGH, 'high1')])
+
+        self.assertEqual(['low1', 'high1'], order)
+
+    def test_forced_lane(self):
+        scheduler = PriorityScheduler(slots=1)
+        with scheduler.lane(LOW):
+            with scheduler.slot(HIGH):
+                pass
+
+        self.assertEqual({HIGH: 0, LOW: 1}, scheduler.granted)
+
+    def test_gives_up_waiting_at_the_deadline(self):
+        scheduler = PriorityScheduler(slots=1)
+        scheduler.acquire(HIGH)
+
+        started = time.time()
+        self.assertRaises(DeadlineExceeded, scheduler.acquire, LOW, monotonic() + 0.02)
+        self.assertLess(time.time() - started, 0.5)
+        self.assertEqual(({HIGH: 0, LOW: 1}, 0), (scheduler.expired, scheduler.waiting(LOW)))
+        scheduler.release()
+        with scheduler.slot(LOW, monotonic() + 1):
+            pass
+
+    def test_admission_from_estimated_wait(self):
+        scheduler = PriorityScheduler(slots=2)
+        scheduler.acquire(HIGH)
+        scheduler.release(held=0.5)
+        self.assertEqual(0.0, scheduler.estimated_wait(LOW))
+        scheduler.admit(LOW, monotonic() + 0.1)
+
+        scheduler.acquire(HIGH)
+        scheduler.acquire(HIGH)
+        self.assertEqual(0.25, scheduler.estimated_wait(HIGH))
+        with self.assertRaises(DeadlineExceeded) as raised:
+            scheduler.admit(HIGH, monotonic() + 0.1)
+        self.assertTrue(raised.exception.rejected)
+        scheduler.admit(HIGH, monotonic() + 1)
+        self.assertEqual({HIGH: 1, LOW: 0}, scheduler.rejected)
+
+
+class TestClientLanes(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = PriorityScheduler(slots=2)
+        self.client = CrossengageClient(client_token='SOME_TOKEN', scheduler=self.scheduler)
+        response = Mock(status_code=codes.ok, text='{}')
+        response.json.return_value = {}
+        self.client.requests = Mock()
+        for verb in ('get', 'put', 'post', 'delete'):
+            getattr(self.client.requests, verb).return_value = response
+
+    def test_single_user_calls_are_high(self):
+        self.client.update_user_opt_out_status('1', 'MAIL')
+        self.client.get_user({'id': '1'})
+
+        self.assertEqual({HIGH: 2, LOW: 0}, self.scheduler.granted)
+
+    def test_bulk_calls_are_low(self):
+        self.client.batch_process(update_list=[{'id': '1'}])
+        self.client.batch_process_async(update_list=[{'id': '1'}])
+        self.client.track_user_task('trackingId')
+        self.client.update_users_bulk([{'id': '1'}])
+
+        self.assertEqual({HIGH: 0, LOW: 4}, self.scheduler.granted)
+
+    def test_shed_before_dispatch(self):
+        for _ in range(2):
+            self.scheduler.acquire(HIGH)
+        self.scheduler.release(held=1.0)
+        self.scheduler.acquire(HIGH)
+
+        with deadline(0.1):
+            response = self.client.get_user({'id': '1'})
+            self.assertRaises(DeadlineExceeded, self.client.batch_process, update_list=[{'id': '1'}])
+
+        self.assertEqual(0, response['status_code'])
+        self.assertIn('deadline_exceeded', response['errors'])
+        self.assertEqual((0, 2), (self.client.shed.expired, self.client.shed.rejected))
+        self.assertFalse(self.client.requests.get.called)
+        self.assertFalse(self.client.requests.post.called)
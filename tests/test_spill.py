@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from crossengage.spill import SpillQueue, drain
+
+
+class TestSpillQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = SpillQueue(self.directory, max_memory_items=10, segment_items=4)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def segments(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_memory_below_watermark(self):
+        for i in range(10):
+            self.queue.put({'id': i})
+
+        self.assertEqual(10, len(self.queue))
+        self.assertEqual(0, self.queue.spilled)
+        self.assertEqual([], self.segments())
+
+    def test_spills_past_watermark(self):
+        for i in range(25):
+            self.queue.put({'id': i})
+
+        self.assertEqual(10, self.queue.in_memory)
+        self.assertEqual(15, self.queue.spilled)
+        self.assertEqual(4, len(self.segments()))
+
+    def test_fifo_across_memory_and_segments(self):
+        for i in range(25):
+            self.queue.put({'id': i})
+        received = []
+        while len(self.queue):
+            received.extend(item['id'] for item in self.queue.get(3))
+            self.assertLessEqual(self.queue.in_memory, 10)
+
+        self.assertEqual(list(range(25)), received)
+        self.assertEqual([], self.segments())
+
+    def test_puts_while_draining_stay_behind_spilled_items(self):
+        for i in range(12):
+            self.queue.put(i)
+        self.assertEqual(list(range(10)), self.queue.get(10))
+        self.queue.put(12)
+
+        self.assertEqual([10, 11, 12], self.queue.get(10))
+
+    def test_recovers_segments_after_restart(self):
+        for i in range(18):
+            self.queue.put(i)
+        self.queue.close()
+
+        with SpillQueue(self.directory, max_memory_items=10, segment_items=4) as queue:
+            self.assertEqual(8, len(queue))
+            queue.put(18)
+            self.assertEqual(list(range(10, 18)), queue.get(10))
+            self.assertEqual([18], queue.get(10))
+
+    def test_peeked_items_survive_restart(self):
+        for i in range(18):
+            self.queue.put(i)
+        self.assertEqual(list(range(10)), self.queue.get(10))
+
+        self.assertEqual(0, drain(self.queue, lambda batch: False, batch_size=10))
+        self.assertEqual(list(range(10, 18)), self.queue.peek(10))
+        self.queue.close()
+
+        queue = SpillQueue(self.directory, max_memory_items=10, segment_items=4)
+        self.assertEqual(8, len(queue))
+        outage = [True, False]
+        self.assertEqual(3, drain(queue, lambda batch: outage.pop(0), batch_size=3))
+        queue.close()
+
+        with SpillQueue(self.directory, max_memory_items=10, segment_items=4) as queue:
+            self.assertEqual(5, len(queue))
+            self.assertEqual(list(range(13, 18)), queue.get(10))
+        self.assertEqual([], self.segments())
+
+    def test_torn_line_skipped(self):
+        for i in range(12):
+            self.queue.put(i)
+        self.queue.close()
+        with open(os.path.join(self.directory, self.segments()[0]), 'a') as segment:
+            segment.write('{"id": ')
+
+        queue = SpillQueue(self.directory, max_memory_items=10, segment_items=4)
+        self.assertEqual([10, 11], queue.get(10))
+        self.assertEqual(0, len(queue))
+
+    def test_concurrent_producers(self):
+        def produce(offset):
+            for i in range(100):
+                self.queue.put(offset + i)
+        threads = [threading.Thread(target=produce, args=(offset,)) for offset in (0, 1000, 2000)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        items = self.queue.get(1000)
+        while len(self.queue):
+            items.extend(self.queue.get(1000))
+        self.assertEqual(300, len(items))
+        for offset in (0, 1000, 2000):
+            produced = [item for item in items if offset <= item < offset + 100]
+            self.assertEqual(list(range(offset, offset + 100)), produced)
+
+
+class TestDrain(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = SpillQueue(self.directory, max_memory_items=10, segment_items=5)
+        for i in range(30):
+            self.queue.put(i)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def test_drains_in_order(self):
+        batches = []
+
+        self.assertEqual(30, drain(self.queue, lambda batch: batches.append(batch) or True, batch_size=10))
+        self.assertEqual(list(range(30)), sum(batches, []))
+        self.assertEqual(0, len(self.queue))
+
+    def test_failed_batch_stays_queued(self):
+        outage = [False, True, False]
+
+        self.assertEqual(10, drain(self.queue, lambda batch: outage.pop(0) is False, batch_size=10))
+        self.assertEqual(20, len(self.queue))
+        self.assertEqual(list(range(10, 20)), self.queue.peek(10))
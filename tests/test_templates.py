@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from crossengage.client import CrossengageClient
+from crossengage.templates import Field, Template, events_body
+from crossengage.transport import InMemoryTransport
+
+ORDER = {'event': 'Order', 'properties': {'sku': Field('sku'), 'price': Field('price'), 'currency': 'EUR',
+                                          'tags': ['a', Field('tag')]}}
+
+
+def filled(document, values):
+    if isinstance(document, Field):
+        return values[document.name]
+    if isinstance(document, dict):
+        return dict((key, filled(value, values)) for key, value in document.items())
+    if isinstance(document, list):
+        return [filled(value, values) for value in document]
+    return document
+
+
+class TestTemplate(unittest.TestCase):
+
+    def test_render_same_as_json_dumps(self):
+        template = Template(ORDER)
+        for values in ({'sku': 'A1', 'price': 9.99, 'tag': 'new'},
+                       {'sku': u'Käse "gouda"\n', 'price': None, 'tag': True},
+                       {'sku': {'nested': [1, 2]}, 'price': 3, 'tag': ''}):
+            self.assertEqual(json.dumps(filled(ORDER, values)), template.render(**values))
+
+    def test_render_values(self):
+        template = Template(ORDER)
+
+        self.assertEqual(template.render(sku='A1', price=2, tag=False), template.render_values('A1', 2, False))
+        self.assertRaises(ValueError, template.render_values, 'A1')
+
+    def test_encode_values_as_json_dumps(self):
+        template = Template({'value': Field('value')})
+        for value in (1, -2.5, 1e100, float('nan'), float('inf'), True, False, None, u'\u00e9', [1, 'a'], 2 ** 70):
+            self.assertEqual(json.dumps({'value': value}), template.render(value=value))
+
+    def test_percent_in_constants(self):
+        template = Template({'text': '100% %s', 'value': Field('value')})
+        self.assertEqual(json.dumps({'text': '100% %s', 'value': 1}), template.render(value=1))
+
+    def test_fields(self):
+        self.assertEqual(('sku', 'price', 'tag'), Template(ORDER).fields)
+
+    def test_constant_template(self):
+        self.assertEqual('{"event": "Login"}', Template({'event': 'Login'}).render())
+
+    def test_missing_field(self):
+        self.assertRaises(KeyError, Template(ORDER).render, sku='A1')
+
+    def test_not_serializable(self):
+        self.assertRaises(TypeError, Template, {'event': object()})
+
+    def test_events_body_same_as_json_dumps(self):
+        events = [{'event': 'Order', 'properties': {'sku': str(i)}} for i in range(3)]
+        encoded = [json.dumps(event) for event in events]
+
+        self.assertEqual(json.dumps({'events': events, 'email': 'a@example.com', 'id': '1', 'businessUnit': 'de'}),
+                         events_body(encoded, email='a@example.com', user_id='1', business_unit='de'))
+        self.assertEqual(json.dumps({'events': [], 'id': '1'}), events_body([], user_id='1'))
+
+
+class TestSendEncodedEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = InMemoryTransport()
+        self.client = CrossengageClient(client_token='SOME_TOKEN', transport=self.transport)
+
+    def test_same_request_as_send_events(self):
+        template = Template({'event': 'Order', 'properties': {'sku': Field('sku')}})
+
+        response = self.client.send_encoded_events([template.render(sku='A1'), template.render(sku='B2')],
+                                                   user_id='1', business_unit='de')
+        self.client.send_events([{'event': 'Order', 'properties': {'sku': 'A1'}},
+                                 {'event': 'Order', 'properties': {'sku': 'B2'}}], user_id='1', business_unit='de')
+
+        self.assertEqual(200, response['status_code'])
+        encoded, plain = self.transport.sent
+        self.assertEqual(plain.body, encoded.body)
+        self.assertEqual(plain.url, encoded.url)
+        self.assertEqual(plain.headers, encoded.headers)
+        self.assertIsNone(encoded.payload)
+
+    def test_user_required(self):
+        self.assertRaises(ValueError, self.client.send_encoded_events, ['{"event": "Login"}'])
@@ -0,0 +1,167 @@
+import threading
+import time
+import unittest
+
+from crossengage.fanout import fan_out
+from crossengage.throttle import AdaptiveLimiter, Quota, RateLimiter, is_overload
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, RateLimiter, 0)
+
+    def test_burst_then_limited(self):
+        limiter = RateLimiter(rate=10, burst=2)
+
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+
+    def test_acquire_waits_for_refill(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        started = time.time()
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.time() - started, 0.035)
+
+
+class TestQuota(unittest.TestCase):
+
+    def test_unlimited(self):
+        with Quota() as quota:
+            self.assertIsNone(quota.rate_limiter)
+            self.assertIsNone(quota.semaphore)
+
+    def test_max_concurrency(self):
+        quota = Quota(max_concurrency=2)
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'peak': 0}
+
+        def work():
+            with quota:
+                with lock:
+                    state['in_flight'] += 1
+                    state['peak'] = max(state['peak'], state['in_flight'])
+                time.sleep(0.01)
+                with lock:
+                    state['in_flight'] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(2, state['peak'])
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def saturate(self, limiter, latency=0.01, overloaded=False):
+        """ One call released while every slot is taken """
+        for _ in range(limiter.limit):
+            limiter.acquire()
+        limiter.release(latency, overloaded)
+        for _ in range(limiter.in_flight):
+            limiter._in_flight -= 1
+
+    def test_additive_increase_when_saturated(self):
+        limiter = AdaptiveLimiter(initial_limit=2, latency_tolerance=None)
+        for _ in range(4):
+            self.saturate(limiter)
+
+        self.assertEqual(3, limiter.limit)
+
+    def test_no_increase_below_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=None)
+        for _ in range(20):
+            limiter.call(lambda: {'status_code': 200})
+
+        self.assertEqual(4, limiter.limit)
+        self.assertEqual(20, limiter.calls)
+
+    def test_multiplicative_decrease_once_per_round_trip(self):
+        changes = []
+        limiter = AdaptiveLimiter(initial_limit=16, latency_tolerance=None, on_change=changes.append)
+        for _ in range(5):
+            limiter.acquire()
+        for _ in range(5):
+            limiter.release(0.5, overloaded=True)
+
+        self.assertEqual(8, limiter.limit)
+        self.assertEqual(5, limiter.overloads)
+        self.assertEqual([8], changes)
+
+    def test_bounds(self):
+        limiter = AdaptiveLimiter(initial_limit=2, min_limit=2, max_limit=3, latency_tolerance=None)
+        limiter.release(1.0, overloaded=True)
+        self.assertEqual(2, limiter.limit)
+        for _ in range(20):
+            self.saturate(limiter)
+        self.assertEqual(3, limiter.limit)
+
+    def test_latency_increase_is_overload(self):
+        limiter = AdaptiveLimiter(initial_limit=8, latency_tolerance=2.0)
+        for _ in range(3):
+            limiter.release(0.01)
+        limiter._in_flight = 3
+        for _ in range(3):
+            limiter.release(1.0)
+
+        self.assertEqual(4, limiter.limit)
+
+    def test_exception_is_overload(self):
+        limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=None)
+
+        self.assertRaises(ValueError, limiter.call, lambda: int('x'))
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=1, latency_tolerance=None)
+        limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        thread.start()
+
+        self.assertFalse(acquired.wait(0.05))
+        limiter.release(0.01)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_is_overload(self):
+        self.assertTrue(is_overload({'status_code': 429}))
+        self.assertTrue(is_overload((503, {})))
+        self.assertTrue(is_overload({'success': False, 'errors': {}}))
+        self.assertFalse(is_overload({'status_code': 404}))
+        self.assertFalse(is_overload([{'status_code': 500}]))
+
+    def test_converges_near_capacity(self):
+        capacity = 8
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'peak': 0}
+
+        def service(item):
+            with lock:
+                state['in_flight'] += 1
+                state['peak'] = max(state['peak'], state['in_flight'])
+                rejected = state['in_flight'] > capacity
+            try:
+                if rejected:
+                    return {'status_code': 429}
+                time.sleep(0.005)
+                return {'status_code': 200}
+            finally:
+                with lock:
+                    state['in_flight'] -= 1
+
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=32, latency_tolerance=None)
+        results = [result for _, result in fan_out(service, range(800), concurrency=32, limiter=limiter)]
+
+        rejected = sum(1 for result in results if result['status_code'] == 429)
+        self.assertLess(rejected, 80)
+        self.assertGreaterEqual(limiter.limit, capacity // 2)
+        self.assertLessEqual(limiter.limit, capacity * 2)
+        self.assertLessEqual(state['peak'], 32)
@@ -0,0 +1,81 @@
+import json
+import unittest
+
+from mock import Mock
+from requests import codes
+
+from crossengage.client import CrossengageClient
+from crossengage.tracing import NOOP_SPAN, InMemoryTracer, NoopTracer
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = InMemoryTracer()
+        self.client = CrossengageClient(client_token='SOME_TOKEN', tracer=self.tracer)
+
+    def test_noop_tracer(self):
+        tracer = NoopTracer()
+        with tracer.start_span('foo', {'a': 1}) as span:
+            span.set_attribute('b', 2)
+
+        self.assertIs(NOOP_SPAN, span)
+        self.assertIs(NOOP_SPAN, tracer.current_span())
+
+    def test_nested_spans(self):
+        with self.tracer.start_span('parent') as parent:
+            with self.tracer.start_span('child', {'a': 1}) as child:
+                self.assertIs(child, self.tracer.current_span())
+
+        self.assertEqual(['child', 'parent'], [span.name for span in self.tracer.spans])
+        self.assertIs(parent, child.parent)
+        self.assertIsNone(parent.parent)
+        self.assertEqual({'a': 1}, child.attributes)
+        self.assertGreaterEqual(parent.duration, child.duration)
+
+    def test_span_records_error(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.start_span('failing'):
+                raise ValueError('boom')
+
+        self.assertEqual("ValueError('boom')", self.tracer.spans[0].attributes['error'])
+
+    def test_client_method_spans(self):
+        response = Mock(status_code=codes.ok, text='{"success": true}')
+        response.json.return_value = {'success': True}
+        requests = Mock()
+        requests.put.return_value = response
+        self.client.requests = requests
+
+        user = {'id': '1234', 'email': 'email@example.com'}
+        self.client.update_user(user)
+
+        self.assertEqual(
+            ['crossengage.encode', 'crossengage.http', 'crossengage.decode', 'crossengage.update_user'],
+            [span.name for span in self.tracer.spans]
+        )
+        method_span = self.tracer.find('crossengage.update_user')[0]
+        self.assertEqual({
+            'http.method': 'PUT',
+            'http.url': 'https://api.crossengage.io/users/1234',
+            'http.status_code': codes.ok,
+            'crossengage.api_version': '1',
+            'crossengage.payload_size': len(json.dumps(user)),
+        }, method_span.attributes)
+        for span in self.tracer.spans[:-1]:
+            self.assertIs(method_span, span.parent)
+
+    def test_client_get_has_no_encode_span(self):
+        response = Mock(status_code=codes.ok)
+        response.json.return_value = {'stage': 'PROCESSED'}
+        requests = Mock()
+        requests.get.return_value = response
+        self.client.requests = requests
+
+        self.client.track_user_task('trackingId')
+
+        self.assertEqual(
+            ['crossengage.http', 'crossengage.decode', 'crossengage.track_user_task'],
+            [span.name for span in self.tracer.spans]
+        )
+        self.assertEqual('2', self.tracer.spans[-1].attributes['crossengage.api_version'])
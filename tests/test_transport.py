@@ -0,0 +1,117 @@
+import json
+import unittest
+
+from mock import Mock
+
+from crossengage.client import CrossengageClient
+from crossengage.transport import InMemoryTransport, Request, RequestsTransport, default_handler
+
+
+class TestRequestsTransport(unittest.TestCase):
+
+    def test_send_get_without_data(self):
+        requests = Mock()
+        RequestsTransport(requests).send(Request('get', 'url', {'a': 'b'}))
+
+        requests.get.assert_called_once_with('url', headers={'a': 'b'}, timeout=30)
+
+    def test_send_body(self):
+        requests = Mock()
+        request = Request('post', 'url', {}, payload={'a': 1})
+        request.body = '{"a": 1}'
+        RequestsTransport(requests).send(request)
+
+        requests.post.assert_called_once_with('url', data='{"a": 1}', headers={}, timeout=30)
+
+
+class TestInMemoryTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = InMemoryTransport()
+        self.client = CrossengageClient(client_token='SOME_TOKEN', transport=self.transport)
+
+    def test_default_handler(self):
+        self.assertEqual({'id': '1', 'status_code': 200}, self.client.get_user({'id': '1'}))
+        self.assertEqual({'success': True, 'status_code': 200}, self.client.update_user({'id': '1'}))
+        self.assertEqual(204, self.client.delete_user({'id': '1'})['status_code'])
+        self.assertEqual(202, self.client.update_user_async({'id': '1'})['status_code'])
+
+        status_code, body = self.client.batch_process(update_list=[{'id': '1'}], delete_list=[{'id': '2'}])
+        self.assertEqual((200, {'updated': [{'id': '1', 'success': True}], 'deleted': [{'id': '2', 'success': True}]}),
+                         (status_code, body))
+
+        status_code, body = self.client.batch_process_async(update_list=[{'id': '1'}])
+        self.assertEqual(202, status_code)
+        self.assertEqual('PROCESSED', self.client.track_user_task(body['trackingId'])[1]['stage'])
+
+        self.assertEqual(['get', 'put', 'delete', 'put', 'post', 'post', 'get'],
+                         [request.method for request in self.transport.sent])
+
+    def test_custom_handler(self):
+        self.transport.handler = lambda request: (400, {'errors': [{'field': 'email'}]})
+
+        response = self.client.send_events([{'foo': 'bar'}], email='a@example.com')
+
+        self.assertEqual({'errors': [{'field': 'email'}], 'success': False, 'status_code': 400}, response)
+        self.assertEqual({'events': [{'foo': 'bar'}], 'email': 'a@example.com'},
+                         json.loads(self.transport.sent[0].body))
+
+    def test_handler_dict_not_mutated(self):
+        body = {'success': True}
+        self.transport.handler = lambda request: (200, body)
+
+        self.client.update_user({'id': '1'})
+
+        self.assertEqual({'success': True}, body)
+
+    def test_empty_body(self):
+        response = default_handler(Request('delete', 'https://api.crossengage.io/users/1', {}))
+
+        self.assertEqual((204, None), response)
+
+
+class TestMiddleware(unittest.TestCase):
+
+    def test_chain_order_and_payload_before_encoding(self):
+        calls = []
+
+        def outer(request, call_next):
+            calls.append(('outer', request.body))
+            request.headers = dict(request.headers, **{'X-Trace': '1'})
+            response = call_next(request)
+            calls.append(('outer done', response.status_code))
+            return response
+
+        def inner(request, call_next):
+            calls.append(('inner', request.payload))
+            return call_next(request)
+
+        transport = InMemoryTransport()
+        client = CrossengageClient(client_token='SOME_TOKEN', transport=transport, middleware=[outer, inner])
+        client.update_user({'id': '1'})
+
+        self.assertEqual([('outer', None), ('inner', {'id': '1'}), ('outer done', 200)], calls)
+        self.assertEqual('1', transport.sent[0].headers['X-Trace'])
+        self.assertEqual('{"id": "1"}', transport.sent[0].body)
+
+    def test_short_circuit(self):
+        transport = InMemoryTransport()
+        cached = Mock(status_code=200, text='{"id": "cached"}')
+        cached.json.return_value = {'id': 'cached'}
+
+        client = CrossengageClient(client_token='SOME_TOKEN', transport=transport,
+                                   middleware=[lambda request, call_next: cached])
+
+        self.assertEqual({'id': 'cached', 'status_code': 200}, client.get_user({'id': '1'}))
+        self.assertEqual([], transport.sent)
+
+    def test_pre_encoded_body_is_kept(self):
+        def encode(request, call_next):
+            request.body = '{"pre": "encoded"}'
+            return call_next(request)
+
+        transport = InMemoryTransport()
+        client = CrossengageClient(client_token='SOME_TOKEN', transport=transport, middleware=[encode])
+        client.update_user({'id': '1'})
+
+        self.assertEqual('{"pre": "encoded"}', transport.sent[0].body)
@@ -1,6 +1,6 @@
 import unittest
 
-from crossengage.utils import update_dict
+from crossengage.utils import redact_headers, truncate, update_dict
 
 
 class TestUtils(unittest.TestCase):
@@ -12,3 +12,17 @@ class TestUtils(unittest.TestCase):
 
         self.assertEqual(dict(a=1, b=2), old_dict)
         self.assertEqual(dict(a=2, b=3, c=4), new_dict)
+
+    def test_redact_headers(self):
+        headers = {'x-xng-authtoken': 'SECRET', 'Content-Type': 'application/json'}
+
+        redacted = redact_headers(headers, ['X-XNG-AuthToken'])
+
+        self.assertEqual({'x-xng-authtoken': '***', 'Content-Type': 'application/json'}, redacted)
+        self.assertEqual('SECRET', headers['x-xng-authtoken'])
+
+    def test_truncate(self):
+        self.assertIsNone(truncate(None, 3))
+        self.assertEqual('abc', truncate('abc', 3))
+        self.assertEqual('abc...<2 more>', truncate('abcde', 3))
+        self.assertEqual('abc...<2 more>', truncate(b'abcde', 3))
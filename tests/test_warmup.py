@@ -0,0 +1,145 @@
+import shutil
+import socket
+import tempfile
+import unittest
+from subprocess import CalledProcessError
+
+import requests
+from mock import Mock, patch
+
+from benchmarks.stub_server import StubServer, make_certificate
+from crossengage.client import CrossengageClient
+from crossengage.pool import ThrottledSession
+from crossengage.warmup import CachingResolver, ResumingSSLContext, WarmHTTPAdapter, warm_session, warm_up
+
+
+class TestCachingResolver(unittest.TestCase):
+
+    @patch('crossengage.warmup.monotonic')
+    @patch('crossengage.warmup.socket.getaddrinfo')
+    def test_cached_until_ttl(self, getaddrinfo, monotonic):
+        getaddrinfo.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 443))]
+        resolver = CachingResolver(ttl=60)
+
+        monotonic.return_value = 100
+        self.assertEqual('10.0.0.1', resolver.resolve('api.crossengage.io', 443))
+        monotonic.return_value = 159
+        self.assertEqual('10.0.0.1', resolver.resolve('api.crossengage.io', 443))
+        self.assertEqual(1, getaddrinfo.call_count)
+
+        monotonic.return_value = 161
+        resolver.resolve('api.crossengage.io', 443)
+        self.assertEqual(2, getaddrinfo.call_count)
+
+    @patch('crossengage.warmup.socket.getaddrinfo')
+    def test_clear(self, getaddrinfo):
+        getaddrinfo.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 443))]
+        resolver = CachingResolver()
+        resolver.resolve('api.crossengage.io', 443)
+        resolver.clear()
+        resolver.resolve('api.crossengage.io', 443)
+        self.assertEqual(2, getaddrinfo.call_count)
+
+
+class TestWarmSession(unittest.TestCase):
+
+    def test_adapter_mounted(self):
+        session = warm_session(pool_maxsize=4)
+        adapter = session.get_adapter('https://api.crossengage.io/users')
+
+        self.assertIsInstance(adapter, WarmHTTPAdapter)
+        self.assertIs(adapter, session.get_adapter('http://localhost'))
+        self.assertIsInstance(adapter.ssl_context, ResumingSSLContext)
+
+    def test_warm_up_connections_reused(self):
+        with StubServer() as server:
+            session = warm_session()
+            self.assertEqual(3, warm_up(session, server.url + '/', 3))
+            self.assertEqual(3, server.connections)
+
+            for _ in range(3):
+                self.assertEqual(200, session.get(server.url + '/users/1').status_code)
+            self.assertEqual(3, server.connections)
+
+    @patch('crossengage.warmup.HAS_TLS_SESSIONS', False)
+    def test_plain_session_without_tls_sessions(self):
+        session = warm_session(pool_maxsize=4)
+        adapter = session.get_adapter('https://api.crossengage.io/users')
+
+        self.assertNotIsInstance(adapter, WarmHTTPAdapter)
+        self.assertEqual(4, adapter._pool_maxsize)
+        with StubServer() as server:
+            client = CrossengageClient(client_token='SOME_TOKEN')
+            client.API_URL = server.url
+            self.assertEqual(2, client.warmup(n_connections=2))
+            self.assertEqual(2, server.connections)
+
+    def test_remember_without_tls_sessions(self):
+        context = ResumingSSLContext()
+        # a python 2.7 / 3.5 SSLSocket, without session and session_reused
+        context.remember(Mock(spec=['server_hostname'], server_hostname='api.crossengage.io'))
+
+        self.assertEqual({}, context._sessions)
+
+    def test_warm_up_refused(self):
+        with StubServer() as server:
+            url = server.url
+        self.assertEqual(0, warm_up(warm_session(), url + '/', 2))
+
+
+class TestWarmSessionTls(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        try:
+            certfile = make_certificate(self.directory)
+        except (OSError, CalledProcessError):
+            self.skipTest('openssl not available')
+        self.server = StubServer(certfile=certfile).start()
+        self.session = warm_session()
+        self.session.trust_env = False
+        self.session.verify = certfile
+
+    def tearDown(self):
+        self.session.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_warm_connections_reused(self):
+        self.assertEqual(2, warm_up(self.session, self.server.url + '/', 2))
+
+        for _ in range(4):
+            self.assertEqual(200, self.session.get(self.server.url + '/users/1').status_code)
+        self.assertEqual(2, self.server.connections)
+
+    def test_session_resumed(self):
+        warm_up(self.session, self.server.url + '/', 1)
+        warm_up(self.session, self.server.url + '/', 2)
+
+        self.assertEqual(3, self.server.connections)
+        self.assertGreaterEqual(self.session.get_adapter(self.server.url).ssl_context.resumed, 1)
+
+
+class TestClientWarmup(unittest.TestCase):
+
+    def test_switches_to_warm_session(self):
+        with StubServer() as server:
+            client = CrossengageClient(client_token='SOME_TOKEN')
+            client.API_URL = server.url
+
+            self.assertEqual(2, client.warmup(n_connections=2))
+            self.assertIsInstance(client.requests, requests.Session)
+            self.assertEqual(200, client.get_user({'id': '1'})['status_code'])
+            self.assertEqual(2, server.connections)
+
+    def test_throttled_session(self):
+        session = ThrottledSession(requests.Session(), Mock())
+        client = CrossengageClient(client_token='SOME_TOKEN', session=session)
+        with patch('crossengage.warmup.warm_up', return_value=2) as warm:
+            self.assertEqual(2, client.warmup(n_connections=2))
+        warm.assert_called_once_with(session.session, client.API_URL + '/', 2)
+        self.assertIs(session, client.requests)
+
+    def test_not_a_requests_session(self):
+        client = CrossengageClient(client_token='SOME_TOKEN', session=Mock())
+        self.assertEqual(0, client.warmup())